@@ -6,9 +6,22 @@ from . import template
 from . import latex
 from . import layers_txt
 from . import notes_img
+from . import build_manifest
+from . import build_cache
+from . import job_history
+from . import cache_server
+from . import composite
+from . import executor
+from . import scheduler
+from . import profiling
+from . import file_watch
+from . import benchmark
+from . import proxies
+from . import build_graph
 
 import os
 import shutil
+import time
 import warnings
 import multiprocessing
 
@@ -35,7 +48,24 @@ def add_slide(work_dir, slide_name, slide_format=None):
         template.init_slide_dir(path=slide_dir, slide_format=slide_format)
 
 
-def compile(work_dir, out_path=None, pool=None, verbose=True, notes=False):
+def compile(
+    work_dir,
+    out_path=None,
+    pool=None,
+    verbose=True,
+    notes=False,
+    inkscape_shell=False,
+    composite_layers=False,
+    strip_hidden_layers=False,
+    proxy_images=False,
+    todo=None,
+    manifest=None,
+    cache=None,
+    profile_path=None,
+    limits=None,
+    memory_budget_bytes=None,
+    dry_run=False,
+):
     """
     pdf
         resources
@@ -45,191 +75,109 @@ def compile(work_dir, out_path=None, pool=None, verbose=True, notes=False):
                 layers_to_be_shown
             slide_B
                 ...
+
+    Runs the jobs which make the pdf as a graph, see scheduler.run(). Only
+    the jobs whose inputs changed since the build manifest in '.build/' are
+    run.
+
+    Parameters
+    ----------
+    pool : optional
+        Runs the jobs, see executor.init(). Default is a new Executor.
+    notes : bool
+        Also make the pdf of the notes.
+    inkscape_shell : bool
+        Render with a long living 'inkscape --shell' in each worker.
+    composite_layers : bool
+        Render each layer once and alpha composite the layer sets.
+    strip_hidden_layers : bool
+        Leave the hidden layers out of the SVG of a layer set.
+    proxy_images : bool
+        Link proxies of rasters scaled to the size they are drawn at.
+    todo, manifest : optional
+        The parsed slides and the build manifest kept between builds.
+    cache : dict, optional
+        Take outputs made before from the same inputs, see build_cache.
+    profile_path : str, optional
+        Write a Chrome trace of the build, see profiling.
+    limits : dict, optional
+        The max number of jobs per tool, e.g. {"inkscape": 4}.
+    memory_budget_bytes : int, optional
+        The max estimated peak memory of the running jobs.
+    dry_run : bool
+        Make nothing and return the prediction, see scheduler.predict().
     """
+    options = dict(locals())
+    if profile_path is not None:
+        with profiling.record() as events:
+            try:
+                with profiling.span(name="compile", cat="stage"):
+                    return _call_again(compile, options, profile_path=None)
+            finally:
+                profiling.write_chrome_trace(path=profile_path, events=events)
+                if verbose:
+                    _print_profile_summary(events)
+
+    if pool is None:
+        with executor.use(pool=None, inkscape_shell=inkscape_shell) as pool:
+            return _call_again(compile, options, pool=pool)
+
     if out_path is None:
         out_path = os.path.join(work_dir, "slides.pdf")
 
-    pool = utils.init_multiprocessing_pool_if_None(pool=pool)
-    todo = utils.init_todo(work_dir=work_dir)
+    todo = utils.init_todo_if_None(todo=todo, work_dir=work_dir)
 
     build_dir = os.path.join(work_dir, ".build")
-    os.makedirs(build_dir, exist_ok=True)
-
-    # latex snippets and slides
-    # -------------------------
-    update_latex_slides_and_snippets(
-        work_dir=work_dir, todo=todo, pool=pool, verbose=verbose
-    )
-
-    # resources
-    # ---------
-    resource_updates = {}
-    resource_updates["resources"] = utils.copytree_lazy(
-        src=os.path.join(work_dir, "resources"),
-        dst=os.path.join(build_dir, "resources"),
+    if not dry_run:
+        os.makedirs(build_dir, exist_ok=True)
+
+    manifest_path = build_manifest.path_of_build_dir(build_dir)
+    if manifest is None:
+        manifest = build_manifest.read(manifest_path)
+    history_path = job_history.path_of_build_dir(build_dir)
+    history = job_history.read(history_path)
+    nodes = build_graph.make_nodes(
+        work_dir=work_dir,
+        todo=todo,
+        manifest=manifest,
         verbose=verbose,
+        notes=notes,
+        inkscape_shell=inkscape_shell,
+        composite_layers=composite_layers,
+        strip_hidden_layers=strip_hidden_layers,
+        proxy_images=proxy_images,
+        cache=cache,
     )
-
-    # make slide dirs
-    # ---------------
-    for i in range(len(todo)):
-        slide = todo[i]["slide"]
-        slide_dir = os.path.join(build_dir, "slides", slide)
-        os.makedirs(slide_dir, exist_ok=True)
-
-    resource_updates["slides"] = {}
-    for i in range(len(todo)):
-        slide = todo[i]["slide"]
-
-        resource_updates["slides"][slide] = utils.copytree_lazy(
-            src=os.path.join(work_dir, "slides", slide, "resources"),
-            dst=os.path.join(build_dir, "slides", slide, "resources"),
-            verbose=verbose,
-        )
-
-    # svg roll out
-    # ------------
-    svg_roll_out_jobs = []
-    slides_all_layers = {}
-    for i in range(len(todo)):
-        slide = todo[i]["slide"]
-        show_layer_sets = todo[i]["show_layer_sets"]
-        slide_dir = os.path.join(work_dir, "slides", slide)
-
-        src_path = os.path.join(slide_dir, "layers.svg")
-        src_mtime = utils.mtime(src_path)
-
-        for show_layer_set in show_layer_sets:
-            show_label_str = str.join(",", list(show_layer_set))
-
-            dst_path = os.path.join(
-                build_dir, "slides", slide, show_label_str + ".svg"
-            )
-
-            need_to_roll_out = False
-            if not os.path.exists(dst_path):
-                reason = "does not exist yet"
-                need_to_roll_out = True
-            else:
-                dst_mtime = utils.mtime(dst_path)
-                if src_mtime > dst_mtime:
-                    reason = "needs update"
-                    need_to_roll_out = True
-
-            if need_to_roll_out:
-                if slide not in slides_all_layers:
-                    slides_all_layers[
-                        slide
-                    ] = inkscape.find_inkscape_labels_for_layers_in_inkscape_svg(
-                        path=src_path
-                    )
-
-                job = {
-                    "src_svg_path": src_path,
-                    "dst_svg_path": dst_path,
-                    "all_layer_set": slides_all_layers[slide],
-                    "show_layer_set": show_layer_set,
-                }
-                svg_roll_out_jobs.append(job)
-                if verbose:
-                    print(f"roll out: {dst_path:s} because {reason:s}.")
-
-    pool.map(run_svg_roll_out_job, svg_roll_out_jobs)
-
-    # png render
-    # ----------
-    slide_rendering_need_update = {}
-    for slide in resource_updates["slides"]:
-        if resource_updates["resources"]:
-            slide_rendering_need_update[slide] = True
-        else:
-            slide_rendering_need_update[slide] = resource_updates["slides"][
-                slide
-            ]
-
-    render_jobs = []
-    list_of_image_paths = []
-    for i in range(len(todo)):
-        slide = todo[i]["slide"]
-        show_layer_sets = todo[i]["show_layer_sets"]
-
-        for show_layer_set in show_layer_sets:
-            show_label_str = str.join(",", list(show_layer_set))
-
-            src_path = os.path.join(
-                build_dir, "slides", slide, show_label_str + ".svg"
-            )
-            dst_path = os.path.join(
-                build_dir, "slides", slide, show_label_str + ".jpg"
-            )
-
-            list_of_image_paths.append(dst_path)
-
-            need_to_render = False
-
-            if slide_rendering_need_update[slide]:
-                need_to_render = True
-                reason = "resources updated"
-
-            if not os.path.exists(dst_path):
-                reason = "does not exist yet"
-                need_to_render = True
-            else:
-                src_mtime = utils.mtime(src_path)
-                dst_mtime = utils.mtime(dst_path)
-                if src_mtime > dst_mtime:
-                    reason = "needs update"
-                    need_to_render = True
-
-            if need_to_render:
-                job = {}
-                job["src_svg_path"] = src_path
-                job["dst_jpg_path"] = dst_path
-                job["background_opacity"] = 0.0
-                render_jobs.append(job)
-                if verbose:
-                    print(f"render: {dst_path:s} because {reason:s}.")
-
-    num_render_updates = len(render_jobs)
-
-    pool.map(run_png_render_job, render_jobs)
-
-    # write pdf
-    # ---------
-    need_to_render_pdf = False
     pdf_path = os.path.join(build_dir, "slides.pdf")
 
-    if not os.path.exists(pdf_path):
-        reason = "does not exist yet"
-        need_to_render_pdf = True
-    else:
-        if num_render_updates > 0:
-            reason = "needs update"
-            need_to_render_pdf = True
-
-    if need_to_render_pdf:
-        if verbose:
-            print(f"compile pdf because {reason:s}.")
-        portable_document_format.images_to_pdf(
-            list_of_image_paths=list_of_image_paths, out_path=pdf_path
-        )
-
-    # notes
-    # -----
-    if notes:
-        _render_notes(work_dir=work_dir, todo=todo, pool=pool, verbose=verbose)
-
-        need_to_render_notes_pdf = False
-        notes_pdf_path = os.path.join(build_dir, "slides.notes.pdf")
-        list_of_slides_with_notes_paths = []
-        for p_slide in list_of_image_paths:
-            p_slide_woext, _ = os.path.splitext(p_slide)
-            p_slide_with_notes = p_slide_woext + ".sn.jpg"
-            list_of_slides_with_notes_paths.append(p_slide_with_notes)
-        portable_document_format.images_to_pdf(
-            list_of_image_paths=list_of_slides_with_notes_paths,
-            out_path=notes_pdf_path,
+    if dry_run:
+        num_workers = executor.num_workers(pool)
+        prediction = scheduler.predict(
+            nodes=nodes,
+            num_workers=num_workers,
+            history=history,
+            limits=limits,
         )
+        if verbose:
+            _print_prediction(prediction, num_workers=num_workers)
+        return prediction
+
+    try:
+        with profiling.span(name="run jobs", cat="stage"):
+            scheduler.run(
+                nodes=nodes,
+                pool=pool,
+                limits=limits,
+                memory_budget_bytes=memory_budget_bytes,
+                history=history,
+            )
+    finally:
+        with profiling.span(name="write manifest", cat="stage"):
+            build_manifest.write(manifest_path, manifest)
+            job_history.write(history_path, history)
+        if cache is not None:
+            with profiling.span(name="evict cache", cat="stage"):
+                build_cache.evict(cache)
 
     if out_path is not None:
         shutil.copy(src=pdf_path, dst=out_path + ".part")
@@ -245,212 +193,189 @@ def compile(work_dir, out_path=None, pool=None, verbose=True, notes=False):
     return True
 
 
-def run_svg_roll_out_job(job):
-    roll_out_slide_layers(**job)
+def _print_profile_summary(events):
+    summary = profiling.summarize(events)
+    print(f"{'category':<20s} {'num':>6s} {'wall/s':>10s} {'cpu/s':>10s}")
+    for cat in sorted(summary, key=lambda c: -summary[c]["wall_s"]):
+        s = summary[cat]
+        print(
+            f"{cat:<20s} {s['num']:6d} "
+            f"{s['wall_s']:10.3f} {s['cpu_s']:10.3f}"
+        )
 
 
-def roll_out_slide_layers(
-    src_svg_path, show_layer_set, all_layer_set, dst_svg_path
-):
-    show_layer_set = set(show_layer_set)
-    all_layer_set = set(all_layer_set)
-
-    hide_layer_set = all_layer_set.difference(show_layer_set)
-    show_label_str = str.join(",", list(show_layer_set))
-    inkscape.inkscape_svg_export_layers(
-        src=src_svg_path,
-        dst=dst_svg_path,
-        show=show_layer_set,
-        hide=hide_layer_set,
+def _print_prediction(prediction, num_workers):
+    print(f"{'start/s':>10s} {'wall/s':>10s} {'tool':<10s} job")
+    for job in prediction["jobs"]:
+        tool = "" if job["tool"] is None else job["tool"]
+        print(
+            f"{job['start_s']:10.3f} {job['wall_s']:10.3f} "
+            f"{tool:<10s} {job['key']:s}"
+        )
+    print(
+        f"{len(prediction['jobs']):d} jobs in about "
+        f"{prediction['wall_s']:.1f}s with {num_workers:d} workers."
     )
 
 
-def run_png_render_job(job):
-    inkscape.inkscape_render(
-        svg_path=job["src_svg_path"],
-        out_path=job["dst_jpg_path"],
-        background_opacity=job["background_opacity"],
+def watch(
+    work_dir,
+    out_path=None,
+    pool=None,
+    verbose=True,
+    notes=False,
+    inkscape_shell=False,
+    composite_layers=False,
+    strip_hidden_layers=False,
+    proxy_images=False,
+    poll_interval=0.25,
+    debounce=0.3,
+    max_num_builds=None,
+    cache=None,
+    limits=None,
+    memory_budget_bytes=None,
+):
+    """
+    Compiles the presentation in `work_dir` and compiles it again each time
+    one of its files changed until interrupted. See compile().
+
+    The `pool`, and with `inkscape_shell` the inkscapes in the pool, stay
+    alive between the builds. So do the build manifest and the parsed
+    slides.txt and layers.txt which are only read again when they changed.
+    Only the jobs whose inputs changed are run. The pdf is published
+    atomically.
+
+    The work dir is polled every `poll_interval` seconds. A build starts
+    once nothing changed for `debounce` seconds. A build which fails is
+    reported and the watch goes on. The images which the build renders from
+    latex into the resource dirs do not count as changes.
+    """
+    options = dict(locals())
+    compile_options = {
+        key: options[key]
+        for key in options
+        if key not in ["poll_interval", "debounce", "max_num_builds"]
+    }
+    if out_path is None:
+        out_path = os.path.join(work_dir, "slides.pdf")
+    out_path_wo_ext, ext = os.path.splitext(out_path)
+    ignore_paths = [out_path, out_path_wo_ext + ".notes" + ext]
+
+    if pool is None:
+        with executor.use(pool=None, inkscape_shell=inkscape_shell) as pool:
+            return _call_again(watch, options, pool=pool)
+
+    manifest = build_manifest.read(
+        build_manifest.path_of_build_dir(os.path.join(work_dir, ".build"))
     )
+    todo = None
+    before = file_watch.snapshot(work_dir=work_dir, ignore_paths=ignore_paths)
+    num_builds = 0
+
+    try:
+        while True:
+            start = time.monotonic()
+            try:
+                if todo is None:
+                    todo = utils.init_todo(work_dir=work_dir)
+                _call_again(
+                    compile,
+                    compile_options,
+                    out_path=out_path,
+                    pool=pool,
+                    todo=todo,
+                    manifest=manifest,
+                )
+                print(
+                    f"watch: {out_path:s} "
+                    f"in {time.monotonic() - start:.2f}s."
+                )
+            except Exception as err:
+                print(f"watch: build failed: {err!r}")
+
+            num_builds += 1
+            if max_num_builds is not None and num_builds >= max_num_builds:
+                return True
+
+            latex_outputs = build_graph.latex_outputs(
+                work_dir=work_dir, todo=[] if todo is None else todo
+            )
+            before = file_watch.without(
+                before, work_dir=work_dir, ignore_paths=latex_outputs
+            )
+            before, changed = file_watch.wait_for_changes(
+                work_dir=work_dir,
+                before=before,
+                ignore_paths=ignore_paths + latex_outputs,
+                poll_interval=poll_interval,
+                debounce=debounce,
+            )
+            if verbose:
+                print(f"watch: changed {str.join(', ', changed):s}.")
+            if file_watch.changes_todo(changed):
+                todo = None
+    except KeyboardInterrupt:
+        return True
 
 
 def _render_notes(work_dir, todo=None, pool=None, verbose=True):
-    pool = utils.init_multiprocessing_pool_if_None(pool=pool)
+    if pool is None:
+        with executor.use(pool=None) as pool:
+            return _render_notes(
+                work_dir=work_dir, todo=todo, pool=pool, verbose=verbose
+            )
     todo = utils.init_todo_if_None(todo=todo, work_dir=work_dir)
 
     build_dir = os.path.join(work_dir, ".build")
+    manifest_path = build_manifest.path_of_build_dir(build_dir)
+    manifest = build_manifest.read(manifest_path)
 
-    jobs = []
-    for i in range(len(todo)):
-        slide = todo[i]
-        slide_key = slide["slide"]
-        slide_dir = os.path.join(build_dir, "slides", slide_key)
-        for layers_key in slide["notes"]:
-            mem_basename = layers_key + ".notes"
-            mem_path = os.path.join(slide_dir, mem_basename)
-            cur_notes = slide["notes"][layers_key]
-
-            need_to_render_note = False
-
-            if os.path.exists(mem_path):
-                mem_notes = utils.read_lines_from_textfile(mem_path)
-                if mem_notes != cur_notes:
-                    if verbose:
-                        print(f"update notes {slide_key:s}/{layers_key:s}")
-                    utils.write_lines_to_textfile(
-                        path=mem_path, lines=cur_notes
-                    )
-                    need_to_render_note = True
-            else:
-                if verbose:
-                    print(f"init notes {slide_key:s}/{layers_key:s}")
-                utils.write_lines_to_textfile(path=mem_path, lines=cur_notes)
-                need_to_render_note = True
-
-            slide_with_notes_path = os.path.join(
-                slide_dir, layers_key + ".sn.jpg"
-            )
-            if not os.path.exists(slide_with_notes_path):
-                if verbose:
-                    print(f"render notes {slide_key:s}/{layers_key:s}")
-                need_to_render_note = True
-            else:
-                slide_path = os.path.join(slide_dir, layers_key + ".jpg")
-                slide_mtime = utils.mtime(slide_path)
-                slide_with_notes_mtime = utils.mtime(slide_with_notes_path)
-                if slide_mtime > slide_with_notes_mtime:
-                    if verbose:
-                        print(
-                            "update notes because slide got updated "
-                            f"{slide_key:s}/{layers_key:s}"
-                        )
-                    need_to_render_note = True
-
-            if need_to_render_note:
-                jobs.append(
-                    {
-                        "work_dir": work_dir,
-                        "slide_key": slide_key,
-                        "layers_key": layers_key,
-                    }
-                )
-
-    pool.map(_run_job_render_note, jobs)
+    nodes = build_graph.make_notes_nodes(
+        work_dir=work_dir, todo=todo, manifest=manifest, verbose=verbose
+    )
+    try:
+        scheduler.run(nodes=nodes, pool=pool)
+    finally:
+        build_manifest.write(manifest_path, manifest, prune=False)
 
 
 def update_latex_slides_and_snippets(
-    work_dir, todo=None, pool=None, verbose=True
+    work_dir, todo=None, pool=None, verbose=True, cache=None
 ):
-    pool = utils.init_multiprocessing_pool_if_None(pool=pool)
+    if pool is None:
+        with executor.use(pool=None) as pool:
+            return update_latex_slides_and_snippets(
+                work_dir=work_dir,
+                todo=todo,
+                pool=pool,
+                verbose=verbose,
+                cache=cache,
+            )
     todo = utils.init_todo_if_None(todo=todo, work_dir=work_dir)
 
-    latex_types = {
-        "slide": ".png",
-        "snippet": ".svg",
-    }
-    common_resource_dir = os.path.join(work_dir, "resources")
-
-    jobs = []
-
-    for lt in latex_types:
-        for src_path in utils.glob(common_resource_dir, f"*.{lt:s}.tex"):
-            _src_path, _ = os.path.splitext(src_path)
-            dst_path = _src_path + latex_types[lt]
-            _job = _make_latex_job(src_path=src_path, dst_path=dst_path)
-            if _job is not None:
-                _job["latex_type"] = lt
-                jobs.append(_job)
-                if verbose:
-                    print(
-                        f"latex render: {dst_path:s} "
-                        f"because {_job['reason']:s}."
-                    )
-
-        for i in range(len(todo)):
-            slide = todo[i]["slide"]
-            show_layer_sets = todo[i]["show_layer_sets"]
-            slide_dir = os.path.join(work_dir, "slides", slide)
-
-            slide_resource_dir = os.path.join(slide_dir, "resources")
-
-            for src_path in utils.glob(slide_resource_dir, f"*.{lt:s}.tex"):
-                _src_path, _ = os.path.splitext(src_path)
-                dst_path = _src_path + latex_types[lt]
-
-                _job = _make_latex_job(src_path=src_path, dst_path=dst_path)
-                if _job is not None:
-                    _job["latex_type"] = lt
-                    jobs.append(_job)
-                    if verbose:
-                        print(
-                            f"latex render: {dst_path:s} "
-                            f"because {_job['reason']:s}."
-                        )
-
-    pool.map(run_latex_render_job, jobs)
-
-
-def _make_latex_job(src_path, dst_path):
-    need_to_render = False
-
-    if not os.path.exists(dst_path):
-        reason = "does not exist yet"
-        need_to_render = True
-    else:
-        src_mtime = utils.mtime(src_path)
-        dst_mtime = utils.mtime(dst_path)
-        if src_mtime > dst_mtime:
-            reason = "needs update"
-            need_to_render = True
-
-    if need_to_render:
-        job = {}
-        job["reason"] = reason
-        job["src_path"] = src_path
-        job["dst_path"] = dst_path
-        job["fontcolor"] = "white"
-        return job
-    else:
-        return None
-
-
-def run_latex_render_job(job):
-    if job["latex_type"] == "snippet":
-        with open(job["src_path"], "rt") as f:
-            latex_string = f.read()
-
-        latex.render_snippet_to_svg(
-            latex_string=latex_string,
-            out_path=job["dst_path"],
-            fontcolor=job["fontcolor"],
-        )
+    build_dir = os.path.join(work_dir, ".build")
+    os.makedirs(build_dir, exist_ok=True)
+    manifest_path = build_manifest.path_of_build_dir(build_dir)
+    manifest = build_manifest.read(manifest_path)
 
-    elif job["latex_type"] == "slide":
-        latex.render_slide_to_png(
-            latex_path=job["src_path"],
-            out_path=job["dst_path"],
-        )
-    else:
-        raise AssertionError(f"No such latex_type {job['latex_type']:s}.")
-
-
-def _run_job_render_note(job):
-    build_dir = os.path.join(job["work_dir"], ".build")
-    slide_dir = os.path.join(build_dir, "slides", job["slide_key"])
-    notes_path = os.path.join(slide_dir, job["layers_key"] + ".notes")
-    notes_render_path = notes_path + ".jpg"
-    notes_lines = utils.read_lines_from_textfile(notes_path)
-    notes_text = "\n".join(notes_lines)
-    notes_img.render_text_to_image(
-        path=notes_render_path,
-        text=notes_text,
+    nodes, _ = build_graph.make_latex_nodes(
+        work_dir=work_dir,
+        todo=todo,
+        manifest=manifest,
+        verbose=verbose,
+        cache=cache,
     )
+    try:
+        scheduler.run(nodes=nodes, pool=pool)
+    finally:
+        build_manifest.write(manifest_path, manifest, prune=False)
+        if cache is not None:
+            build_cache.evict(cache)
 
-    slide_render_path = os.path.join(slide_dir, job["layers_key"] + ".jpg")
-    slide_with_notes_path = os.path.join(
-        slide_dir, job["layers_key"] + ".sn.jpg"
-    )
 
-    notes_img.stack_images(
-        out_path=slide_with_notes_path,
-        input_paths=[slide_render_path, notes_render_path],
-    )
+def _call_again(func, arguments, **changes):
+    """
+    Calls `func` with the `arguments` it was called with and the `changes`.
+    So a new argument can not be dropped on the way.
+    """
+    return func(**dict(arguments, **changes))
@@ -28,29 +28,137 @@ def main():
     compile_cmd = commands.add_parser(
         "compile", help="Compiles the slices into a production ready PDF."
     )
-    add_work_dir_argument_to_command(cmd=compile_cmd)
+    add_compile_arguments_to_command(cmd=compile_cmd)
     compile_cmd.add_argument(
-        "out_path",
-        nargs="?",
+        "--plan",
+        action="store_true",
+        help=(
+            "Make nothing. Print the jobs which would run and the predicted "
+            "wall time for the number of threads."
+        ),
+    )
+    compile_cmd.add_argument(
+        "--profile",
+        metavar="TRACE_PATH",
+        type=str,
+        help=(
+            "Write the time and memory of each job and each call of a "
+            "program as Chrome trace events for ui.perfetto.dev."
+        ),
+        required=False,
         default=None,
+    )
+
+    # watch
+    # =====
+    watch_cmd = commands.add_parser(
+        "watch",
+        help=(
+            "Compiles the slides and compiles them again each time "
+            "a file changed."
+        ),
+    )
+    add_compile_arguments_to_command(cmd=watch_cmd)
+    watch_cmd.add_argument(
+        "--poll_interval",
+        metavar="SECONDS",
+        type=float,
+        help=("Seconds between looking for changes."),
+        required=False,
+        default=0.25,
+    )
+    watch_cmd.add_argument(
+        "--debounce",
+        metavar="SECONDS",
+        type=float,
+        help=("Seconds without changes before a build starts."),
+        required=False,
+        default=0.3,
+    )
+
+    # benchmark
+    # =========
+    benchmark_cmd = commands.add_parser(
+        "benchmark",
+        help=(
+            "Compiles a synthetic presentation cold, again with nothing to "
+            "do, after a slide was edited, and after a resource was edited."
+        ),
+    )
+    benchmark_cmd.add_argument(
+        "out_path",
         metavar="OUT_PATH",
         type=str,
-        help=("Path of the output PDF."),
+        help=("Path of the output json with the timings."),
     )
-    compile_cmd.add_argument(
-        "-i",
-        "--num_threads",
-        metavar="NUM_THREADS",
-        type=int,
-        help=("The number of threads to use."),
+    benchmark_cmd.add_argument(
+        "--work_dir",
+        metavar="WORK_DIR",
+        type=str,
+        help=("Directory to make the presentation in. It is overwritten."),
         required=False,
-        default=1,
+        default="pyslidescape-benchmark",
     )
-    compile_cmd.add_argument(
-        "--verbose", action="store_true", help="Print what is done."
+    for name, default, help_text in [
+        ("num_slides", 8, "The number of slides."),
+        ("num_layers", 4, "The number of layers of each slide."),
+        ("num_layer_sets", 3, "The number of layer sets of each slide."),
+        (
+            "image_num_pixel_edge",
+            0,
+            "Edge in pixels of an image in each slide. 0 for no image.",
+        ),
+        ("num_snippets", 0, "The number of latex snippets in each slide."),
+        ("num_repetitions", 1, "The number of times to measure."),
+    ]:
+        benchmark_cmd.add_argument(
+            "--" + name,
+            metavar=name.upper(),
+            type=int,
+            help=help_text,
+            required=False,
+            default=default,
+        )
+    add_executor_arguments_to_command(cmd=benchmark_cmd)
+    add_limit_arguments_to_command(cmd=benchmark_cmd)
+    benchmark_cmd.add_argument(
+        "--inkscape_shell",
+        action="store_true",
+        help="Render with long living 'inkscape --shell' processes.",
     )
-    compile_cmd.add_argument(
-        "--notes", action="store_true", help="Export with notes."
+    benchmark_cmd.add_argument(
+        "--composite_layers",
+        action="store_true",
+        help="Alpha composite the layer sets from the layers.",
+    )
+
+    # cache server
+    # ============
+    cache_server_cmd = commands.add_parser(
+        "cache-server",
+        help="Serves a remote cache of renders over http.",
+    )
+    cache_server_cmd.add_argument(
+        "store_dir",
+        metavar="STORE_DIR",
+        type=str,
+        help=("Directory to keep the renders in."),
+    )
+    cache_server_cmd.add_argument(
+        "--host",
+        metavar="HOST",
+        type=str,
+        help=("The address to listen on."),
+        required=False,
+        default="127.0.0.1",
+    )
+    cache_server_cmd.add_argument(
+        "--port",
+        metavar="PORT",
+        type=int,
+        help=("The port to listen on."),
+        required=False,
+        default=8765,
     )
 
     # slide
@@ -133,6 +241,11 @@ def main():
         action="store_true",
         help=("Set fontcolor to white for dark background."),
     )
+    latex_snippet_cmd.add_argument(
+        "--no_cache",
+        action="store_true",
+        help=("Render again even when the snippet was rendered before."),
+    )
 
     args = parser.parse_args()
 
@@ -143,14 +256,68 @@ def main():
     if args.command == "init":
         pyslidescape.template.init_example_presentation(work_dir=args.work_dir)
     elif args.command == "compile":
-        pyslidescape.compile(
-            work_dir=args.work_dir,
-            out_path=args.out_path,
-            pool=pyslidescape.utils.init_multiprocessing_pool(
-                args.num_threads
-            ),
-            verbose=args.verbose,
-            notes=args.notes,
+        with init_executor_from_args(args) as pool:
+            pyslidescape.compile(
+                work_dir=args.work_dir,
+                out_path=args.out_path,
+                pool=pool,
+                verbose=args.verbose or args.plan,
+                notes=args.notes,
+                inkscape_shell=args.inkscape_shell,
+                composite_layers=args.composite_layers,
+                strip_hidden_layers=args.strip_hidden_layers,
+                proxy_images=args.proxy_images,
+                cache=init_cache_from_args(args),
+                profile_path=args.profile,
+                limits=limits_from_args(args),
+                memory_budget_bytes=memory_budget_bytes_from_args(args),
+                dry_run=args.plan,
+            )
+    elif args.command == "watch":
+        with init_executor_from_args(args) as pool:
+            pyslidescape.watch(
+                work_dir=args.work_dir,
+                out_path=args.out_path,
+                pool=pool,
+                verbose=args.verbose,
+                notes=args.notes,
+                inkscape_shell=args.inkscape_shell,
+                composite_layers=args.composite_layers,
+                strip_hidden_layers=args.strip_hidden_layers,
+                proxy_images=args.proxy_images,
+                poll_interval=args.poll_interval,
+                debounce=args.debounce,
+                cache=init_cache_from_args(args),
+                limits=limits_from_args(args),
+                memory_budget_bytes=memory_budget_bytes_from_args(args),
+            )
+    elif args.command == "benchmark":
+        with init_executor_from_args(args) as pool:
+            result = pyslidescape.benchmark.run(
+                work_dir=args.work_dir,
+                deck={
+                    "num_slides": args.num_slides,
+                    "num_layers": args.num_layers,
+                    "num_layer_sets": args.num_layer_sets,
+                    "image_num_pixel_edge": args.image_num_pixel_edge,
+                    "num_snippets": args.num_snippets,
+                },
+                pool=pool,
+                compile_kwargs={
+                    "inkscape_shell": args.inkscape_shell,
+                    "composite_layers": args.composite_layers,
+                    "limits": limits_from_args(args),
+                    "memory_budget_bytes": memory_budget_bytes_from_args(args),
+                },
+                num_repetitions=args.num_repetitions,
+            )
+        pyslidescape.benchmark.write(path=args.out_path, result=result)
+        for scenario, measurements in result["results"].items():
+            wall_s = min(m["wall_s"] for m in measurements)
+            print(f"{scenario:<16s} {wall_s:10.3f}s")
+    elif args.command == "cache-server":
+        pyslidescape.cache_server.serve(
+            store_dir=args.store_dir, host=args.host, port=args.port
         )
     elif args.command == "add-slide":
         pyslidescape.add_slide(
@@ -172,12 +339,13 @@ def main():
         fontcolor = None
         if args.dark:
             fontcolor = "white"
-        pyslidescape.latex.render_snippet_to_svg(
-            latex_string=latex_string,
-            out_path=args.out_path,
+        pyslidescape.latex.render_snippets_to_svgs(
+            latex_strings=[latex_string],
+            out_paths=[args.out_path],
             scale=args.scale,
             width_of_the_document_in_inches=args.width,
             fontcolor=fontcolor,
+            use_snippet_cache=not args.no_cache,
         )
     else:
         print("No or unknown command.")
@@ -185,6 +353,211 @@ def main():
         sys.exit(17)
 
 
+def add_compile_arguments_to_command(cmd):
+    add_work_dir_argument_to_command(cmd=cmd)
+    cmd.add_argument(
+        "out_path",
+        nargs="?",
+        default=None,
+        metavar="OUT_PATH",
+        type=str,
+        help=("Path of the output PDF."),
+    )
+    add_executor_arguments_to_command(cmd=cmd)
+    add_limit_arguments_to_command(cmd=cmd)
+    cmd.add_argument(
+        "--verbose", action="store_true", help="Print what is done."
+    )
+    cmd.add_argument("--notes", action="store_true", help="Export with notes.")
+    cmd.add_argument(
+        "--inkscape_shell",
+        action="store_true",
+        help=(
+            "Render with long living 'inkscape --shell' processes "
+            "(inkscape >= 1.0)."
+        ),
+    )
+    cmd.add_argument(
+        "--composite_layers",
+        action="store_true",
+        help=(
+            "Render each layer only once and alpha composite the layer sets "
+            "from these."
+        ),
+    )
+    cmd.add_argument(
+        "--strip_hidden_layers",
+        action="store_true",
+        help=(
+            "Leave the hidden layers out of the SVGs to be rendered, so "
+            "inkscape does not load their images."
+        ),
+    )
+    cmd.add_argument(
+        "--proxy_images",
+        action="store_true",
+        help=(
+            "Render with JPEGs and PNGs scaled down to the pixels they are "
+            "drawn at on the slide."
+        ),
+    )
+    cmd.add_argument(
+        "--cache",
+        action="store_true",
+        help=(
+            "Take renders from, and put renders into, the cache which is "
+            "shared by all presentations."
+        ),
+    )
+    cmd.add_argument(
+        "--cache_dir",
+        metavar="CACHE_DIR",
+        type=str,
+        help=(
+            "Directory of the cache. "
+            "Default is $XDG_CACHE_HOME/pyslidescape."
+        ),
+        required=False,
+        default=None,
+    )
+    cmd.add_argument(
+        "--cache_max_size",
+        metavar="GIGA_BYTES",
+        type=float,
+        help=("The least recently used renders are removed above this size."),
+        required=False,
+        default=4.0,
+    )
+    cmd.add_argument(
+        "--cache_url",
+        metavar="URL",
+        type=str,
+        help=(
+            "Url of a remote cache which is asked for the renders which "
+            "are not in the local cache, see the command cache-server."
+        ),
+        required=False,
+        default=None,
+    )
+    cmd.add_argument(
+        "--cache_no_push",
+        action="store_true",
+        help="Do not put new renders into the remote cache.",
+    )
+
+
+def add_executor_arguments_to_command(cmd):
+    cmd.add_argument(
+        "-i",
+        "--num_threads",
+        metavar="NUM_THREADS",
+        type=int,
+        help=(
+            "The number of threads for the jobs which wait for programs, "
+            "e.g. inkscape. Default is one for each cpu. With 1, all jobs "
+            "run one after the other."
+        ),
+        required=False,
+        default=None,
+    )
+    cmd.add_argument(
+        "--num_processes",
+        metavar="NUM_PROCESSES",
+        type=int,
+        help=(
+            "The number of processes for the jobs which compute in python, "
+            "e.g. compositing layers. Default is one for each four cpus, "
+            "or none when NUM_THREADS is 1."
+        ),
+        required=False,
+        default=None,
+    )
+
+
+def add_limit_arguments_to_command(cmd):
+    cmd.add_argument(
+        "--limit",
+        metavar="TOOL=NUM",
+        type=parse_limit,
+        action="append",
+        help=(
+            "The max number of jobs which run TOOL at the same time, e.g. "
+            "inkscape=4. TOOL is one of "
+            f"{str.join(', ', pyslidescape.scheduler.TOOLS):s}. "
+            "Can be given for each tool."
+        ),
+        required=False,
+        default=[],
+    )
+    cmd.add_argument(
+        "--memory_budget",
+        metavar="GIGA_BYTES",
+        type=float,
+        help=(
+            "Only start a job while the estimated peak memory of all "
+            "running jobs stays below this. The estimates are the peaks "
+            "measured in the last build."
+        ),
+        required=False,
+        default=None,
+    )
+
+
+def parse_limit(limit):
+    """
+    Returns the tuple (tool, num) of a '--limit' like 'inkscape=4'.
+    """
+    tool, sep, num = str.partition(limit, "=")
+    try:
+        num = int(num)
+    except ValueError:
+        num = None
+    if len(tool) == 0 or len(sep) == 0 or num is None or num < 1:
+        raise argparse.ArgumentTypeError(
+            f"expected TOOL=NUM with NUM >= 1, e.g. inkscape=4, "
+            f"but got '{limit:s}'"
+        )
+    if tool not in pyslidescape.scheduler.TOOLS:
+        raise argparse.ArgumentTypeError(
+            f"unknown TOOL '{tool:s}', expected one of "
+            f"{str.join(', ', pyslidescape.scheduler.TOOLS):s}"
+        )
+    return tool, num
+
+
+def limits_from_args(args):
+    return dict(args.limit)
+
+
+def memory_budget_bytes_from_args(args):
+    if args.memory_budget is None:
+        return None
+    return int(args.memory_budget * 1e9)
+
+
+def init_executor_from_args(args):
+    num_processes = args.num_processes
+    if num_processes is None:
+        if args.num_threads == 1:
+            num_processes = 0
+        else:
+            num_processes = pyslidescape.executor.default_num_processes()
+    return pyslidescape.executor.init(
+        num_threads=args.num_threads, num_processes=num_processes
+    )
+
+
+def init_cache_from_args(args):
+    if not args.cache and args.cache_dir is None and args.cache_url is None:
+        return None
+    return pyslidescape.build_cache.init(
+        cache_dir=args.cache_dir,
+        max_num_bytes=args.cache_max_size * 1e9,
+        url=args.cache_url,
+        push=not args.cache_no_push,
+    )
+
+
 def add_work_dir_argument_to_command(cmd):
     cmd.add_argument(
         "work_dir",
@@ -0,0 +1,303 @@
+"""
+Benchmarks compile() on synthetic presentations. A deck has N slides with
+M layers each and K layer sets, optionally with a large image and latex
+snippets in each slide. For each deck it measures a cold compile, a
+compile with nothing to do, a compile after one slide was edited, and a
+compile after one resource was edited. The results are written as json so
+they can be compared between releases.
+"""
+
+from . import executor
+from . import template
+from . import utils
+from .version import __version__
+import json
+import os
+import platform
+import random
+import shutil
+import time
+import PIL.Image
+
+
+def make_deck(
+    work_dir,
+    num_slides=8,
+    num_layers=4,
+    num_layer_sets=3,
+    image_num_pixel_edge=0,
+    num_snippets=0,
+    slide_format=None,
+):
+    """
+    Writes a synthetic presentation into `work_dir`.
+
+    Parameters
+    ----------
+    num_slides : int
+        Number of slides.
+    num_layers : int
+        Number of layers in each slide, each with a few texts.
+    num_layer_sets : int
+        Number of layer sets of each slide, i.e. of pages in the pdf. The
+        k-th set shows the layers 0 to k.
+    image_num_pixel_edge : int
+        When > 0, each slide shows a JPEG of noise with this edge in pixels
+        from its resources in its first layer.
+    num_snippets : int
+        Number of latex snippets in each slide, shown in its last layer.
+    """
+    assert num_slides > 0
+    assert num_layers > 0
+    assert 0 < num_layer_sets <= num_layers
+    if slide_format is None:
+        slide_format = template.deafault_slide_format()
+
+    os.makedirs(work_dir, exist_ok=True)
+    utils.write_dict_to_json(
+        os.path.join(work_dir, ".config.json"),
+        {"slide_format": slide_format},
+    )
+    os.makedirs(os.path.join(work_dir, "resources"), exist_ok=True)
+
+    slides = [f"slide{s:04d}" for s in range(num_slides)]
+    for s, slide in enumerate(slides):
+        slide_dir = os.path.join(work_dir, "slides", slide)
+        resources_dir = os.path.join(slide_dir, "resources")
+        os.makedirs(resources_dir, exist_ok=True)
+
+        layers = []
+        for l in range(num_layers):
+            elements = [
+                template.make_text_element(
+                    text=f"Slide {s:d}, layer {l:d}, line {i:d}.",
+                    x=100,
+                    y=100 + 200 * l + 50 * i,
+                    font_size=40,
+                    uid=1000 * l + i,
+                )
+                for i in range(3)
+            ]
+            if l == 0 and image_num_pixel_edge > 0:
+                write_noise_jpeg(
+                    path=os.path.join(resources_dir, "image.jpg"),
+                    num_pixel_edge=image_num_pixel_edge,
+                    seed=s,
+                )
+                elements.append(
+                    template.make_image_element(
+                        x=1000,
+                        y=100,
+                        dx=800,
+                        dy=800,
+                        href="resources/image.jpg",
+                        uid=1000 * l + 100,
+                    )
+                )
+            if l == num_layers - 1:
+                for i in range(num_snippets):
+                    name = f"formula{i:d}.snippet"
+                    with open(
+                        os.path.join(resources_dir, name + ".tex"), "wt"
+                    ) as f:
+                        f.write(f"$x_{{{s:d}}} = \\sum_{{i=0}}^{{{i:d}}} i$")
+                    elements.append(
+                        template.make_image_element(
+                            x=100 + 300 * i,
+                            y=900,
+                            href=f"resources/{name:s}.svg",
+                            uid=1000 * l + 200 + i,
+                        )
+                    )
+            layers.append(
+                template.make_inkscape_layer(
+                    label=f"layer{l:d}",
+                    content=template.element_join(*elements),
+                    uid=l,
+                )
+            )
+
+        layer_sets = [
+            str.join(",", [f"layer{l:d}" for l in range(k + 1)])
+            for k in range(num_layer_sets)
+        ]
+        template.init_slide_dir(
+            path=slide_dir,
+            content=template.element_join(*layers),
+            show_layer_set=layer_sets,
+            slide_format=slide_format,
+        )
+
+    with open(os.path.join(work_dir, "slides.txt"), "wt") as f:
+        for slide in slides:
+            f.write(slide + "\n")
+    return slides
+
+
+def write_noise_jpeg(path, num_pixel_edge, seed=0):
+    """
+    Noise does not compress, so the JPEG is about as large as it gets.
+    """
+    prng = random.Random(seed)
+    num_bytes = 3 * num_pixel_edge * num_pixel_edge
+    noise = prng.getrandbits(8 * num_bytes).to_bytes(num_bytes, "little")
+    image = PIL.Image.frombytes("RGB", (num_pixel_edge, num_pixel_edge), noise)
+    image.save(path, quality=95)
+
+
+def edit_slide(work_dir, slide):
+    """
+    Adds a text to the first layer of the `slide`.
+    """
+    path = os.path.join(work_dir, "slides", slide, "layers.svg")
+    with open(path, "rt") as f:
+        svg = f.read()
+    num_edits = svg.count("Edited at")
+    text = template.make_text_element(
+        text=f"Edited at {time.time():f}.",
+        x=100,
+        y=1000,
+        font_size=40,
+        uid=900 + num_edits,
+    )
+    anchor = 'style="display:inline" >\n'
+    i = svg.index(anchor) + len(anchor)
+    with open(path, "wt") as f:
+        f.write(svg[:i] + text + "\n" + svg[i:])
+
+
+def edit_resource(work_dir, slide):
+    """
+    Changes a resource of the `slide`. This is its image when it has one,
+    or a new file otherwise.
+    """
+    resources_dir = os.path.join(work_dir, "slides", slide, "resources")
+    path = os.path.join(resources_dir, "image.jpg")
+    if os.path.exists(path):
+        with PIL.Image.open(path) as image:
+            num_pixel_edge = image.size[0]
+        write_noise_jpeg(
+            path=path, num_pixel_edge=num_pixel_edge, seed=int(time.time())
+        )
+    else:
+        with open(os.path.join(resources_dir, "edited.txt"), "wt") as f:
+            f.write(f"{time.time():f}\n")
+
+
+def measure(func):
+    """
+    Returns the wall time, the cpu time of this process and of its waited
+    for children, e.g. inkscape, while calling `func`. The cpu time of the
+    children is None where the module 'resource' does not exist, e.g. on
+    Windows.
+    """
+    cpu_start = time.process_time()
+    children_start = _children_cpu_s()
+    start = time.perf_counter()
+    func()
+    wall_s = time.perf_counter() - start
+    children_stop = _children_cpu_s()
+    return {
+        "wall_s": wall_s,
+        "cpu_s": time.process_time() - cpu_start,
+        "children_cpu_s": (
+            None if children_start is None else children_stop - children_start
+        ),
+    }
+
+
+def _children_cpu_s():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return rusage.ru_utime + rusage.ru_stime
+
+
+SCENARIOS = ["cold", "no-op", "edit slide", "edit resource"]
+
+
+def run(
+    work_dir,
+    deck=None,
+    pool=None,
+    compile_kwargs=None,
+    num_repetitions=1,
+):
+    """
+    Makes the deck in `work_dir` and measures each of the SCENARIOS
+    `num_repetitions` times. A cold compile starts without the build dir
+    and without the outputs of the latex snippets.
+
+    Parameters
+    ----------
+    deck : dict
+        The arguments for make_deck().
+    compile_kwargs : dict
+        More arguments for compile(), e.g. composite_layers.
+
+    Returns a dict which can be written as json.
+    """
+    from . import compile as _compile
+
+    if pool is None:
+        with executor.use(pool=None) as pool:
+            return run(
+                work_dir=work_dir,
+                deck=deck,
+                pool=pool,
+                compile_kwargs=compile_kwargs,
+                num_repetitions=num_repetitions,
+            )
+
+    deck = {} if deck is None else dict(deck)
+    compile_kwargs = {} if compile_kwargs is None else dict(compile_kwargs)
+    compile_kwargs.setdefault("verbose", False)
+
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    slides = make_deck(work_dir=work_dir, **deck)
+
+    def compile_deck():
+        _compile(work_dir=work_dir, pool=pool, **compile_kwargs)
+
+    results = {scenario: [] for scenario in SCENARIOS}
+    for repetition in range(num_repetitions):
+        _remove_outputs(work_dir)
+        results["cold"].append(measure(compile_deck))
+        results["no-op"].append(measure(compile_deck))
+        edit_slide(work_dir=work_dir, slide=slides[0])
+        results["edit slide"].append(measure(compile_deck))
+        edit_resource(work_dir=work_dir, slide=slides[-1])
+        results["edit resource"].append(measure(compile_deck))
+
+    return {
+        "pyslidescape_version": __version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "deck": deck,
+        "pool": repr(pool),
+        "compile_kwargs": {
+            k: v for k, v in compile_kwargs.items() if _is_json(v)
+        },
+        "results": results,
+    }
+
+
+def _remove_outputs(work_dir):
+    shutil.rmtree(os.path.join(work_dir, ".build"), ignore_errors=True)
+    for path in utils.glob(work_dir, "slides/*/resources/*.snippet.svg"):
+        os.remove(path)
+
+
+def _is_json(obj):
+    try:
+        json.dumps(obj)
+        return True
+    except TypeError:
+        return False
+
+
+def write(path, result):
+    utils.write_dict_to_json(path, result)
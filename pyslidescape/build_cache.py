@@ -0,0 +1,348 @@
+"""
+A content-addressed cache of build outputs which is shared by all
+presentations of a user, and optionally by a team via a remote store.
+The outputs of a job are stored under the hash of the hashes of the inputs
+they were made from, so a slide which shows up in many presentations, e.g.
+a title slide, is only rendered once.
+
+Each job has an index object under its key. The index names the files the
+job made, each stored as an object under the hash of its content, and the
+result the job returned. The names in the index are chosen by the caller
+and do not need to be the names of the files, so e.g. a slide has the
+same key in each presentation no matter how its files are named there.
+
+The remote store is any HTTP server which answers 'GET <url>/objects/<key>'
+and accepts 'PUT <url>/objects/<key>', see cache_server. The files taken
+from the remote store are only kept when their content matches their hash.
+Objects are only put into the remote store when they are new to the local
+cache. An index is only kept when it can be read, see _read_index(). The
+least recently used local files are evicted once the local
+cache grows larger than its limit. These are the objects and the files in
+the dirs which other caches keep in here, see path_of_dir().
+"""
+
+from . import build_manifest
+from .version import __version__
+import hashlib
+import json
+import os
+import tempfile
+import urllib.error
+import urllib.request
+import warnings
+
+
+def default_dir():
+    """
+    Returns '$XDG_CACHE_HOME/pyslidescape', or '~/.cache/pyslidescape' when
+    XDG_CACHE_HOME is not set.
+    """
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME", "")
+    if len(xdg_cache_home) == 0:
+        xdg_cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg_cache_home, "pyslidescape")
+
+
+def init(
+    cache_dir=None, max_num_bytes=4 * 2**30, url=None, push=True, timeout=10.0
+):
+    """
+    Returns the config of a cache in `cache_dir`, see default_dir().
+
+    Parameters
+    ----------
+    url : str, optional
+        Base url of a remote store which is asked for the objects which are
+        not in the local cache.
+    push : bool
+        Whether new objects are also put into the remote store.
+    timeout : float
+        Seconds to wait for the remote store.
+    """
+    if cache_dir is None:
+        cache_dir = default_dir()
+    if url is not None:
+        url = url.rstrip("/")
+    return {
+        "dir": cache_dir,
+        "max_num_bytes": int(max_num_bytes),
+        "url": url,
+        "push": bool(push),
+        "timeout": float(timeout),
+    }
+
+
+def make_key(what, inputs, names=()):
+    """
+    Returns the key of the outputs with `names` made by `what` from the
+    `inputs`, i.e. the dict of the hashes of the inputs which is also
+    recorded in the build manifest.
+    """
+    return build_manifest.hash_json(
+        {
+            "what": what,
+            "inputs": inputs,
+            "names": sorted(names),
+            "version": __version__,
+        }
+    )
+
+
+def path_of_key(cache, key):
+    return os.path.join(cache["dir"], "objects", key[0:2], key)
+
+
+def path_of_dir(cache, name):
+    """
+    Returns the path of the dir `name` in the cache, e.g. for the snippets
+    and formats of latex. Its files are evicted together with the objects,
+    so a file should have its mtime set when it is used.
+    """
+    return os.path.join(cache["dir"], name)
+
+
+def get(cache, key, paths):
+    """
+    Copies the files of the job with `key` to the `paths`, a dict which maps
+    the names in the index to paths, or a callable which returns the path
+    of a name, or None.
+
+    Returns a tuple (hit, result). `hit` is False when the job is not in
+    the cache. `result` is what the job returned.
+    """
+    index_path = _fetch(cache, key, check=_read_index)
+    if index_path is None:
+        return False, None
+    try:
+        index = _read_index(index_path)
+    except ValueError as err:
+        warnings.warn(f"Cache: removed index {key:s}: {err!r}")
+        _remove(index_path)
+        return False, None
+
+    path_of_name = paths.get if isinstance(paths, dict) else paths
+    blob_paths = {}
+    dst_paths = {}
+    for name, blob_key in index["files"].items():
+        dst_paths[name] = path_of_name(name)
+        if dst_paths[name] is None:
+            return False, None
+        blob_path = _fetch(cache, blob_key, verify=True)
+        if blob_path is None:
+            return False, None
+        blob_paths[name] = blob_path
+
+    for name, blob_path in blob_paths.items():
+        _copy_atomic(src=blob_path, dst=dst_paths[name])
+    return True, index["result"]
+
+
+def put(cache, key, paths, result=None):
+    """
+    Puts the files in `paths`, a dict which maps names to paths, and the
+    `result` of the job with `key` into the cache. Files which do not exist
+    are skipped.
+    """
+    index = {"files": {}, "result": result}
+    for name, path in paths.items():
+        if not os.path.isfile(path):
+            continue
+        blob_key = build_manifest.hash_file(path)
+        _store(cache, key=blob_key, src_path=path)
+        index["files"][name] = blob_key
+
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        index_path = os.path.join(tmp, "index.json")
+        with open(index_path, "wt") as f:
+            f.write(json.dumps(index, sort_keys=True))
+        _store(cache, key=key, src_path=index_path)
+
+
+def evict(cache):
+    """
+    Removes the least recently used local files until the local cache is
+    not larger than its limit. Returns the number of removed files. The
+    cache is only looked at when objects were added since the last
+    eviction, see _mark_new(), so a build which made nothing new does not
+    pay for a cache which is large.
+    """
+    marker_path = os.path.join(cache["dir"], _NEW_MARKER)
+    if not os.path.exists(marker_path):
+        return 0
+    _remove(marker_path)
+
+    entries = []
+    num_bytes = 0
+    for root, _, names in os.walk(cache["dir"]):
+        for name in names:
+            if name.endswith(".part") or name == _NEW_MARKER:
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+            num_bytes += st.st_size
+
+    num_removed = 0
+    for _, size, path in sorted(entries):
+        if num_bytes <= cache["max_num_bytes"]:
+            break
+        _remove(path)
+        num_bytes -= size
+        num_removed += 1
+    return num_removed
+
+
+_NEW_MARKER = "new_since_evict"
+
+
+def _mark_new(cache):
+    """
+    Tells evict() that objects were added. A file is used, so that the
+    jobs which run in other processes can tell, too.
+    """
+    with open(os.path.join(cache["dir"], _NEW_MARKER), "ab"):
+        pass
+
+
+def _read_index(path):
+    """
+    Returns the index in `path`. Raises a ValueError when it is not one.
+    """
+    with open(path, "rt") as f:
+        index = json.loads(f.read())
+    if (
+        not isinstance(index, dict)
+        or not isinstance(index.get("files", None), dict)
+        or "result" not in index
+    ):
+        raise ValueError("Expected a dict with 'files' and 'result'.")
+    return index
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _fetch(cache, key, verify=False, check=None):
+    """
+    Returns the path of the local object with `key`, which is taken from
+    the remote store when it is not local yet, or None. With `verify`, the
+    `key` is the hash of the object's content, see _remote_get(). For
+    `check`, see _write_atomic().
+    """
+    path = path_of_key(cache, key)
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    if cache["url"] is None:
+        return None
+    if _remote_get(cache, key=key, dst_path=path, verify=verify, check=check):
+        _mark_new(cache)
+        return path
+    return None
+
+
+def _store(cache, key, src_path):
+    path = path_of_key(cache, key)
+    if os.path.exists(path):
+        os.utime(path)
+        return
+    _copy_atomic(src=src_path, dst=path)
+    _mark_new(cache)
+    if cache["url"] is not None and cache["push"]:
+        _remote_put(cache, key=key, src_path=path)
+
+
+def _url_of_key(cache, key):
+    return cache["url"] + "/objects/" + key
+
+
+def _remote_get(cache, key, dst_path, verify=False, check=None):
+    """
+    Writes the remote object with `key` to `dst_path`. With `verify`, an
+    object whose sha256 is not its `key` is discarded and counts as a miss.
+    So is an object which fails the `check`, see _write_atomic().
+    """
+    try:
+        with urllib.request.urlopen(
+            _url_of_key(cache, key), timeout=cache["timeout"]
+        ) as response:
+            _write_atomic(
+                src_file=response,
+                dst=dst_path,
+                sha256=key if verify else None,
+                check=check,
+            )
+        return True
+    except urllib.error.HTTPError as err:
+        if err.code != 404:
+            warnings.warn(f"Remote cache: GET {key:s}: {err!r}")
+        return False
+    except (urllib.error.URLError, OSError, ValueError) as err:
+        warnings.warn(f"Remote cache: GET {key:s}: {err!r}")
+        return False
+
+
+def _remote_put(cache, key, src_path):
+    try:
+        with open(src_path, "rb") as f:
+            request = urllib.request.Request(
+                _url_of_key(cache, key),
+                data=f,
+                method="PUT",
+                headers={
+                    "Content-Length": str(os.stat(src_path).st_size),
+                    "Content-Type": "application/octet-stream",
+                },
+            )
+            with urllib.request.urlopen(request, timeout=cache["timeout"]):
+                pass
+        return True
+    except (urllib.error.URLError, OSError) as err:
+        warnings.warn(f"Remote cache: PUT {key:s}: {err!r}")
+        return False
+
+
+def _copy_atomic(src, dst):
+    with open(src, "rb") as f:
+        _write_atomic(src_file=f, dst=dst)
+
+
+def _write_atomic(src_file, dst, sha256=None, check=None, block_size=2**20):
+    """
+    Writes the content of `src_file` to `dst`. Raises a ValueError and
+    writes nothing when `sha256` is given and the content does not match it.
+    `check` is called with the path of the written content before it is
+    moved to `dst` and raises a ValueError to discard it.
+    """
+    dst_dir = os.path.dirname(dst) or os.curdir
+    os.makedirs(dst_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dst_dir, suffix=".part")
+    try:
+        h = hashlib.sha256()
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                block = src_file.read(block_size)
+                if not block:
+                    break
+                h.update(block)
+                f.write(block)
+        if sha256 is not None and h.hexdigest() != sha256:
+            raise ValueError(
+                f"Expected sha256 {sha256:s}, but got {h.hexdigest():s}."
+            )
+        if check is not None:
+            check(tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
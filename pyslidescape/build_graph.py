@@ -0,0 +1,1450 @@
+"""
+The graph of jobs of a build. Makes the nodes, see scheduler.make_node(), and
+runs their jobs in the workers of the pool.
+"""
+
+from . import inkscape
+from . import utils
+from . import portable_document_format
+from . import template
+from . import latex
+from . import notes_img
+from . import build_manifest
+from . import build_cache
+from . import composite
+from . import scheduler
+from . import proxies
+
+import os
+import re
+
+
+def make_nodes(
+    work_dir,
+    todo,
+    manifest,
+    verbose,
+    notes,
+    inkscape_shell,
+    composite_layers,
+    strip_hidden_layers,
+    proxy_images,
+    cache,
+):
+    """
+    Returns the nodes of the graph of jobs which make the pdf in
+    '.build/slides.pdf', and with `notes` also '.build/slides.notes.pdf',
+    see compile().
+    """
+    build_dir = os.path.join(work_dir, ".build")
+    slide_format = (
+        _slide_format_of_presentation(work_dir) if proxy_images else None
+    )
+
+    nodes = []
+
+    # latex snippets and slides
+    # -------------------------
+    latex_nodes, latex_outputs = make_latex_nodes(
+        work_dir=work_dir,
+        todo=todo,
+        manifest=manifest,
+        verbose=verbose,
+        cache=cache,
+    )
+    nodes += latex_nodes
+
+    # resources
+    # ---------
+    for src_dir in _resource_dirs(work_dir=work_dir, todo=todo):
+        nodes.append(
+            _make_copy_resources_node(
+                work_dir=work_dir,
+                src_dir=src_dir,
+                latex_outputs=latex_outputs,
+                manifest=manifest,
+                verbose=verbose,
+            )
+        )
+
+    # slides
+    # ------
+    slide_scans = {}
+    list_of_image_paths = []
+    image_node_keys = {}
+    for i in range(len(todo)):
+        slide = todo[i]["slide"]
+        show_layer_sets = todo[i]["show_layer_sets"]
+        slide_dir = os.path.join(build_dir, "slides", slide)
+        resource_deps = [
+            _copy_resources_node_key(work_dir, os.path.join(work_dir, d))
+            for d in ["resources", os.path.join("slides", slide, "resources")]
+        ]
+
+        roll_out_node = _make_roll_out_node(
+            work_dir=work_dir,
+            slide=slide,
+            show_layer_sets=show_layer_sets,
+            composite_layers=composite_layers,
+            strip_hidden_layers=strip_hidden_layers,
+            proxy_images=proxy_images,
+            slide_format=slide_format,
+            deps=resource_deps if proxy_images else [],
+            manifest=manifest,
+            slide_scans=slide_scans,
+            verbose=verbose,
+            cache=cache,
+        )
+        nodes.append(roll_out_node)
+
+        if composite_layers:
+            render_ext = ".png"
+            names = {
+                label: ([label], label + ".layer")
+                for label in _layers_in_show_layer_sets(show_layer_sets)
+            }
+        else:
+            render_ext = ".jpg"
+            names = {}
+            for show_layer_set in show_layer_sets:
+                show_label_str = str.join(",", list(show_layer_set))
+                names[show_label_str] = (show_layer_set, show_label_str)
+
+        render_node_keys = {}
+        for name_key, (show_layer_set, name) in names.items():
+            render_node = _make_render_node(
+                work_dir=work_dir,
+                slide=slide,
+                show_layer_set=show_layer_set,
+                src_svg_path=os.path.join(slide_dir, name + ".svg"),
+                dst_path=os.path.join(slide_dir, name + render_ext),
+                deps=[roll_out_node["key"]] + resource_deps,
+                slide_scans=slide_scans,
+                inkscape_shell=inkscape_shell,
+                manifest=manifest,
+                verbose=verbose,
+                cache=cache,
+            )
+            render_node_keys[name_key] = render_node["key"]
+            nodes.append(render_node)
+
+        for show_layer_set in show_layer_sets:
+            show_label_str = str.join(",", list(show_layer_set))
+            image_path = os.path.join(slide_dir, show_label_str + ".jpg")
+            list_of_image_paths.append(image_path)
+
+            if composite_layers:
+                composite_node = _make_composite_node(
+                    work_dir=work_dir,
+                    slide=slide,
+                    show_layer_set=show_layer_set,
+                    dst_path=image_path,
+                    deps=[render_node_keys[n] for n in set(show_layer_set)],
+                    slide_scans=slide_scans,
+                    manifest=manifest,
+                    verbose=verbose,
+                    cache=cache,
+                )
+                nodes.append(composite_node)
+                image_node_keys[image_path] = composite_node["key"]
+            else:
+                image_node_keys[image_path] = render_node_keys[show_label_str]
+
+    # write pdf
+    # ---------
+    pdf_path = os.path.join(build_dir, "slides.pdf")
+    nodes.append(
+        _make_pdf_node(
+            work_dir=work_dir,
+            list_of_image_paths=list_of_image_paths,
+            out_path=pdf_path,
+            deps=list(image_node_keys.values()),
+            manifest=manifest,
+            verbose=verbose,
+        )
+    )
+
+    # notes
+    # -----
+    if notes:
+        notes_nodes = make_notes_nodes(
+            work_dir=work_dir,
+            todo=todo,
+            manifest=manifest,
+            verbose=verbose,
+            image_node_keys=image_node_keys,
+        )
+        nodes += notes_nodes
+
+        notes_pdf_path = os.path.join(build_dir, "slides.notes.pdf")
+        list_of_slides_with_notes_paths = []
+        for p_slide in list_of_image_paths:
+            p_slide_woext, _ = os.path.splitext(p_slide)
+            p_slide_with_notes = p_slide_woext + ".sn.jpg"
+            list_of_slides_with_notes_paths.append(p_slide_with_notes)
+        nodes.append(
+            _make_pdf_node(
+                work_dir=work_dir,
+                list_of_image_paths=list_of_slides_with_notes_paths,
+                out_path=notes_pdf_path,
+                deps=[node["key"] for node in notes_nodes],
+                manifest=manifest,
+                verbose=verbose,
+            )
+        )
+
+    return nodes
+
+
+def _make_build_node(
+    work_dir,
+    manifest,
+    verbose,
+    what,
+    out_path,
+    deps,
+    inputs,
+    func,
+    job,
+    report=None,
+    cache=None,
+    cpu_bound=False,
+    tool=None,
+    num_bytes=None,
+):
+    """
+    A node which makes the output in `out_path` by running `func` with `job`
+    when the hashes of its inputs changed.
+
+    `inputs` and `job` are callables which are called in the main process
+    once all `deps` are done. `inputs` returns the dict of the hashes of the
+    inputs, or None when there is nothing to make. When verbose, `report`
+    is called with the result of `func` and returns a str to be printed.
+
+    When a `cache` is given, the output is taken from the cache when it
+    holds an output made from the same inputs, see run_cached_job().
+
+    `cpu_bound` tells that `func` computes in python rather than waiting
+    for a program, `tool` what it runs, and `num_bytes` how large its
+    input is, see scheduler.
+    """
+    key = os.path.relpath(out_path, work_dir)
+    state = {}
+
+    def plan():
+        state["inputs"] = inputs()
+        if state["inputs"] is None:
+            return None
+        reason = build_manifest.reason_to_update(
+            manifest=manifest, key=key, path=out_path, inputs=state["inputs"]
+        )
+        if reason is None:
+            return None
+        if verbose:
+            print(f"{what:s}: {out_path:s} because {reason:s}.")
+        if cache is None:
+            return job()
+        return _cached_job(
+            cache=cache,
+            what=what,
+            inputs=state["inputs"],
+            paths={"output" + os.path.splitext(out_path)[1]: out_path},
+            func=func,
+            job=job(),
+        )
+
+    def done(result):
+        if cache is not None:
+            if verbose and result["cache_hit"]:
+                print(f"{what:s}: {out_path:s} from cache.")
+            result = result["result"]
+        build_manifest.record(manifest, key=key, inputs=state["inputs"])
+        if verbose and report is not None:
+            print(f"{what:s}: {out_path:s}: {report(result):s}.")
+
+    return scheduler.make_node(
+        key=key,
+        deps=deps,
+        plan=plan,
+        func=func if cache is None else run_cached_job,
+        done=done,
+        cat=what,
+        cpu_bound=cpu_bound,
+        tool=tool,
+        num_bytes=num_bytes,
+    )
+
+
+def _num_bytes_of_first_file(*paths):
+    """
+    Returns the size of the first of the `paths` which exists, or 0.
+    """
+    for path in paths:
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            continue
+    return 0
+
+
+def _cached_job(cache, what, inputs, paths, func, job):
+    return {
+        "cache": cache,
+        "key": build_cache.make_key(what=what, inputs=inputs, names=paths),
+        "paths": paths,
+        "func": func,
+        "job": job,
+    }
+
+
+def run_cached_job(job):
+    """
+    Takes the outputs from the cache, or runs the job and puts its outputs
+    into the cache.
+    """
+    hit, result = build_cache.get(
+        job["cache"], key=job["key"], paths=job["paths"]
+    )
+    if hit:
+        return {"cache_hit": True, "result": result}
+    result = job["func"](job["job"])
+    build_cache.put(
+        job["cache"], key=job["key"], paths=job["paths"], result=result
+    )
+    return {"cache_hit": False, "result": result}
+
+
+def _resource_dirs(work_dir, todo):
+    resource_dirs = [os.path.join(work_dir, "resources")]
+    for i in range(len(todo)):
+        slide = todo[i]["slide"]
+        slide_dir = os.path.join(work_dir, "slides", slide)
+        resource_dirs.append(os.path.join(slide_dir, "resources"))
+    return resource_dirs
+
+
+def latex_outputs(work_dir, todo):
+    """
+    Returns the paths of the images in the resource dirs which are rendered
+    from latex, see latex.is_output().
+    """
+    out = []
+    for resource_dir in _resource_dirs(work_dir=work_dir, todo=todo):
+        for path in utils.glob(resource_dir, "*"):
+            if latex.is_output(path):
+                out.append(path)
+    return out
+
+
+def _copy_resources_node_key(work_dir, src_dir):
+    return "copy:" + os.path.relpath(src_dir, work_dir)
+
+
+def _make_copy_resources_node(
+    work_dir, src_dir, latex_outputs, manifest, verbose
+):
+    """
+    Copies the resources in `src_dir` into the build dir after the latex
+    renders in `src_dir` are done. `latex_outputs` maps the keys of the
+    latex nodes to the paths of their outputs, see make_latex_nodes().
+    """
+    build_dir = os.path.join(work_dir, ".build")
+    dst_dir = os.path.join(build_dir, os.path.relpath(src_dir, work_dir))
+
+    deps = []
+    for latex_node_key, latex_dst_paths in latex_outputs.items():
+        for latex_dst_path in latex_dst_paths:
+            if os.path.dirname(latex_dst_path) == src_dir:
+                deps.append(latex_node_key)
+                break
+
+    def plan():
+        os.makedirs(os.path.dirname(dst_dir), exist_ok=True)
+        utils.copytree_lazy(
+            src=src_dir, dst=dst_dir, verbose=verbose, manifest=manifest
+        )
+        return None
+
+    return scheduler.make_node(
+        key=_copy_resources_node_key(work_dir, src_dir),
+        deps=deps,
+        plan=plan,
+        cat="copy resources",
+    )
+
+
+def _make_roll_out_node(
+    work_dir,
+    slide,
+    show_layer_sets,
+    composite_layers,
+    manifest,
+    slide_scans,
+    verbose,
+    cache=None,
+    strip_hidden_layers=False,
+    proxy_images=False,
+    slide_format=None,
+    deps=(),
+):
+    """
+    Rolls out all the SVGs of a slide in one job when any of them needs an
+    update. What the job found in 'layers.svg', i.e. the labels of the
+    layers and the hrefs in each layer, is kept in the build manifest and in
+    `slide_scans`. With `proxy_images`, the SVGs are also rolled out again
+    when one of the rasters they link, or the `slide_format`, changed. The
+    proxies are made from the rasters in the resource dirs, so the node
+    then needs the `deps` which make these, e.g. latex renders.
+    """
+    src_path = os.path.join(work_dir, "slides", slide, "layers.svg")
+    src_key = os.path.relpath(src_path, work_dir)
+    dst_dir = os.path.join(work_dir, ".build", "slides", slide)
+    embedded_dir = os.path.join(work_dir, ".build", "embedded")
+    proxy_dir = os.path.join(work_dir, ".build", "proxies")
+    state = {}
+
+    def proxies_digest(hrefs):
+        if not proxy_images:
+            return None
+        return _proxy_sources_digest(
+            manifest=manifest,
+            hrefs=hrefs,
+            base_dir=os.path.dirname(src_path),
+            slide_format=slide_format,
+        )
+
+    def plan():
+        src_digest = build_manifest.file_digest(manifest, src_path)
+        scan = build_manifest.get_scan(
+            manifest, key=src_key, digest=src_digest
+        )
+        if not isinstance(scan, dict):
+            scan = None  # a scan of an older version.
+        state["src_digest"] = src_digest
+        slide_scans[slide] = scan
+        if not proxy_images:
+            proxy_inputs = None
+        elif scan is None:
+            proxy_inputs = proxies_digest(inkscape.find_hrefs_in_svg(src_path))
+        else:
+            proxy_inputs = proxies_digest(_src_hrefs(scan))
+        # The digest before the job, so a raster which changes while the
+        # job runs is noticed in the next build.
+        state["proxy_inputs"] = proxy_inputs
+
+        if scan is None:
+            if src_key in manifest["scans"]:
+                reasons = ["'layers.svg' changed"]
+            else:
+                reasons = ["it was not rolled out yet"]
+        else:
+            reasons = []
+            for show_layer_set, name in _roll_outs_of_slide(
+                all_layers=scan["layers"],
+                show_layer_sets=show_layer_sets,
+                composite_layers=composite_layers,
+            ):
+                dst_path = os.path.join(dst_dir, name + ".svg")
+                reason = build_manifest.reason_to_update(
+                    manifest=manifest,
+                    key=os.path.relpath(dst_path, work_dir),
+                    path=dst_path,
+                    inputs=_roll_out_inputs(
+                        src_digest,
+                        show_layer_set,
+                        strip_hidden_layers=strip_hidden_layers,
+                        proxy_inputs=proxy_inputs,
+                    ),
+                )
+                if reason is not None:
+                    reasons.append(f"{name:s} {reason:s}")
+            for href in _linked_build_files(scan):
+                if not os.path.isfile(os.path.join(dst_dir, href)):
+                    reasons.append(f"{href:s} is missing")
+
+        if len(reasons) == 0:
+            return None
+
+        if verbose:
+            print(
+                f"roll out: {slide:s} because " f"{str.join(', ', reasons):s}."
+            )
+        job = {
+            "src_svg_path": src_path,
+            "dst_dir": dst_dir,
+            "show_layer_sets": show_layer_sets,
+            "composite_layers": composite_layers,
+            "strip_hidden_layers": strip_hidden_layers,
+            "embedded_dir": embedded_dir,
+        }
+        if proxy_images:
+            job["proxy_dir"] = proxy_dir
+            job["slide_format"] = slide_format
+        if cache is None:
+            return job
+        if composite_layers:
+            names = [
+                label + ".layer.svg"
+                for label in _layers_in_show_layer_sets(show_layer_sets)
+            ]
+        else:
+            names = [
+                str.join(",", list(show_layer_set)) + ".svg"
+                for show_layer_set in show_layer_sets
+            ]
+        cache_inputs = {
+            "layers.svg": src_digest,
+            "show_layer_sets": show_layer_sets,
+            "composite_layers": composite_layers,
+            "strip_hidden_layers": strip_hidden_layers,
+        }
+        if proxy_images:
+            cache_inputs["proxies"] = proxy_inputs
+        return _cached_job(
+            cache=cache,
+            what="roll out",
+            inputs=cache_inputs,
+            paths={name: os.path.join(dst_dir, name) for name in names},
+            func=run_svg_roll_out_job,
+            job=job,
+        )
+
+    def done(scan):
+        if cache is not None:
+            if verbose and scan["cache_hit"]:
+                print(f"roll out: {slide:s} from cache.")
+            scan = scan["result"]
+        src_digest = state["src_digest"]
+        slide_scans[slide] = scan
+        build_manifest.record_scan(
+            manifest, key=src_key, digest=src_digest, scan=scan
+        )
+        for show_layer_set, name in _roll_outs_of_slide(
+            all_layers=scan["layers"],
+            show_layer_sets=show_layer_sets,
+            composite_layers=composite_layers,
+        ):
+            dst_path = os.path.join(dst_dir, name + ".svg")
+            build_manifest.record(
+                manifest,
+                key=os.path.relpath(dst_path, work_dir),
+                inputs=_roll_out_inputs(
+                    src_digest,
+                    show_layer_set,
+                    strip_hidden_layers=strip_hidden_layers,
+                    proxy_inputs=state["proxy_inputs"],
+                ),
+            )
+
+    return scheduler.make_node(
+        key="roll_out:" + slide,
+        deps=deps,
+        plan=plan,
+        func=(
+            run_svg_roll_out_job if cache is None else run_cached_roll_out_job
+        ),
+        done=done,
+        cat="roll out",
+        num_bytes=lambda: _num_bytes_of_first_file(src_path),
+    )
+
+
+def _src_hrefs(scan):
+    """
+    Returns the hrefs in the 'layers.svg' of the `scan` of a roll out,
+    i.e. without the hrefs of the files in the build dir it added.
+    """
+    added = set(_linked_build_files(scan))
+    return [href for href, _ in scan["hrefs"] if href not in added]
+
+
+def _linked_build_files(scan):
+    """
+    Returns the hrefs of the embedded images and the proxies the SVGs of
+    the `scan` of a roll out link.
+    """
+    return scan.get("embedded", []) + scan.get("proxies", [])
+
+
+def _proxy_sources_digest(manifest, hrefs, base_dir, slide_format):
+    """
+    Returns one hash over the `slide_format` and the rasters the `hrefs`
+    point to which could get a proxy, see proxies.
+    """
+    sources = {}
+    for href in hrefs:
+        path = inkscape.href_to_path(href=href, base_dir=base_dir)
+        if path is None or not proxies.is_raster(path):
+            continue
+        if os.path.isfile(path):
+            sources[href] = build_manifest.file_digest(manifest, path)
+        else:
+            sources[href] = None
+    return build_manifest.hash_json(
+        {"slide_format": slide_format, "sources": sources}
+    )
+
+
+def _slide_format_of_presentation(work_dir):
+    path = os.path.join(work_dir, ".config.json")
+    if not os.path.isfile(path):
+        return template.deafault_slide_format()
+    return utils.read_json_to_dict(path)["slide_format"]
+
+
+def _make_render_node(
+    work_dir,
+    slide,
+    show_layer_set,
+    src_svg_path,
+    dst_path,
+    deps,
+    slide_scans,
+    inkscape_shell,
+    manifest,
+    verbose,
+    cache=None,
+):
+    """
+    Renders the SVG of a layer set. It is rendered again only when the SVG
+    changed or when one of the files it references changed.
+    """
+    job = {}
+    job["src_svg_path"] = src_svg_path
+    job["dst_jpg_path"] = dst_path
+    job["background_opacity"] = 0.0
+    job["inkscape_shell"] = inkscape_shell
+
+    def inputs():
+        if not os.path.exists(src_svg_path):
+            return None  # e.g. a layer in layers.txt not in layers.svg.
+        scan = slide_scans[slide]
+        hrefs = inkscape.find_hrefs_shown(
+            layers_svg=scan,
+            hide=set(scan["layers"]).difference(set(show_layer_set)),
+        )
+        return {
+            "svg": build_manifest.file_digest(manifest, src_svg_path),
+            "resources": _resources_digest(
+                work_dir=work_dir,
+                manifest=manifest,
+                hrefs=hrefs,
+                base_dir=os.path.dirname(src_svg_path),
+            ),
+            "background_opacity": "{:f}".format(job["background_opacity"]),
+        }
+
+    return _make_build_node(
+        work_dir=work_dir,
+        manifest=manifest,
+        verbose=verbose,
+        what="render",
+        out_path=dst_path,
+        deps=deps,
+        inputs=inputs,
+        func=run_png_render_job,
+        job=lambda: job,
+        cache=cache,
+        tool="inkscape",
+        num_bytes=lambda: _num_bytes_of_first_file(
+            src_svg_path,
+            os.path.join(work_dir, "slides", slide, "layers.svg"),
+        ),
+    )
+
+
+def _resources_digest(work_dir, manifest, hrefs, base_dir):
+    """
+    Returns one hash over the files the `hrefs` point to, including the
+    files which referenced SVGs point to in turn. A file which does not
+    exist counts as well, so it is noticed when it shows up. The paths are
+    relative to `base_dir`, so the hash does not depend on where the
+    presentation is, see build_cache.
+
+    The files in the build dir which are copies of resources are hashed
+    from their sources, see _source_of_copy(). So the hash is the same
+    before the resources are copied, e.g. in a dry run.
+    """
+    digests = {}
+    stack = [(href, base_dir) for href in hrefs]
+    while len(stack) > 0:
+        href, href_base_dir = stack.pop()
+        path = inkscape.href_to_path(href=href, base_dir=href_base_dir)
+        if path is None or path in digests:
+            continue
+        src_path = _source_of_copy(work_dir=work_dir, path=path)
+        if not os.path.isfile(src_path):
+            digests[path] = None
+            continue
+
+        digest = build_manifest.file_digest(manifest, src_path)
+        digests[path] = digest
+
+        if str.lower(os.path.splitext(path)[1]) == ".svg":
+            key = os.path.relpath(src_path, work_dir)
+            nested_hrefs = build_manifest.get_scan(
+                manifest, key=key, digest=digest
+            )
+            if nested_hrefs is None:
+                nested_hrefs = inkscape.find_hrefs_in_svg(path=src_path)
+                build_manifest.record_scan(
+                    manifest, key=key, digest=digest, scan=nested_hrefs
+                )
+            for nested_href in nested_hrefs:
+                stack.append((nested_href, os.path.dirname(path)))
+
+    return build_manifest.hash_json(
+        sorted(
+            [os.path.relpath(path, base_dir), digest]
+            for path, digest in digests.items()
+        )
+    )
+
+
+def _source_of_copy(work_dir, path):
+    """
+    Returns the path of the resource in `work_dir` which the file in `path`
+    in the build dir is a copy of, see _make_copy_resources_node(), or
+    `path` when it is not such a copy.
+    """
+    rel = os.path.relpath(path, os.path.join(work_dir, ".build"))
+    parts = rel.split(os.sep)
+    if parts[0] == "resources":
+        return os.path.join(work_dir, rel)
+    if len(parts) > 3 and parts[0] == "slides" and parts[2] == "resources":
+        return os.path.join(work_dir, rel)
+    return path
+
+
+def _make_composite_node(
+    work_dir,
+    slide,
+    show_layer_set,
+    dst_path,
+    deps,
+    slide_scans,
+    manifest,
+    verbose,
+    cache=None,
+):
+    slide_dir = os.path.dirname(dst_path)
+    state = {}
+
+    def inputs():
+        state["layer_paths"] = [
+            os.path.join(slide_dir, label + ".layer.png")
+            for label in slide_scans[slide]["layers"]
+            if label in show_layer_set
+        ]
+        return {
+            "layers": build_manifest.hash_json(
+                [
+                    build_manifest.file_digest(manifest, p)
+                    for p in state["layer_paths"]
+                ]
+            ),
+        }
+
+    return _make_build_node(
+        work_dir=work_dir,
+        manifest=manifest,
+        verbose=verbose,
+        what="composite",
+        out_path=dst_path,
+        deps=deps,
+        inputs=inputs,
+        func=run_composite_job,
+        job=lambda: {
+            "layer_paths": state["layer_paths"],
+            "dst_jpg_path": dst_path,
+        },
+        cache=cache,
+        cpu_bound=True,
+        tool="pillow",
+    )
+
+
+def _make_pdf_node(
+    work_dir, list_of_image_paths, out_path, deps, manifest, verbose
+):
+    """
+    Assembles the pdf from the images. Only the pages of images which
+    changed are written, see
+    portable_document_format.images_to_pdf_incremental().
+    """
+    state = {}
+
+    def inputs():
+        state["image_digests"] = [
+            build_manifest.file_digest(manifest, image_path)
+            for image_path in list_of_image_paths
+        ]
+        images = [
+            [os.path.relpath(image_path, work_dir), digest]
+            for image_path, digest in zip(
+                list_of_image_paths, state["image_digests"]
+            )
+        ]
+        return {"images": build_manifest.hash_json(images)}
+
+    return _make_build_node(
+        work_dir=work_dir,
+        manifest=manifest,
+        verbose=verbose,
+        what="compile pdf",
+        out_path=out_path,
+        deps=deps,
+        inputs=inputs,
+        func=run_pdf_job,
+        job=lambda: {
+            "list_of_image_paths": list_of_image_paths,
+            "image_digests": state["image_digests"],
+            "out_path": out_path,
+        },
+        report=_report_pdf_job,
+        tool="pillow",
+    )
+
+
+def _report_pdf_job(result):
+    return (
+        f"{result['num_pages_written']:d} pages written, "
+        f"{result['num_pages_reused']:d} reused, "
+        f"peak buffer {result['peak_buffer_bytes'] / 2**20:.1f}MiB"
+    )
+
+
+def run_pdf_job(job):
+    return portable_document_format.images_to_pdf_incremental(
+        list_of_image_paths=job["list_of_image_paths"],
+        image_digests=job["image_digests"],
+        out_path=job["out_path"],
+    )
+
+
+def run_svg_roll_out_job(job):
+    return roll_out_slide(**job)
+
+
+def run_cached_roll_out_job(job):
+    """
+    Like run_cached_job(). The embedded images and the proxies the SVGs
+    link are not in the cache, so the slide is rolled out again when one of
+    them is missing.
+    """
+    out = run_cached_job(job)
+    if out["cache_hit"]:
+        dst_dir = job["job"]["dst_dir"]
+        for href in _linked_build_files(out["result"]):
+            if not os.path.isfile(os.path.join(dst_dir, href)):
+                out["result"] = run_svg_roll_out_job(job["job"])
+                break
+    return out
+
+
+def roll_out_slide(
+    src_svg_path,
+    dst_dir,
+    show_layer_sets,
+    composite_layers=False,
+    strip_hidden_layers=False,
+    embedded_dir=None,
+    proxy_dir=None,
+    slide_format=None,
+):
+    """
+    Roll out all the SVGs needed to render one slide from its 'layers.svg'
+    which is parsed only once. With `strip_hidden_layers`, the hidden layers
+    are left out of the SVGs, see inkscape.write_layers_svg(). With an
+    `embedded_dir`, the images embedded as 'data:' URIs are decoded once
+    into this dir and the SVGs link them, see inkscape.read_layers_svg().
+    With a `proxy_dir`, the SVGs link proxies in this dir of the rasters
+    which have more pixels than they are drawn at in the `slide_format`,
+    see proxies.
+    Returns the labels of all layers in the order of the document, the
+    hrefs in each layer, and the hrefs of the 'embedded' images and of the
+    'proxies', both relative to `dst_dir`.
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    layers_svg = inkscape.read_layers_svg(
+        path=src_svg_path, embedded_dir=embedded_dir
+    )
+    all_layers = layers_svg["layers"]
+    links = {}
+    if proxy_dir is not None:
+        links = _make_proxies(
+            layers_svg=layers_svg,
+            base_dir=os.path.dirname(src_svg_path),
+            proxy_dir=proxy_dir,
+            slide_format=slide_format,
+        )
+
+    for show_layer_set, name in _roll_outs_of_slide(
+        all_layers=all_layers,
+        show_layer_sets=show_layer_sets,
+        composite_layers=composite_layers,
+    ):
+        show_layer_set = set(show_layer_set)
+        inkscape.write_layers_svg(
+            layers_svg=layers_svg,
+            dst=os.path.join(dst_dir, name + ".svg"),
+            show=show_layer_set,
+            hide=set(all_layers).difference(show_layer_set),
+            strip_hidden=strip_hidden_layers,
+            links=links,
+        )
+
+    hrefs = list(layers_svg["hrefs"])
+    out = {"layers": all_layers, "hrefs": hrefs, "embedded": [], "proxies": []}
+    linked = [("embedded", p, la) for _, p, la in layers_svg["embedded"]]
+    for offset, _, labels, _, _, _ in layers_svg["images"]:
+        if offset in links:
+            linked.append(("proxies", links[offset], labels))
+    for what, path, labels in linked:
+        href = os.path.relpath(path, dst_dir)
+        hrefs.append([href, labels])
+        if href not in out[what]:
+            out[what].append(href)
+    return out
+
+
+def _make_proxies(layers_svg, base_dir, proxy_dir, slide_format):
+    """
+    Makes the proxies of the rasters the images in the SVG read by
+    inkscape.read_layers_svg() link. Returns a dict which maps the byte
+    offset of each image with a proxy to the path of its proxy.
+    """
+    if slide_format is None:
+        slide_format = template.deafault_slide_format()
+    if not layers_svg["user_width"]:
+        return {}
+    pixel_per_unit = slide_format["num_pixel_width"] / layers_svg["user_width"]
+
+    links = {}
+    for offset, href, _, width, height, aspect in layers_svg["images"]:
+        path = inkscape.href_to_path(href=href, base_dir=base_dir)
+        if path is None or not proxies.is_raster(path):
+            continue
+        if not os.path.isfile(path):
+            continue
+        proxy_path = proxies.make(
+            src_path=path,
+            drawn_size=(width * pixel_per_unit, height * pixel_per_unit),
+            proxy_dir=proxy_dir,
+            preserve_aspect_ratio=aspect,
+        )
+        if proxy_path is not None:
+            links[offset] = proxy_path
+    return links
+
+
+def roll_out_slide_layers(
+    src_svg_path, show_layer_set, all_layer_set, dst_svg_path
+):
+    show_layer_set = set(show_layer_set)
+    all_layer_set = set(all_layer_set)
+
+    hide_layer_set = all_layer_set.difference(show_layer_set)
+    inkscape.inkscape_svg_export_layers(
+        src=src_svg_path,
+        dst=dst_svg_path,
+        show=show_layer_set,
+        hide=hide_layer_set,
+    )
+
+
+def _roll_outs_of_slide(all_layers, show_layer_sets, composite_layers):
+    """
+    Returns the SVGs to be rolled out for a slide. Each is a tuple of the
+    layers to show and the name of the SVG in the slide's build dir.
+    """
+    if composite_layers:
+        return [
+            ([label], label + ".layer")
+            for label in _layers_to_composite(
+                all_layers=all_layers, show_layer_sets=show_layer_sets
+            )
+        ]
+    else:
+        return [
+            (show_layer_set, str.join(",", list(show_layer_set)))
+            for show_layer_set in show_layer_sets
+        ]
+
+
+def _roll_out_inputs(
+    src_digest, show_layer_set, strip_hidden_layers=False, proxy_inputs=None
+):
+    inputs = {
+        "layers.svg": src_digest,
+        "show_layer_set": str.join(",", list(show_layer_set)),
+    }
+    if strip_hidden_layers:
+        inputs["strip_hidden_layers"] = True
+    if proxy_inputs is not None:
+        inputs["proxies"] = proxy_inputs
+    return inputs
+
+
+def _layers_in_show_layer_sets(show_layer_sets):
+    out = []
+    for show_layer_set in show_layer_sets:
+        for label in show_layer_set:
+            if label not in out:
+                out.append(label)
+    return out
+
+
+def _layers_to_composite(all_layers, show_layer_sets):
+    shown = set()
+    for show_layer_set in show_layer_sets:
+        shown.update(show_layer_set)
+    out = []
+    for label in all_layers:
+        if label in shown and label not in out:
+            out.append(label)
+    return out
+
+
+def run_composite_job(job):
+    composite.alpha_composite_images(
+        paths=job["layer_paths"],
+        out_path=job["dst_jpg_path"],
+    )
+
+
+def run_png_render_job(job):
+    if job.get("inkscape_shell", False):
+        shell = inkscape.get_shell()
+    else:
+        shell = None
+
+    inkscape.inkscape_render(
+        svg_path=job["src_svg_path"],
+        out_path=job["dst_jpg_path"],
+        background_opacity=job["background_opacity"],
+        shell=shell,
+    )
+
+
+def make_notes_nodes(work_dir, todo, manifest, verbose, image_node_keys=None):
+    """
+    Nodes which render the notes below the image of each layer set. When
+    `image_node_keys` is given, the notes of an image wait for the node
+    which makes the image.
+    """
+    build_dir = os.path.join(work_dir, ".build")
+
+    nodes = []
+    for i in range(len(todo)):
+        slide = todo[i]
+        slide_key = slide["slide"]
+        slide_dir = os.path.join(build_dir, "slides", slide_key)
+        for layers_key in slide["notes"]:
+            slide_path = os.path.join(slide_dir, layers_key + ".jpg")
+            slide_with_notes_path = os.path.join(
+                slide_dir, layers_key + ".sn.jpg"
+            )
+
+            if image_node_keys is None:
+                deps = []
+            else:
+                deps = [image_node_keys[slide_path]]
+
+            nodes.append(
+                _make_build_node(
+                    work_dir=work_dir,
+                    manifest=manifest,
+                    verbose=verbose,
+                    what="render notes",
+                    out_path=slide_with_notes_path,
+                    deps=deps,
+                    inputs=_notes_inputs(
+                        manifest=manifest,
+                        slide_path=slide_path,
+                        notes=slide["notes"][layers_key],
+                    ),
+                    func=_run_job_render_note,
+                    job=_constant(
+                        {
+                            "work_dir": work_dir,
+                            "slide_key": slide_key,
+                            "layers_key": layers_key,
+                            "notes": slide["notes"][layers_key],
+                        }
+                    ),
+                    cpu_bound=True,
+                    tool="pillow",
+                )
+            )
+    return nodes
+
+
+def _notes_inputs(manifest, slide_path, notes):
+    def inputs():
+        return {
+            "slide": build_manifest.file_digest(manifest, slide_path),
+            "notes": build_manifest.hash_json(notes),
+        }
+
+    return inputs
+
+
+def _constant(value):
+    return lambda: value
+
+
+def make_latex_nodes(work_dir, todo, manifest, verbose, cache=None):
+    """
+    Returns the nodes which render the latex slides and snippets in the
+    resource dirs, and a dict which maps the key of each node to the paths
+    of its outputs. All the snippets of the build are rendered together in
+    one document, see latex.render_snippets_to_svgs().
+    """
+    nodes = []
+    outputs = {}
+    snippets = []
+    for resource_dir in _resource_dirs(work_dir=work_dir, todo=todo):
+        for src_path in utils.glob(resource_dir, "*.slide.tex"):
+            dst_path = os.path.splitext(src_path)[0] + ".png"
+            node = _make_latex_node(
+                work_dir=work_dir,
+                src_path=src_path,
+                dst_path=dst_path,
+                latex_type="slide",
+                manifest=manifest,
+                verbose=verbose,
+                cache=cache,
+            )
+            nodes.append(node)
+            outputs[node["key"]] = [dst_path]
+
+        for src_path in utils.glob(resource_dir, "*.snippet.tex"):
+            dst_path = os.path.splitext(src_path)[0] + ".svg"
+            snippets.append((src_path, dst_path))
+
+    if len(snippets) > 0:
+        node = _make_latex_snippets_node(
+            work_dir=work_dir,
+            snippets=snippets,
+            fontcolor="white",
+            scale=8.0,
+            width_of_the_document_in_inches=6.5,
+            manifest=manifest,
+            verbose=verbose,
+            cache=cache,
+        )
+        nodes.append(node)
+        outputs[node["key"]] = [dst_path for _, dst_path in snippets]
+    return nodes, outputs
+
+
+def _make_latex_snippets_node(
+    work_dir,
+    snippets,
+    fontcolor,
+    scale,
+    width_of_the_document_in_inches,
+    manifest,
+    verbose,
+    cache=None,
+):
+    """
+    Renders all the `snippets`, a list of tuples of the src_path and the
+    dst_path, which need an update in a single job.
+    """
+    what = "latex render"
+    state = {}
+
+    def inputs(src_path):
+        return {
+            "src": build_manifest.file_digest(manifest, src_path),
+            "fontcolor": fontcolor,
+            "scale": scale,
+            "width": width_of_the_document_in_inches,
+        }
+
+    def plan():
+        state["pending"] = []
+        items = []
+        for src_path, dst_path in snippets:
+            _inputs = inputs(src_path)
+            key = os.path.relpath(dst_path, work_dir)
+            reason = build_manifest.reason_to_update(
+                manifest=manifest, key=key, path=dst_path, inputs=_inputs
+            )
+            if reason is None:
+                continue
+            if verbose:
+                print(f"{what:s}: {dst_path:s} because {reason:s}.")
+            state["pending"].append((key, _inputs))
+            items.append(
+                {
+                    "src_path": src_path,
+                    "dst_path": dst_path,
+                    "cache_key": (
+                        None
+                        if cache is None
+                        else build_cache.make_key(
+                            what=what, inputs=_inputs, names=["output.svg"]
+                        )
+                    ),
+                }
+            )
+        if len(items) == 0:
+            return None
+        return {
+            "items": items,
+            "fontcolor": fontcolor,
+            "scale": scale,
+            "width_of_the_document_in_inches": width_of_the_document_in_inches,
+            "cache": cache,
+            "latex_dirs": _latex_cache_dirs(work_dir=work_dir, cache=cache),
+        }
+
+    def done(result):
+        for key, _inputs in state["pending"]:
+            build_manifest.record(manifest, key=key, inputs=_inputs)
+        if verbose:
+            for dst_path in result["from_cache"]:
+                print(f"{what:s}: {dst_path:s} from cache.")
+
+    return scheduler.make_node(
+        key="latex_snippets:{:s},{:f},{:f}".format(
+            fontcolor, scale, width_of_the_document_in_inches
+        ),
+        plan=plan,
+        func=run_latex_snippets_job,
+        done=done,
+        cat="latex render",
+        tool="pdflatex",
+        num_bytes=lambda: sum(
+            _num_bytes_of_first_file(src_path) for src_path, _ in snippets
+        ),
+    )
+
+
+def run_latex_snippets_job(job):
+    cache = job["cache"]
+    from_cache = []
+    todo = []
+    for item in job["items"]:
+        if cache is not None:
+            hit, _ = build_cache.get(
+                cache,
+                key=item["cache_key"],
+                paths={"output.svg": item["dst_path"]},
+            )
+            if hit:
+                from_cache.append(item["dst_path"])
+                continue
+        todo.append(item)
+
+    latex_strings = []
+    for item in todo:
+        with open(item["src_path"], "rt") as f:
+            latex_strings.append(f.read())
+
+    latex.render_snippets_to_svgs(
+        latex_strings=latex_strings,
+        out_paths=[item["dst_path"] for item in todo],
+        scale=job["scale"],
+        width_of_the_document_in_inches=job["width_of_the_document_in_inches"],
+        fontcolor=job["fontcolor"],
+        **job["latex_dirs"],
+    )
+
+    if cache is not None:
+        for item in todo:
+            build_cache.put(
+                cache,
+                key=item["cache_key"],
+                paths={"output.svg": item["dst_path"]},
+            )
+    return {"from_cache": from_cache}
+
+
+def _latex_cache_dirs(work_dir, cache):
+    """
+    The snippets and formats of latex are kept in the build cache, so they
+    are evicted with it. Without a build cache, snippets are not cached and
+    formats are kept in the build dir.
+    """
+    if cache is None:
+        return {
+            "use_snippet_cache": False,
+            "format_dir": os.path.join(work_dir, ".build", "latex_formats"),
+        }
+    return {
+        "use_snippet_cache": True,
+        "snippet_cache_dir": build_cache.path_of_dir(cache, "latex_snippets"),
+        "format_dir": build_cache.path_of_dir(cache, "latex_formats"),
+    }
+
+
+def _make_latex_node(
+    work_dir, src_path, dst_path, latex_type, manifest, verbose, cache=None
+):
+    job = {}
+    job["src_path"] = src_path
+    job["dst_path"] = dst_path
+    job["fontcolor"] = "white"
+    job["latex_type"] = latex_type
+    state = {}
+
+    def inputs():
+        out = {
+            "src": build_manifest.file_digest(manifest, src_path),
+            "fontcolor": job["fontcolor"],
+        }
+        if latex_type == "slide":
+            out["dir"] = _latex_dir_digest(
+                manifest=manifest, latex_dir=os.path.dirname(src_path)
+            )
+        state["inputs"] = out
+        return out
+
+    def make_job():
+        if latex_type != "slide" or cache is None:
+            return job
+        return dict(
+            job,
+            cache=cache,
+            cache_key=build_cache.make_key(
+                what="latex render", inputs=state["inputs"], names=["pages"]
+            ),
+        )
+
+    return _make_build_node(
+        work_dir=work_dir,
+        manifest=manifest,
+        verbose=verbose,
+        what="latex render",
+        out_path=dst_path,
+        deps=[],
+        inputs=inputs,
+        func=run_latex_render_job,
+        job=make_job,
+        report=_report_latex_job,
+        cache=None if latex_type == "slide" else cache,
+        tool="pdflatex",
+        num_bytes=lambda: _num_bytes_of_first_file(src_path),
+    )
+
+
+def _latex_dir_digest(manifest, latex_dir):
+    """
+    pdflatex runs in the dir of a latex slide, so the slide can include
+    any file in there. Returns one hash over the files in `latex_dir` and
+    below, but not over the images rendered from latex, see
+    latex.is_output(). The paths are relative to `latex_dir`.
+    """
+    digests = []
+    for root, dirs, files in os.walk(latex_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if latex.is_output(path):
+                continue
+            digests.append(
+                [
+                    os.path.relpath(path, latex_dir),
+                    build_manifest.file_digest(manifest, path),
+                ]
+            )
+    return build_manifest.hash_json(digests)
+
+
+def _report_latex_job(result):
+    if result is None:
+        return "done"
+    how = "from cache" if result["cache_hit"] else "rendered"
+    return f"{result['num_pages']:d} pages {how:s}"
+
+
+def run_latex_render_job(job):
+    if job["latex_type"] == "snippet":
+        with open(job["src_path"], "rt") as f:
+            latex_string = f.read()
+
+        latex.render_snippets_to_svgs(
+            latex_strings=[latex_string],
+            out_paths=[job["dst_path"]],
+            fontcolor=job["fontcolor"],
+        )
+
+    elif job["latex_type"] == "slide":
+        return _run_latex_slide_job(job)
+    else:
+        raise AssertionError(f"No such latex_type {job['latex_type']:s}.")
+
+
+def _run_latex_slide_job(job):
+    """
+    Renders the pages of a latex slide, or takes them from the cache when
+    the job has one. The cache holds the number of pages, so the pages
+    which an earlier and longer version left behind are removed on a hit,
+    too.
+    """
+    cache = job.get("cache", None)
+    dst_path = job["dst_path"]
+    if cache is not None:
+        hit, result = build_cache.get(
+            cache,
+            key=job["cache_key"],
+            paths=lambda name: _latex_page_path(dst_path, name),
+        )
+        if hit:
+            latex.remove_stale_pages(
+                out_path=dst_path, num_pages=result["num_pages"]
+            )
+            return {"cache_hit": True, "num_pages": result["num_pages"]}
+
+    out_paths = latex.render_slide_to_png(
+        latex_path=job["src_path"], out_path=dst_path
+    )
+    if cache is not None:
+        build_cache.put(
+            cache,
+            key=job["cache_key"],
+            paths={
+                f"page-{page:d}.png": path
+                for page, path in enumerate(out_paths, start=1)
+            },
+            result={"num_pages": len(out_paths)},
+        )
+    return {"cache_hit": False, "num_pages": len(out_paths)}
+
+
+def _latex_page_path(dst_path, name):
+    """
+    Returns the path of the page `name`, e.g. 'page-2.png', of the latex
+    slide in `dst_path`, or None when `name` is not a page.
+    """
+    match = re.match(r"^page-(\d+)\.png$", name)
+    if match is None or int(match.group(1)) < 1:
+        return None
+    return latex.slide_page_paths(dst_path, int(match.group(1)))[-1]
+
+
+def _run_job_render_note(job):
+    build_dir = os.path.join(job["work_dir"], ".build")
+    slide_dir = os.path.join(build_dir, "slides", job["slide_key"])
+    notes_path = os.path.join(slide_dir, job["layers_key"] + ".notes")
+    notes_render_path = notes_path + ".jpg"
+    utils.write_lines_to_textfile(path=notes_path, lines=job["notes"])
+    notes_text = "\n".join(job["notes"])
+    notes_img.render_text_to_image(
+        path=notes_render_path,
+        text=notes_text,
+    )
+
+    slide_render_path = os.path.join(slide_dir, job["layers_key"] + ".jpg")
+    slide_with_notes_path = os.path.join(
+        slide_dir, job["layers_key"] + ".sn.jpg"
+    )
+
+    notes_img.stack_images(
+        out_path=slide_with_notes_path,
+        input_paths=[slide_render_path, notes_render_path],
+    )
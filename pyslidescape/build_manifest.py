@@ -0,0 +1,133 @@
+"""
+The build manifest records the content hashes of the inputs every output in
+the build directory was made from. An output only needs to be made again when
+one of its inputs changed. Unlike the mtime of a file, the hash does not change
+on a 'git checkout', a 'touch', or an rsync.
+"""
+
+from . import utils
+import hashlib
+import json
+import os
+
+
+def init():
+    return {"files": {}, "outputs": {}, "scans": {}}
+
+
+def path_of_build_dir(build_dir):
+    return os.path.join(build_dir, "manifest.json")
+
+
+def read(path):
+    if not os.path.exists(path):
+        return init()
+    with open(path, "rt") as f:
+        manifest = json.loads(f.read())
+    for key in init():
+        if key not in manifest:
+            manifest[key] = {}
+    return manifest
+
+
+def write(path, manifest, prune=True):
+    """
+    Writes the `manifest` to `path`. With `prune`, the hashes of the files
+    which were not looked at since the manifest was read or last written
+    are dropped, so the manifest does not grow with each file which was
+    renamed or removed.
+    """
+    touched = manifest.pop("touched", set())
+    if prune:
+        manifest["files"] = {
+            memo_key: memo
+            for memo_key, memo in manifest["files"].items()
+            if memo_key in touched
+        }
+    utils.write_dict_to_json(path, manifest, indent=1, sort_keys=True)
+
+
+def hash_bytes(b):
+    return hashlib.sha256(b).hexdigest()
+
+
+def hash_json(obj):
+    return hash_bytes(json.dumps(obj, sort_keys=True).encode())
+
+
+def hash_file(path, block_size=2**20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_digest(manifest, path):
+    """
+    Returns the content hash of the file in `path`.
+    The hash is memorized together with the file's size and mtime, so a file
+    is only read again when its stat changed.
+    """
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    memo_key = os.path.abspath(path)
+    manifest.setdefault("touched", set()).add(memo_key)
+    memo = manifest["files"].get(memo_key, None)
+    if memo is not None and memo["stamp"] == stamp:
+        return memo["digest"]
+    digest = hash_file(path)
+    manifest["files"][memo_key] = {"stamp": stamp, "digest": digest}
+    return digest
+
+
+def reason_to_update(manifest, key, path, inputs):
+    """
+    Returns a str telling why the output in `path` needs to be made again, or
+    None when it is up to date.
+
+    Parameters
+    ----------
+    manifest : dict
+        The build manifest.
+    key : str
+        The key of the output in the manifest.
+    path : str
+        Path to the output.
+    inputs : dict
+        The hashes of the inputs the output is made from now.
+    """
+    if not os.path.exists(path):
+        return "does not exist yet"
+    record = manifest["outputs"].get(key, None)
+    if record is None:
+        return "it is not in the manifest"
+    changed = []
+    for name in sorted(set(inputs).union(set(record))):
+        if inputs.get(name, None) != record.get(name, None):
+            changed.append(name)
+    if len(changed) > 0:
+        return "'{:s}' changed".format(str.join("', '", changed))
+    return None
+
+
+def record(manifest, key, inputs):
+    manifest["outputs"][key] = dict(inputs)
+
+
+def get_scan(manifest, key, digest):
+    """
+    Returns what was found out about the input `key` when its content hash
+    was `digest`, or None when it was not looked into with this content yet.
+    """
+    scan = manifest["scans"].get(key, None)
+    if scan is None or scan["digest"] != digest:
+        return None
+    return scan["scan"]
+
+
+def record_scan(manifest, key, digest, scan):
+    manifest["scans"][key] = {"digest": digest, "scan": scan}
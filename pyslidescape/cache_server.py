@@ -0,0 +1,100 @@
+"""
+A tiny reference of the remote store of the build_cache. It keeps the
+objects in a directory and answers 'GET /objects/<key>' and
+'PUT /objects/<key>'. It has no authentication and is meant to run in a
+trusted network, or to be put behind a proxy which does.
+"""
+
+import http.server
+import os
+import re
+import shutil
+import tempfile
+
+_KEY = re.compile(r"^/objects/([0-9a-f]{64})$")
+
+
+def make_server(store_dir, host="127.0.0.1", port=8765):
+    """
+    Returns a http.server.ThreadingHTTPServer which stores the objects in
+    `store_dir`. Use port=0 to get a free port, see server.server_address.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+
+    class Handler(_Handler):
+        pass
+
+    Handler.store_dir = store_dir
+    return http.server.ThreadingHTTPServer((host, port), Handler)
+
+
+def serve(store_dir, host="127.0.0.1", port=8765):
+    server = make_server(store_dir=store_dir, host=host, port=port)
+    print(f"cache server: {store_dir:s} on http://{host:s}:{port:d}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    store_dir = None
+
+    def _path_of_request(self):
+        match = _KEY.match(self.path)
+        if match is None:
+            return None
+        key = match.group(1)
+        return os.path.join(self.store_dir, key[0:2], key)
+
+    def do_GET(self):
+        path = self._path_of_request()
+        if path is None or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header(
+                "Content-Length", str(os.fstat(f.fileno()).st_size)
+            )
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_PUT(self):
+        path = self._path_of_request()
+        if path is None:
+            self.send_error(404)
+            return
+        length = self.headers.get("Content-Length", None)
+        if length is None:
+            self.send_error(411)
+            return
+        num_bytes = int(length)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=".part"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while num_bytes > 0:
+                    block = self.rfile.read(min(num_bytes, 2**20))
+                    if not block:
+                        break
+                    f.write(block)
+                    num_bytes -= len(block)
+            if num_bytes > 0:
+                os.remove(tmp_path)
+                self.send_error(400, "Body is shorter than Content-Length.")
+                return
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
@@ -0,0 +1,35 @@
+import PIL as pil
+import PIL.Image
+
+
+def alpha_composite_images(
+    paths, out_path, background_color=(255, 255, 255), quality=98
+):
+    """
+    Alpha composite the images in `paths` on top of each other onto a
+    background and write the result to `out_path`. The first image is the
+    bottom most. All images must have the same size.
+
+    :arg  list  paths:  the paths of the images. Each is a str, or a file
+        object.
+    :arg  str  out_path:  path of the output image.
+    :arg  tuple  background_color:  RGB color of the background.
+    :arg  int  quality:  quality of the output when it is a JPEG.
+
+    """
+    assert len(paths) > 0, "Need at least one image to composite."
+
+    out = None
+    for path in paths:
+        with pil.Image.open(path) as img:
+            layer = img.convert("RGBA")
+        if out is None:
+            out = pil.Image.new("RGBA", layer.size, background_color + (255,))
+        assert layer.size == out.size, (
+            f"Expected '{path}' to have size {out.size}, "
+            f"but it has {layer.size}."
+        )
+        out.alpha_composite(layer)
+
+    out = out.convert("RGB")
+    out.save(out_path, quality=quality)
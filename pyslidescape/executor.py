@@ -0,0 +1,205 @@
+"""
+Runs the jobs of a build. Most jobs wait for a program, e.g. inkscape or
+pdflatex, so they run in threads which are cheap to start and which share
+the memory of the main process. The few jobs which compute in
+python, e.g. the alpha compositing of layers, can be sent to a pool of
+processes where they do not contend for the GIL, see apply_async(). The
+processes are spawned, so a script which uses them has to guard its
+entry point with `if __name__ == "__main__":`. By default, an Executor has
+no processes, so the library can be called from any script.
+
+An Executor has the apply_async() of multiprocessing.Pool, so the
+scheduler runs in either. It is a context manager which waits for its jobs
+and shuts its workers down on exit.
+"""
+
+from . import inkscape
+from . import utils
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import threading
+
+
+def default_num_threads():
+    """
+    One thread for each cpu. The programs the threads wait for use about
+    one cpu each.
+    """
+    return max(1, os.cpu_count() or 1)
+
+
+def default_num_processes():
+    """
+    One process for each four cpus. Not the default of an Executor, see
+    above.
+    """
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def init(num_threads=None, num_processes=None):
+    """
+    Returns an Executor. With num_threads == 1 and no processes, it returns
+    a utils.SerialPool which runs each job right away in the calling
+    thread. This is only to ease debugging.
+    """
+    if num_threads == 1 and not num_processes:
+        return utils.SerialPool()
+    return Executor(num_threads=num_threads, num_processes=num_processes)
+
+
+@contextlib.contextmanager
+def use(pool=None, inkscape_shell=False):
+    """
+    Yields the `pool`. When `pool` is None, yields a new Executor which is
+    shut down on exit together with the inkscape shells of its threads.
+    """
+    if pool is not None:
+        yield pool
+        return
+    try:
+        with init() as pool:
+            yield pool
+    finally:
+        if inkscape_shell:
+            inkscape.stop_shells_of_ended_threads()
+
+
+def num_workers(pool, cpu_bound=False):
+    """
+    Returns how many jobs the `pool` runs at the same time. For an
+    Executor with processes and `cpu_bound` jobs, it is the number of its
+    processes.
+    """
+    if isinstance(pool, Executor):
+        if cpu_bound and pool.num_processes > 0:
+            return pool.num_processes
+        return pool.num_threads
+    if isinstance(pool, utils.SerialPool):
+        return 1
+    return getattr(pool, "_processes", 1)
+
+
+class Executor:
+    def __init__(self, num_threads=None, num_processes=None):
+        """
+        Parameters
+        ----------
+        num_threads : int, optional
+            Number of threads for the jobs which wait for programs.
+            Defaults to default_num_threads().
+        num_processes : int, optional
+            Number of processes for the jobs which compute in python, see
+            default_num_processes(). The processes are only started once
+            the first of these jobs comes in. With 0, the default, these
+            jobs run in the threads as well.
+        """
+        if num_threads is None:
+            num_threads = default_num_threads()
+        if num_processes is None:
+            num_processes = 0
+        assert num_threads > 0
+        assert num_processes >= 0
+        self.num_threads = num_threads
+        self.num_processes = num_processes
+        self._threads = concurrent.futures.ThreadPoolExecutor(
+            max_workers=num_threads, thread_name_prefix="pyslidescape"
+        )
+        self._processes = None
+        self._futures = set()
+        self._futures_lock = threading.Lock()
+
+    def apply_async(
+        self,
+        func,
+        args=(),
+        callback=None,
+        error_callback=None,
+        cpu_bound=False,
+    ):
+        """
+        Runs func(*args) in a thread, or in a process when `cpu_bound` and
+        the executor has processes. Then calls `callback` with the result,
+        or `error_callback` with the exception. Both are called from a
+        thread of the executor.
+        """
+        if cpu_bound and self.num_processes > 0:
+            future = self._process_pool().submit(func, *args)
+        else:
+            future = self._threads.submit(func, *args)
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        future.add_done_callback(_make_done_callback(callback, error_callback))
+        return future
+
+    def _forget(self, future):
+        with self._futures_lock:
+            self._futures.discard(future)
+
+    def map(self, func, iterable):
+        return list(self._threads.map(func, iterable))
+
+    def close(self):
+        """
+        Waits for the jobs and shuts the workers down.
+        """
+        self._threads.shutdown(wait=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=True)
+            self._processes = None
+
+    def terminate(self):
+        """
+        Drops the jobs which did not start yet and shuts the workers down
+        once the running jobs are done.
+        """
+        with self._futures_lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        self._threads.shutdown(wait=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=True)
+            self._processes = None
+
+    def _process_pool(self):
+        if self._processes is None:
+            # Forking a process which runs threads can copy locks which are
+            # held by these threads. Spawned processes start clean.
+            self._processes = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.num_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._processes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__:s}("
+            f"num_threads={self.num_threads:d}, "
+            f"num_processes={self.num_processes:d})"
+        )
+
+
+def _make_done_callback(callback, error_callback):
+    def done(future):
+        if future.cancelled():
+            return
+        err = future.exception()
+        if err is not None:
+            if error_callback is not None:
+                error_callback(err)
+        elif callback is not None:
+            callback(future.result())
+
+    return done
@@ -0,0 +1,119 @@
+"""
+Watch the work dir of a presentation and compile it again whenever one of
+its files changed. The pool, the renderers in the pool, the build manifest,
+and the parsed slides.txt and layers.txt files are kept between the builds.
+"""
+
+import os
+import time
+
+HIDDEN_PATHS = [".config.json"]
+
+
+def snapshot(work_dir, ignore_paths=()):
+    """
+    Returns a dict mapping the path of each file in `work_dir`, relative to
+    `work_dir`, to its size and mtime. Hidden files and directories, e.g.
+    '.build', '.git', or the swap files of editors, are skipped as well as
+    unfinished '.part' files and the `ignore_paths`. The hidden files in
+    HIDDEN_PATHS are part of the presentation and are not skipped.
+    """
+    ignore = set(os.path.abspath(p) for p in ignore_paths)
+    out = {}
+    _snapshot(work_dir=work_dir, dir_path=work_dir, ignore=ignore, out=out)
+    for relpath in HIDDEN_PATHS:
+        path = os.path.join(work_dir, relpath)
+        if os.path.abspath(path) in ignore:
+            continue
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        out[relpath] = (st.st_size, st.st_mtime_ns)
+    return out
+
+
+def without(snap, work_dir, ignore_paths):
+    """
+    Returns the snapshot `snap` without the `ignore_paths`.
+    """
+    ignore = set(os.path.relpath(p, work_dir) for p in ignore_paths)
+    return {path: stamp for path, stamp in snap.items() if path not in ignore}
+
+
+def _snapshot(work_dir, dir_path, ignore, out):
+    try:
+        entries = list(os.scandir(dir_path))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.name.startswith(".") or entry.name.endswith(".part"):
+            continue
+        if os.path.abspath(entry.path) in ignore:
+            continue
+        try:
+            if entry.is_dir():
+                _snapshot(
+                    work_dir=work_dir,
+                    dir_path=entry.path,
+                    ignore=ignore,
+                    out=out,
+                )
+            else:
+                st = entry.stat()
+                relpath = os.path.relpath(entry.path, work_dir)
+                out[relpath] = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            continue
+
+
+def changed_paths(before, after):
+    """
+    Returns the sorted paths which were added, removed, or modified from
+    snapshot `before` to snapshot `after`.
+    """
+    out = []
+    for path in set(before).union(set(after)):
+        if before.get(path, None) != after.get(path, None):
+            out.append(path)
+    return sorted(out)
+
+
+def changes_todo(paths):
+    """
+    Returns True when one of the `paths` is read by utils.init_todo(),
+    i.e. the 'slides.txt' or the 'layers.txt' of a slide.
+    """
+    for path in paths:
+        if path == "slides.txt":
+            return True
+        if os.path.basename(path) == "layers.txt":
+            return True
+    return False
+
+
+def wait_for_changes(
+    work_dir, before, ignore_paths, poll_interval=0.25, debounce=0.3
+):
+    """
+    Polls `work_dir` until it differs from the snapshot `before`. Then waits
+    until nothing changed for `debounce` seconds, so that e.g. an editor
+    which saves in several steps causes only one build.
+
+    Returns the new snapshot and the paths which changed.
+    """
+    while True:
+        time.sleep(poll_interval)
+        after = snapshot(work_dir=work_dir, ignore_paths=ignore_paths)
+        if after != before:
+            break
+
+    quiet_since = time.monotonic()
+    while time.monotonic() - quiet_since < debounce:
+        time.sleep(poll_interval)
+        latest = snapshot(work_dir=work_dir, ignore_paths=ignore_paths)
+        if latest != after:
+            after = latest
+            quiet_since = time.monotonic()
+
+    return after, changed_paths(before=before, after=after)
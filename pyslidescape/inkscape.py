@@ -1,7 +1,18 @@
-from xml.dom import minidom
+from . import build_manifest
+from . import composite
+from . import profiling
+from xml.parsers import expat
+import base64
+import io
+import math
+import mimetypes
+import re
 import tempfile
 import os
 import subprocess
+import threading
+import atexit
+import urllib.parse
 
 
 def inkscape_svg_export_layers(src, dst, hide, show):
@@ -14,73 +25,796 @@ def inkscape_svg_export_layers(src, dst, hide, show):
     :arg  list  show:  layers to show. each element is a string.
 
     """
-    with open(src, "rt") as f:
-        svg = minidom.parse(f)
-
-    g_hide = []
-    g_show = []
-    for g in svg.getElementsByTagName("g"):
-        if "inkscape:label" in g.attributes:
-            label = g.attributes["inkscape:label"].value
-            if label in hide:
-                g.attributes["style"] = "display:none"
-                g_hide.append(g)
-            elif label in show:
-                g.attributes["style"] = "display:inline"
-                g_show.append(g)
-
-    with open(dst, "wt") as f:
-        f.write(svg.toxml())
-
-    if False:
-        print(
-            "Hide {0} node(s);  Show {1} node(s).".format(
-                len(g_hide), len(g_show)
+    layers_svg = read_layers_svg(path=src)
+    write_layers_svg(layers_svg=layers_svg, dst=dst, hide=hide, show=show)
+
+
+def read_layers_svg(path, embedded_dir=None, chunk_size=2**20):
+    """
+    Read the SVG in `path` once to export many selections of its layers from
+    it using write_layers_svg(). The SVG is streamed through an expat parser
+    and only the positions of the labelled <g> elements are kept, so memory
+    does not grow with the size of the SVG.
+
+    When an `embedded_dir` is given, each image embedded as a 'data:' URI
+    is decoded and written into it, named by the hash of its content, see
+    write_embedded(). write_layers_svg() then links these files instead of
+    copying the URIs.
+
+    :arg  str  path:  path of the source SVG file.
+    :arg  str  embedded_dir:  directory to write the embedded images to.
+    :arg  int  chunk_size:  number of bytes to read at once.
+
+    Returns a dict with the 'path' and 'size' of the SVG, the 'g_labels',
+    i.e. the byte offset and label of each labelled <g>, the 'g_ends', i.e.
+    the byte offset of the end of each of these, the 'layers', i.e. the
+    labels of all layers in the order of the document, and the 'hrefs',
+    i.e. each href to a file together with the labels of the <g> elements
+    it is in. To strip hidden layers, it also has the 'defs', i.e. the byte
+    offsets and the id of each entry in a <defs>, the 'refs', i.e. each
+    reference to an id together with the labels it is in and the id of the
+    <defs> entry it is in, and the 'ids' which are in labelled <g>
+    elements together with these labels. The 'embedded' images are listed
+    with the byte offset of their element, the path of their file, and the
+    labels they are in. The 'images' which link a file are listed with the
+    byte offset of their element, their href, the labels they are in, the
+    width and height they are drawn at in the user units of the root
+    <svg>, and their 'preserveAspectRatio'. Images whose drawn size is not
+    known, e.g. those in a <defs> or a clone, are not listed. The width of
+    the root <svg> in its user units is in 'user_width'.
+    """
+    g_labels = []
+    g_ends = []
+    layers = []
+    hrefs = []
+    defs = []
+    refs = []
+    ids = {}
+    embedded = []
+    images = []
+    user_width = [None]
+    labels_stack = []
+    frames = []
+    parser = expat.ParserCreate()
+
+    def start_element(name, attrs):
+        frame = {"name": name, "g": None, "defs": None, "id": attrs.get("id")}
+        if len(frames) == 0:
+            frame["linear"] = (1.0, 0.0, 0.0, 1.0)
+            if name == "svg":
+                user_width[0] = _user_width_of_svg(attrs)
+        else:
+            frame["linear"] = frames[-1]["linear"]
+            if frames[-1]["linear"] is None or name in _NO_DRAWN_SIZE:
+                frame["linear"] = None
+        if frame["linear"] is not None and "transform" in attrs:
+            frame["linear"] = _compose_linear(
+                frame["linear"], _linear_of_transform(attrs["transform"])
             )
+        label = None
+        if name == "g" and "inkscape:label" in attrs:
+            label = attrs["inkscape:label"]
+            frame["g"] = len(g_labels)
+            g_labels.append([parser.CurrentByteIndex, label])
+            g_ends.append(None)
+            if "layer" in attrs.get("id", ""):
+                layers.append(label)
+        labels_stack.append(label)
+        labels = [la for la in labels_stack if la is not None]
+
+        if len(frames) > 0 and frames[-1]["name"] == "defs" and "id" in attrs:
+            frame["defs"] = len(defs)
+            defs.append([parser.CurrentByteIndex, None, attrs["id"]])
+        frames.append(frame)
+        defs_entry = None
+        for f in reversed(frames):
+            if f["defs"] is not None:
+                defs_entry = defs[f["defs"]][2]
+                break
+
+        if "id" in attrs and len(labels) > 0:
+            ids[attrs["id"]] = labels
+        for ref in _refs_of_attributes(attrs):
+            refs.append([ref, labels, defs_entry])
+
+        href = _href_of_attributes(attrs)
+        if href is not None:
+            hrefs.append([href, labels])
+            if name == "image" and frame["linear"] is not None:
+                image = _drawn_image(attrs, frame["linear"])
+                if image is not None:
+                    images.append(
+                        [parser.CurrentByteIndex, href, labels]
+                        + image
+                        + [[f["id"] for f in frames if f["id"]]]
+                    )
+        elif embedded_dir is not None:
+            data_uri = _data_uri_of_attributes(attrs)
+            if data_uri is not None:
+                embedded_path = write_embedded(
+                    data_uri=data_uri, embedded_dir=embedded_dir
+                )
+                embedded.append(
+                    [parser.CurrentByteIndex, embedded_path, labels]
+                )
+
+    def end_element(name):
+        labels_stack.pop()
+        frame = frames.pop()
+        if frame["g"] is not None:
+            g_ends[frame["g"]] = parser.CurrentByteIndex
+        if frame["defs"] is not None:
+            defs[frame["defs"]][1] = parser.CurrentByteIndex
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    _parse_file(parser=parser, path=path, chunk_size=chunk_size)
+
+    # An image which is cloned, or in a group which is, is drawn at more
+    # than one size.
+    referred = set(ref for ref, _, _ in refs)
+    images = [
+        image[:-1]
+        for image in images
+        if len(referred.intersection(image[-1])) == 0
+    ]
+
+    return {
+        "path": path,
+        "size": os.stat(path).st_size,
+        "g_labels": g_labels,
+        "g_ends": g_ends,
+        "layers": layers,
+        "hrefs": hrefs,
+        "defs": defs,
+        "refs": refs,
+        "ids": ids,
+        "embedded": embedded,
+        "images": images,
+        "user_width": user_width[0],
+    }
+
+
+def find_hrefs_in_svg(path, chunk_size=2**20):
+    """
+    Returns the hrefs to files in the SVG in `path`.
+    """
+    hrefs = []
+    parser = expat.ParserCreate()
+
+    def start_element(name, attrs):
+        href = _href_of_attributes(attrs)
+        if href is not None:
+            hrefs.append(href)
+
+    parser.StartElementHandler = start_element
+    _parse_file(parser=parser, path=path, chunk_size=chunk_size)
+    return hrefs
+
+
+def find_hrefs_shown(layers_svg, hide):
+    """
+    Returns the hrefs of the SVG read by read_layers_svg() which are not in
+    one of the layers to `hide`.
+    """
+    hide = set(hide)
+    out = []
+    for href, labels in layers_svg["hrefs"]:
+        if len(hide.intersection(labels)) == 0:
+            if href not in out:
+                out.append(href)
+    return out
+
+
+def href_to_path(href, base_dir):
+    """
+    Returns the path of the file the `href` points to, or None when it does
+    not point to a local file. Relative hrefs are relative to `base_dir`.
+    """
+    parsed = urllib.parse.urlparse(href)
+    if parsed.scheme not in ("", "file") or len(parsed.path) == 0:
+        return None
+    path = urllib.parse.unquote(parsed.path)
+    return os.path.normpath(os.path.join(base_dir, path))
+
+
+def write_embedded(data_uri, embedded_dir):
+    """
+    Decodes the 'data:' URI and writes its content into `embedded_dir`,
+    named by the hash of the content and with the extension of its media
+    type. The same image in many slides is written only once. Returns the
+    path of the file.
+    """
+    header, _, data = data_uri.partition(",")
+    params = header[len("data:") :].split(";")
+    if params[-1].strip() == "base64":
+        content = base64.b64decode(data)
+    else:
+        content = urllib.parse.unquote_to_bytes(data)
+    ext = mimetypes.guess_extension(params[0].strip()) or ""
+    path = os.path.join(embedded_dir, build_manifest.hash_bytes(content) + ext)
+    if not os.path.exists(path):
+        os.makedirs(embedded_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=embedded_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _data_uri_of_attributes(attrs):
+    for key in ["xlink:href", "href"]:
+        if key in attrs and attrs[key].startswith("data:"):
+            return attrs[key]
+    return None
+
+
+# The user units of elements in these are not the ones of the root <svg>,
+# or they are drawn where they are used.
+_NO_DRAWN_SIZE = {
+    "defs",
+    "symbol",
+    "pattern",
+    "marker",
+    "mask",
+    "clipPath",
+    "svg",
+    "switch",
+}
+
+_LENGTH = re.compile(
+    r"^\s*([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*(px)?\s*$"
+)
+
+
+def _user_units(value):
+    """
+    Returns the number of a length in user units or 'px', or None for other
+    units, e.g. '%' or 'mm'.
+    """
+    if value is None:
+        return None
+    match = _LENGTH.match(value)
+    if match is None:
+        return None
+    return float(match.group(1))
+
+
+def _user_width_of_svg(attrs):
+    view_box = attrs.get("viewBox", "").replace(",", " ").split()
+    if len(view_box) == 4:
+        return float(view_box[2])
+    return _user_units(attrs.get("width", None))
+
+
+def _drawn_image(attrs, linear):
+    """
+    Returns the width and height the image is drawn at, and its
+    'preserveAspectRatio', or None when it has no size in user units.
+    """
+    width = _user_units(attrs.get("width", None))
+    height = _user_units(attrs.get("height", None))
+    if width is None or height is None or width <= 0 or height <= 0:
+        return None
+    a, b, c, d = linear
+    return [
+        width * (a**2 + b**2) ** 0.5,
+        height * (c**2 + d**2) ** 0.5,
+        attrs.get("preserveAspectRatio", "xMidYMid meet"),
+    ]
+
+
+_TRANSFORM = re.compile(
+    r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)"
+)
+
+
+def _linear_of_transform(transform):
+    """
+    Returns the linear part (a, b, c, d) of an SVG 'transform', i.e. without
+    its translation.
+    """
+    linear = (1.0, 0.0, 0.0, 1.0)
+    for name, args in _TRANSFORM.findall(transform):
+        v = [float(x) for x in args.replace(",", " ").split()]
+        if name == "matrix":
+            m = (v[0], v[1], v[2], v[3])
+        elif name == "scale":
+            m = (v[0], 0.0, 0.0, v[1] if len(v) > 1 else v[0])
+        elif name == "rotate":
+            r = math.radians(v[0])
+            m = (math.cos(r), math.sin(r), -math.sin(r), math.cos(r))
+        elif name == "skewX":
+            m = (1.0, 0.0, math.tan(math.radians(v[0])), 1.0)
+        elif name == "skewY":
+            m = (1.0, math.tan(math.radians(v[0])), 0.0, 1.0)
+        else:
+            continue
+        linear = _compose_linear(linear, m)
+    return linear
+
+
+def _compose_linear(m, n):
+    """
+    Returns the linear part of applying `n` first and `m` second.
+    """
+    return (
+        m[0] * n[0] + m[2] * n[1],
+        m[1] * n[0] + m[3] * n[1],
+        m[0] * n[2] + m[2] * n[3],
+        m[1] * n[2] + m[3] * n[3],
+    )
+
+
+def _href_of_attributes(attrs):
+    for key in ["xlink:href", "href"]:
+        if key in attrs:
+            href = attrs[key]
+            if href.startswith("#") or href.startswith("data:"):
+                return None
+            return href
+    return None
+
+
+_URL_REFERENCE = re.compile(r"url\(\s*['\"]?#([^)'\"\s]+)")
+
+
+def _refs_of_attributes(attrs):
+    """
+    Returns the ids the attributes refer to, i.e. '#id' hrefs and 'url(#id)'
+    in any value, e.g. in fill, clip-path, or style.
+    """
+    out = []
+    for key, value in attrs.items():
+        if key in ("xlink:href", "href") and value.startswith("#"):
+            out.append(value[1:])
+        elif "url(" in value:
+            out += _URL_REFERENCE.findall(value)
+    return out
+
+
+def _parse_file(parser, path, chunk_size):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            parser.Parse(chunk, len(chunk) == 0)
+            if len(chunk) == 0:
+                break
+
+
+def write_layers_svg(
+    layers_svg,
+    dst,
+    hide,
+    show,
+    strip_hidden=False,
+    links=None,
+    chunk_size=2**20,
+):
+    """
+    Export selected layers of the SVG read by read_layers_svg() to the file
+    `dst`. Only the 'style' of the labelled <g> elements is changed. All
+    other bytes are copied as they are.
+
+    When `strip_hidden` is True, the labelled <g> elements to hide are left
+    out together with the entries in <defs> which only these referred to.
+    So inkscape does not parse them and does not load the images they
+    link. A <g> which holds an element the rest of the SVG refers to, e.g.
+    by a clone, is hidden instead.
+
+    The 'data:' URIs of the images which read_layers_svg() wrote into its
+    `embedded_dir` are replaced by hrefs to these files. So are the hrefs
+    of the elements in `links`.
+
+    :arg  dict  layers_svg:  the SVG read by read_layers_svg().
+    :arg  str   dst:  path to export SVG file.
+    :arg  list  hide:  layers to hide. each element is a string.
+    :arg  list  show:  layers to show. each element is a string.
+    :arg  bool  strip_hidden:  leave out the layers to hide.
+    :arg  dict  links:  maps the byte offset of an element to the path of
+        the file it shall link instead.
+    :arg  int  chunk_size:  number of bytes to copy at once.
+
+    """
+    src = layers_svg["path"]
+    assert (
+        os.stat(src).st_size == layers_svg["size"]
+    ), f"Expected '{src:s}' to not change after it was read."
+
+    edits = []
+    if strip_hidden:
+        strip, strip_defs = _what_to_strip(layers_svg=layers_svg, hide=hide)
+    else:
+        strip, strip_defs = set(), set()
+    for (offset, label), end in zip(
+        layers_svg["g_labels"], layers_svg["g_ends"]
+    ):
+        if label in strip:
+            edits.append((offset, end, None))
+        elif label in hide:
+            edits.append((offset, None, _set_style(b"display:none")))
+        elif label in show:
+            edits.append((offset, None, _set_style(b"display:inline")))
+    for offset, end, _id in layers_svg["defs"]:
+        if _id in strip_defs:
+            edits.append((offset, end, None))
+    links = {} if links is None else dict(links)
+    for offset, embedded_path, _ in layers_svg.get("embedded", []):
+        links[offset] = embedded_path
+    for offset, path in links.items():
+        href = os.path.relpath(path, os.path.dirname(dst) or ".")
+        edits.append((offset, None, _set_href(href)))
+    edits.sort(key=lambda edit: edit[0])
+
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for offset, end, rewrite in edits:
+            if offset < fin.tell():
+                continue  # inside of an element which was left out.
+            _copy_bytes(fin, fout, offset - fin.tell(), chunk_size)
+            tag = _read_start_tag(fin)
+            if rewrite is not None:
+                fout.write(rewrite(tag))
+            elif not tag.endswith(b"/>"):
+                fin.seek(end)
+                _read_end_tag(fin)
+        _copy_bytes(fin, fout, None, chunk_size)
+
+
+def _what_to_strip(layers_svg, hide):
+    """
+    Returns the labels of the <g> elements to leave out, and the ids of the
+    entries in <defs> to leave out.
+    """
+    hide = set(hide)
+    ids = layers_svg["ids"]
+    refs = layers_svg["refs"]
+    strip = set(la for _, la in layers_svg["g_labels"] if la in hide)
+
+    while True:
+        kept = _refs_closure(
+            refs, lambda labels: len(strip.intersection(labels)) == 0
+        )
+        needed = set()
+        for ref in kept:
+            needed.update(strip.intersection(ids.get(ref, [])))
+        if len(needed) == 0:
+            break
+        strip.difference_update(needed)
+
+    stripped = _refs_closure(
+        refs, lambda labels: len(strip.intersection(labels)) > 0
+    )
+    defs_ids = set(_id for _, _, _id in layers_svg["defs"])
+    return strip, defs_ids.intersection(stripped).difference(kept)
+
+
+def _refs_closure(refs, is_root):
+    """
+    Returns the ids referred to by the refs outside of <defs> whose labels
+    are `is_root`, and by the entries in <defs> these refer to in turn.
+    """
+    in_defs = {}
+    out = set()
+    stack = []
+    for ref, labels, defs_entry in refs:
+        if defs_entry is None:
+            if is_root(labels):
+                stack.append(ref)
+        else:
+            in_defs.setdefault(defs_entry, []).append(ref)
+    while len(stack) > 0:
+        ref = stack.pop()
+        if ref in out:
+            continue
+        out.add(ref)
+        stack += in_defs.get(ref, [])
+    return out
+
+
+def _read_end_tag(fin):
+    """
+    Read the end tag which begins at the current position of `fin` up to
+    and including its closing '>'.
+    """
+    tag = bytearray()
+    while not tag.endswith(b">"):
+        chunk = fin.read(1)
+        assert len(chunk) > 0, "Expected the end tag to end."
+        tag += chunk
+    return bytes(tag)
+
+
+def _copy_bytes(fin, fout, num_bytes, chunk_size):
+    while num_bytes is None or num_bytes > 0:
+        if num_bytes is None:
+            n = chunk_size
+        else:
+            n = min(chunk_size, num_bytes)
+        chunk = fin.read(n)
+        if len(chunk) == 0:
+            break
+        fout.write(chunk)
+        if num_bytes is not None:
+            num_bytes -= len(chunk)
+
+
+_START_TAG_TOKEN = re.compile(rb"[\"'>]")
+
+
+def _read_start_tag(fin, chunk_size=2**16):
+    """
+    Read the start tag which begins at the current position of `fin` up to
+    and including its closing '>'. A '>' inside a quoted value does not
+    close the tag. Each byte is scanned once, so a tag with a large value,
+    e.g. an embedded image, is read in linear time.
+    """
+    start = fin.tell()
+    tag = bytearray()
+    quote = None
+    i = 0
+    while True:
+        if quote is not None:
+            j = tag.find(quote, i)
+            if j >= 0:
+                quote = None
+                i = j + 1
+                continue
+        else:
+            match = _START_TAG_TOKEN.search(tag, i)
+            if match is not None and match.group(0) == b">":
+                fin.seek(start + match.end())
+                return bytes(tag[: match.end()])
+            if match is not None:
+                quote = match.group(0)
+                i = match.end()
+                continue
+        i = len(tag)
+        chunk = fin.read(chunk_size)
+        assert len(chunk) > 0, "Expected the start tag to end."
+        tag += chunk
+
+
+_STYLE_ATTRIBUTE = re.compile(rb"(\s)style\s*=\s*(\"[^\"]*\"|'[^']*')")
+
+
+def _set_style_of_start_tag(tag, style):
+    new_attribute = b'style="' + style + b'"'
+    if _STYLE_ATTRIBUTE.search(tag):
+        return _STYLE_ATTRIBUTE.sub(
+            lambda m: m.group(1) + new_attribute, tag, count=1
         )
+    if tag.endswith(b"/>"):
+        return tag[:-2] + b" " + new_attribute + b"/>"
+    return tag[:-1] + b" " + new_attribute + b">"
+
+
+def _set_style(style):
+    return lambda tag: _set_style_of_start_tag(tag, style)
+
+
+_HREF_ATTRIBUTE = re.compile(
+    rb"(\s(?:xlink:)?href\s*=\s*)(\"[^\"]*\"|'[^']*')"
+)
+
+
+def _set_href(href):
+    value = b'"' + urllib.parse.quote(href).encode() + b'"'
+    return lambda tag: _HREF_ATTRIBUTE.sub(lambda m: m.group(1) + value, tag)
 
 
 def find_inkscape_labels_for_layers_in_inkscape_svg(path):
-    inkscape_labels = []
-    with open(path, "rt") as f:
-        svg = minidom.parse(f)
-
-    for g in svg.getElementsByTagName("g"):
-        if "inkscape:label" in g.attributes:
-            if "id" in g.attributes:
-                if "layer" in g.attributes["id"].value:
-                    inkscape_labels.append(
-                        g.attributes["inkscape:label"].value
-                    )
-    return inkscape_labels
+    return read_layers_svg(path=path)["layers"]
 
 
-def inkscape_render(svg_path, out_path, background_opacity=0.0):
-    with tempfile.TemporaryDirectory() as tmp:
-        tmp_image_png = os.path.join(tmp, "image.png")
-        rc_ink = subprocess.call(
+def inkscape_render(svg_path, out_path, background_opacity=0.0, shell=None):
+    """
+    Render the SVG in `svg_path` into the image `out_path`. The PNG of
+    inkscape is read from its stdout. When `out_path` is not a PNG, the PNG
+    is flattened onto a white background and encoded in this process.
+
+    :arg  str  svg_path:  path of the SVG file to render.
+    :arg  str  out_path:  path of the output image.
+    :arg  float  background_opacity:  opacity of the background.
+    :arg  InkscapeShell  shell:  a long living inkscape to do the render. If
+        None, a new inkscape process is started for this render.
+
+    """
+    if shell is None:
+        png = profiling.check_output(
             [
                 "inkscape",
                 "--export-background-opacity={:f}".format(background_opacity),
                 "--export-type={:s}".format("png"),
-                "--export-filename={:s}".format(tmp_image_png),
+                "--export-filename=-",
                 svg_path,
             ]
         )
-        ext = os.path.splitext(out_path)
-        if ext == ".png":
-            os.rename(tmp_image_png, out_path)
-        else:
-            rc_con = subprocess.call(
-                [
-                    "convert",
-                    tmp_image_png,
-                    "-quality",
-                    "98",
-                    "-background",
-                    "white",
-                    "-alpha",
-                    "remove",
-                    out_path,
-                ]
-            )
+    else:
+        # The stdout of the shell is its prompt, so it exports to a file.
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_image_png = os.path.join(tmp, "image.png")
+            with profiling.span(
+                name="inkscape --shell", cat="subprocess", svg_path=svg_path
+            ):
+                shell.render_png(
+                    svg_path=svg_path,
+                    png_path=tmp_image_png,
+                    background_opacity=background_opacity,
+                )
+                profiling.add_program_rss(shell.rss_bytes())
+            with open(tmp_image_png, "rb") as f:
+                png = f.read()
+
+    _, ext = os.path.splitext(out_path)
+    if ext == ".png":
+        with open(out_path, "wb") as f:
+            f.write(png)
+    else:
+        composite.alpha_composite_images(
+            paths=[io.BytesIO(png)], out_path=out_path
+        )
+
+
+class InkscapeShellError(Exception):
+    pass
+
+
+class InkscapeShell:
+    """
+    A long living 'inkscape --shell' which renders one SVG after the other
+    without paying for the startup of inkscape (GTK, fonts) each time.
+    The inkscape is started again when it died, when it rendered
+    `max_num_renders` SVGs, or when its resident memory exceeds
+    `max_rss_bytes`.
+    """
+
+    PROMPT = b"> "
+
+    def __init__(self, max_num_renders=250, max_rss_bytes=2 * 1024**3):
+        assert max_num_renders > 0
+        assert max_rss_bytes > 0
+        self.max_num_renders = max_num_renders
+        self.max_rss_bytes = max_rss_bytes
+        self.process = None
+        self.num_renders = 0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ["inkscape", "--shell"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.num_renders = 0
+        self._read_until_prompt()
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b"quit\n")
+            self.process.stdin.flush()
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def rss_bytes(self):
+        """
+        Resident memory of the inkscape process. Returns 0 when this can not
+        be found out, e.g. on systems without '/proc'.
+        """
+        try:
+            with open(f"/proc/{self.process.pid:d}/status", "rt") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return 1024 * int(str.split(line)[1])
+        except (OSError, ValueError, AttributeError):
+            pass
+        return 0
+
+    def needs_restart(self):
+        if not self.is_alive():
+            return True
+        if self.num_renders >= self.max_num_renders:
+            return True
+        if self.rss_bytes() > self.max_rss_bytes:
+            return True
+        return False
+
+    def render_png(self, svg_path, png_path, background_opacity=0.0):
+        svg_path = os.path.abspath(svg_path)
+        png_path = os.path.abspath(png_path)
+        for path in [svg_path, png_path]:
+            assert (
+                ";" not in path and "\n" not in path
+            ), f"Can not pass path '{path:s}' to inkscape's shell."
+
+        actions = [
+            f"file-open:{svg_path:s}",
+            "export-type:png",
+            f"export-filename:{png_path:s}",
+            f"export-background-opacity:{background_opacity:f}",
+            "export-do",
+            "file-close",
+        ]
+        command = str.join(";", actions) + "\n"
+
+        if os.path.exists(png_path):
+            os.remove(png_path)
+
+        num_attempts = 2
+        for attempt in range(num_attempts):
+            if self.needs_restart():
+                self.stop()
+                self.start()
+            try:
+                self.process.stdin.write(command.encode())
+                self.process.stdin.flush()
+                self._read_until_prompt()
+                self.num_renders += 1
+                break
+            except (OSError, InkscapeShellError) as err:
+                self.stop()
+                if attempt + 1 == num_attempts:
+                    raise InkscapeShellError(
+                        f"Failed to render '{svg_path:s}'."
+                    ) from err
+
+        if not os.path.exists(png_path):
+            raise InkscapeShellError(f"Failed to render '{svg_path:s}'.")
+
+    def _read_until_prompt(self):
+        fd = self.process.stdout.fileno()
+        out = b""
+        while not out.endswith(self.PROMPT):
+            chunk = os.read(fd, 4096)
+            if len(chunk) == 0:
+                raise InkscapeShellError("The inkscape shell died.")
+            out += chunk
+            out = out[-len(self.PROMPT) :]
+        return out
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+
+_shells = {}
+_shells_lock = threading.Lock()
+
+
+def get_shell():
+    """
+    Returns the InkscapeShell of this thread. It is started on first use
+    and reused by all later renders in this thread.
+    """
+    thread = threading.current_thread()
+    with _shells_lock:
+        shell = _shells.get(thread, None)
+        if shell is None:
+            shell = InkscapeShell()
+            _shells[thread] = shell
+            atexit.register(shell.stop)
+    return shell
+
+
+def stop_shells_of_ended_threads():
+    """
+    Stops the InkscapeShells of the threads which ended, e.g. the threads
+    of an executor which was shut down.
+    """
+    with _shells_lock:
+        ended = [t for t in _shells if not t.is_alive()]
+        shells = [_shells.pop(t) for t in ended]
+    for shell in shells:
+        shell.stop()
+        atexit.unregister(shell.stop)
@@ -0,0 +1,119 @@
+"""
+The job history records what the jobs of the past builds needed, i.e. the
+wall time of each job and the peak resident memory of the programs it ran.
+It is kept next to the build manifest in '.build/'. The scheduler
+estimates from it how long a job will take and how much memory it will
+need before it runs the job again, see scheduler.run().
+"""
+
+from . import utils
+import json
+import os
+
+# Estimates for jobs which never ran before, by tool.
+DEFAULT_PEAK_RSS_BYTES = {
+    "inkscape": 512 * 2**20,
+    "pdflatex": 256 * 2**20,
+    "pillow": 256 * 2**20,
+}
+DEFAULT_PEAK_RSS_BYTES_OF_UNKNOWN_TOOL = 64 * 2**20
+DEFAULT_WALL_S = {
+    "inkscape": 2.0,
+    "pdflatex": 1.0,
+    "pillow": 0.5,
+}
+DEFAULT_WALL_S_OF_UNKNOWN_TOOL = 0.1
+
+
+def init():
+    return {"jobs": {}}
+
+
+def path_of_build_dir(build_dir):
+    return os.path.join(build_dir, "job_history.json")
+
+
+def read(path):
+    """
+    Returns the history in `path`, or an empty one when there is none or
+    when it can not be read. A history is only a hint.
+    """
+    try:
+        with open(path, "rt") as f:
+            history = json.loads(f.read())
+    except (OSError, ValueError):
+        return init()
+    for key in init():
+        if key not in history:
+            history[key] = {}
+    return history
+
+
+def write(path, history):
+    utils.write_dict_to_json(path, history, indent=1, sort_keys=True)
+
+
+def record(
+    history, key, tool, wall_s=None, peak_rss_bytes=None, num_bytes=None
+):
+    """
+    Records what the job with `key` needed. The values which are None are
+    kept from before.
+    """
+    job = history["jobs"].get(key, {})
+    job["tool"] = tool
+    for name, value in [
+        ("wall_s", wall_s),
+        ("peak_rss_bytes", peak_rss_bytes),
+        ("num_bytes", num_bytes),
+    ]:
+        if value is not None:
+            job[name] = value
+    history["jobs"][key] = job
+
+
+def estimate_peak_rss_bytes(history, key, tool):
+    """
+    Returns the peak resident memory the job with `key` had the last time it
+    ran. For a new job, returns the largest peak of the jobs of the same
+    `tool`, or the default of the tool.
+    """
+    jobs = history["jobs"]
+    if key in jobs and "peak_rss_bytes" in jobs[key]:
+        return jobs[key]["peak_rss_bytes"]
+    peaks = [
+        j["peak_rss_bytes"]
+        for j in jobs.values()
+        if j["tool"] == tool and "peak_rss_bytes" in j
+    ]
+    if len(peaks) > 0:
+        return max(peaks)
+    return DEFAULT_PEAK_RSS_BYTES.get(
+        tool, DEFAULT_PEAK_RSS_BYTES_OF_UNKNOWN_TOOL
+    )
+
+
+def estimate_wall_s(history, key, tool, num_bytes=None):
+    """
+    Returns the wall time the job with `key` took the last time it ran. For
+    a new job, returns the size of its input `num_bytes` times the seconds
+    per byte of the jobs of the same `tool`. Without such jobs, the default
+    of the tool grows with the size of the input.
+    """
+    jobs = history["jobs"]
+    if key in jobs and "wall_s" in jobs[key]:
+        return jobs[key]["wall_s"]
+    same_tool = [
+        j for j in jobs.values() if j["tool"] == tool and "wall_s" in j
+    ]
+    if num_bytes is not None:
+        sized = [j for j in same_tool if j.get("num_bytes", 0) > 0]
+        if len(sized) > 0:
+            wall_s = sum(j["wall_s"] for j in sized)
+            return num_bytes * wall_s / sum(j["num_bytes"] for j in sized)
+    if len(same_tool) > 0:
+        return sum(j["wall_s"] for j in same_tool) / len(same_tool)
+    wall_s = DEFAULT_WALL_S.get(tool, DEFAULT_WALL_S_OF_UNKNOWN_TOOL)
+    if num_bytes is not None:
+        wall_s *= 1.0 + num_bytes / 2**20
+    return wall_s
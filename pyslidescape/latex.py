@@ -1,6 +1,12 @@
+from . import build_cache
+from . import profiling
+import hashlib
+import json
 import os
+import re
 import subprocess
 import tempfile
+import threading
 import shutil
 import svgutils
 
@@ -8,44 +14,120 @@ import svgutils
 def render_slide_to_png(
     latex_path, out_path=None, num_pixel_width=1920, num_pixel_height=1080
 ):
+    """
+    Renders each page of the latex slide in `latex_path` into a png image
+    with one run of pdflatex and one of pdftoppm.
+
+    pdflatex runs in the dir of `latex_path`, so the slide can include files
+    relative to it, but writes its pdf, aux, and log into a temporary dir.
+    So nothing in the source tree is touched but the images, and many
+    slides, or an editor's own latex run, do not collide.
+
+    The first page goes to `out_path`, default is `latex_path` with '.png'.
+    The other pages go next to it, see slide_page_paths(). The images of
+    pages which the slide does not have anymore are removed.
+
+    Returns the paths of the images.
+    """
     assert num_pixel_width > 0
     assert num_pixel_height > 0
     src_path, tex_ext = os.path.splitext(latex_path)
-    cwd = os.path.dirname(src_path)
-    latex_basename = os.path.basename(latex_path)
     assert tex_ext == ".tex"
-    pdf_path = src_path + ".pdf"
-    aux_path = src_path + ".aux"
-    log_path = src_path + ".log"
-    png_path = src_path + ".png"
-    assert not os.path.exists(
-        pdf_path
-    ), f"Did not expect the pdf '{pdf_path:s}' to exist. I stop here to not overwrite the existing pdf."
-
     assert os.path.isfile(latex_path)
-    safe_sub_call(["pdflatex", latex_basename], cwd=cwd)
-    os.remove(aux_path)
-    os.remove(log_path)
-
-    pdftoppm_call = [
-        "pdftoppm",
-        "-scale-to-x",
-        f"{num_pixel_width:d}",
-        "-scale-to-y",
-        f"{num_pixel_height:d}",
-        "-f",
-        "1",
-        "-png",
-        pdf_path,
-        png_path,
-    ]
-    safe_sub_call(pdftoppm_call)
-    out_file_written_by_pdftoppm = png_path + "-1.png"
-    os.rename(out_file_written_by_pdftoppm, png_path)
-    os.remove(pdf_path)
-
-    if out_path is not None:
-        os.rename(png_path, out_path)
+    if out_path is None:
+        out_path = src_path + ".png"
+    cwd = os.path.dirname(latex_path) or os.curdir
+
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-latex-") as tmp_dir:
+        safe_sub_call(
+            [
+                "pdflatex",
+                "-interaction=nonstopmode",
+                "-halt-on-error",
+                f"-output-directory={tmp_dir:s}",
+                os.path.basename(latex_path),
+            ],
+            cwd=cwd,
+        )
+        pdf_path = os.path.join(tmp_dir, os.path.basename(src_path) + ".pdf")
+        pdftoppm_call = [
+            "pdftoppm",
+            "-scale-to-x",
+            f"{num_pixel_width:d}",
+            "-scale-to-y",
+            f"{num_pixel_height:d}",
+            "-png",
+            pdf_path,
+            os.path.join(tmp_dir, "page"),
+        ]
+        safe_sub_call(pdftoppm_call)
+
+        # pdftoppm pads the page numbers with zeros depending on the number
+        # of pages, e.g. 'page-1.png' or 'page-01.png'.
+        pages = {}
+        for name in os.listdir(tmp_dir):
+            match = re.match(r"^page-(\d+)\.png$", name)
+            if match:
+                pages[int(match.group(1))] = os.path.join(tmp_dir, name)
+        num_pages = len(pages)
+        assert sorted(pages) == list(range(1, num_pages + 1))
+
+        out_paths = slide_page_paths(out_path=out_path, num_pages=num_pages)
+        for page, page_out_path in zip(sorted(pages), out_paths):
+            tmp_out_path = (
+                page_out_path
+                + f".{os.getpid():d}.{threading.get_ident():d}.part"
+            )
+            shutil.move(pages[page], tmp_out_path)
+            os.replace(tmp_out_path, page_out_path)
+
+    remove_stale_pages(out_path=out_path, num_pages=num_pages)
+    return out_paths
+
+
+def remove_stale_pages(out_path, num_pages):
+    """
+    Removes the images of the pages after `num_pages` which an earlier and
+    longer version of the slide left behind, see slide_page_paths().
+    """
+    stale_page = num_pages + 1
+    while True:
+        stale_path = slide_page_paths(out_path, stale_page)[-1]
+        if not os.path.exists(stale_path):
+            break
+        os.remove(stale_path)
+        stale_page += 1
+
+
+def slide_page_paths(out_path, num_pages):
+    """
+    Returns the paths of the images of the pages of a latex slide. The first
+    page is `out_path`, e.g. 'a.slide.png', and page k > 1 is
+    'a.slide-k.png'.
+    """
+    stem, ext = os.path.splitext(out_path)
+    out = []
+    for page in range(1, num_pages + 1):
+        if page == 1:
+            out.append(out_path)
+        else:
+            out.append(f"{stem:s}-{page:d}{ext:s}")
+    return out
+
+
+def is_output(path):
+    """
+    Returns True when the file in `path` is an image which is rendered
+    from a latex slide or snippet next to it, e.g. 'a.slide.png',
+    'a.slide-2.png', or 'b.snippet.svg', or a part of one being written.
+    """
+    match = re.match(
+        r"^(.*\.slide)(-\d+)?\.png(\..*\.part)?$|^(.*\.snippet)\.svg$", path
+    )
+    if match is None:
+        return False
+    stem = match.group(1) or match.group(4)
+    return os.path.isfile(stem + ".tex")
 
 
 def render_snippet_to_svg(
@@ -55,20 +137,13 @@ def render_snippet_to_svg(
     width_of_the_document_in_inches=6.5,
     TMP_DIR=None,
     fontcolor=None,
+    format_dir=None,
 ):
-    doc = ""
-    doc += "\\documentclass{{article}}\n"
-    doc += "\\pagestyle{empty}\n"
-    doc += "\\usepackage{amsmath,amssymb,amsfonts,amsthm}\n"
-    doc += "\\usepackage{booktabs}\n"
-    doc += "\\usepackage{xcolor}\n"
-    doc += usepackage_geometry(total=[width_of_the_document_in_inches, 8.75])
-    doc += "\n"
-    if fontcolor is not None:
-        doc += "\\color{" + fontcolor + "}\n"
-    doc += "\\begin{document}\n"
-    doc += "\n{:s}\n\n".format(latex_string)
-    doc += "\\end{document}\n"
+    doc = make_snippet_document(
+        latex_strings=[latex_string],
+        width_of_the_document_in_inches=width_of_the_document_in_inches,
+        fontcolor=fontcolor,
+    )
 
     with tempfile.TemporaryDirectory(prefix="pyslidescape-latex-") as tmp_dir:
         if TMP_DIR is not None:
@@ -77,43 +152,368 @@ def render_snippet_to_svg(
         with open(os.path.join(tmp_dir, "snip.tex"), "wt") as f:
             f.write(doc)
 
-        safe_sub_call(["pdflatex", "snip.tex"], cwd=tmp_dir)
+        call_pdflatex_with_format(
+            tex_basename="snip.tex",
+            preamble=make_snippet_preamble(width_of_the_document_in_inches),
+            cwd=tmp_dir,
+            format_dir=format_dir,
+        )
         safe_sub_call(["pdfcrop", "snip.pdf", "snip_crop.pdf"], cwd=tmp_dir)
         safe_sub_call(
             ["pdf2svg", "snip_crop.pdf", "snip_crop.svg"], cwd=tmp_dir
         )
+        scale_svg(
+            src_path=os.path.join(tmp_dir, "snip_crop.svg"),
+            dst_path=out_path,
+            scale=scale,
+        )
+
+
+def render_snippets_to_svgs(
+    latex_strings,
+    out_paths,
+    scale=8.0,
+    width_of_the_document_in_inches=6.5,
+    fontcolor=None,
+    use_snippet_cache=True,
+    snippet_cache_dir=None,
+    format_dir=None,
+):
+    """
+    Renders many snippets which share the same `scale`, width, and
+    `fontcolor` with a single run of pdflatex, pdfcrop and pdf2svg. Each
+    snippet goes on its own page. When the document fails, or when it does
+    not have one page for each snippet, e.g. because a snippet is empty or
+    longer than a page, each snippet is rendered on its own.
+
+    Snippets which were rendered before, no matter where, are taken from
+    the snippet cache in `snippet_cache_dir`, default is 'latex_snippets'
+    in the build_cache.default_dir(), see snippet_key(). Identical snippets
+    are rendered only once. For `format_dir`, see make_format().
+    """
+    assert len(latex_strings) == len(out_paths)
+    if snippet_cache_dir is None:
+        snippet_cache_dir = os.path.join(
+            build_cache.default_dir(), "latex_snippets"
+        )
+
+    unique = {}
+    for latex_string, out_path in zip(latex_strings, out_paths):
+        key = snippet_key(
+            latex_string=latex_string,
+            scale=scale,
+            width_of_the_document_in_inches=width_of_the_document_in_inches,
+            fontcolor=fontcolor,
+        )
+        if key not in unique:
+            unique[key] = {"latex_string": latex_string, "out_paths": []}
+        unique[key]["out_paths"].append(out_path)
+
+    todo = {}
+    for key, snippet in unique.items():
+        cache_path = os.path.join(snippet_cache_dir, key[0:2], key + ".svg")
+        if use_snippet_cache and os.path.isfile(cache_path):
+            os.utime(cache_path)
+            for out_path in snippet["out_paths"]:
+                link_or_copy(src=cache_path, dst=out_path)
+        else:
+            todo[key] = snippet
+
+    _render_snippets_to_svgs(
+        latex_strings=[todo[key]["latex_string"] for key in todo],
+        out_paths=[todo[key]["out_paths"][0] for key in todo],
+        scale=scale,
+        width_of_the_document_in_inches=width_of_the_document_in_inches,
+        fontcolor=fontcolor,
+        format_dir=format_dir,
+    )
+
+    for key, snippet in todo.items():
+        first_out_path = snippet["out_paths"][0]
+        for out_path in snippet["out_paths"][1:]:
+            link_or_copy(src=first_out_path, dst=out_path)
+        if use_snippet_cache:
+            cache_path = os.path.join(
+                snippet_cache_dir, key[0:2], key + ".svg"
+            )
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            link_or_copy(src=first_out_path, dst=cache_path)
+
 
-        _svg = svgutils.transform.fromfile(
-            os.path.join(tmp_dir, "snip_crop.svg")
+def snippet_key(
+    latex_string, scale, width_of_the_document_in_inches, fontcolor
+):
+    """
+    Returns the hash of everything a snippet's svg depends on, i.e. not on
+    the path of its '.snippet.tex'.
+    """
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "latex_string": latex_string,
+                "scale": float(scale),
+                "width": float(width_of_the_document_in_inches),
+                "fontcolor": fontcolor,
+                "preamble": make_snippet_preamble(
+                    width_of_the_document_in_inches
+                ),
+            },
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+
+def _render_snippets_to_svgs(
+    latex_strings,
+    out_paths,
+    scale,
+    width_of_the_document_in_inches,
+    fontcolor,
+    format_dir,
+):
+    if len(latex_strings) == 0:
+        return
+    if len(latex_strings) == 1:
+        ok = False
+    else:
+        ok = _render_snippets_in_one_document(
+            latex_strings=latex_strings,
+            out_paths=out_paths,
+            scale=scale,
+            width_of_the_document_in_inches=width_of_the_document_in_inches,
+            fontcolor=fontcolor,
+            format_dir=format_dir,
         )
-        originalSVG = svgutils.compose.SVG(
-            os.path.join(tmp_dir, "snip_crop.svg")
+    if not ok:
+        for latex_string, out_path in zip(latex_strings, out_paths):
+            render_snippet_to_svg(
+                latex_string=latex_string,
+                out_path=out_path,
+                scale=scale,
+                width_of_the_document_in_inches=(
+                    width_of_the_document_in_inches
+                ),
+                fontcolor=fontcolor,
+                format_dir=format_dir,
+            )
+
+
+def _render_snippets_in_one_document(
+    latex_strings,
+    out_paths,
+    scale,
+    width_of_the_document_in_inches,
+    fontcolor,
+    format_dir,
+):
+    doc = make_snippet_document(
+        latex_strings=latex_strings,
+        width_of_the_document_in_inches=width_of_the_document_in_inches,
+        fontcolor=fontcolor,
+    )
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-latex-") as tmp_dir:
+        with open(os.path.join(tmp_dir, "snip.tex"), "wt") as f:
+            f.write(doc)
+        try:
+            call_pdflatex_with_format(
+                tex_basename="snip.tex",
+                preamble=make_snippet_preamble(
+                    width_of_the_document_in_inches
+                ),
+                cwd=tmp_dir,
+                format_dir=format_dir,
+            )
+            safe_sub_call(
+                ["pdfcrop", "snip.pdf", "snip_crop.pdf"], cwd=tmp_dir
+            )
+            safe_sub_call(
+                ["pdf2svg", "snip_crop.pdf", "snip_crop-%d.svg", "all"],
+                cwd=tmp_dir,
+            )
+        except Exception:
+            return False
+
+        page_paths = [
+            os.path.join(tmp_dir, f"snip_crop-{i + 1:d}.svg")
+            for i in range(len(latex_strings))
+        ]
+        too_many = os.path.join(
+            tmp_dir, f"snip_crop-{len(page_paths) + 1:d}.svg"
         )
-        originalSVG.scale(scale)
-        h_val, h_unit = split_unit_str(_svg.height)
-        w_val, w_unit = split_unit_str(_svg.width)
-        figure = svgutils.compose.Figure(
-            "{:f}{:s}".format(w_val * scale, w_unit),
-            "{:f}{:s}".format(h_val * scale, h_unit),
-            originalSVG,
+        if not all(os.path.isfile(p) for p in page_paths):
+            return False
+        if os.path.exists(too_many):
+            return False
+
+        for page_path, out_path in zip(page_paths, out_paths):
+            scale_svg(src_path=page_path, dst_path=out_path, scale=scale)
+    return True
+
+
+def make_snippet_document(
+    latex_strings, width_of_the_document_in_inches=6.5, fontcolor=None
+):
+    """
+    Returns the latex document with each of the `latex_strings` on its own
+    page.
+    """
+    doc = make_snippet_preamble(width_of_the_document_in_inches)
+    doc += "\\begin{document}\n"
+    if fontcolor is not None:
+        doc += "\\color{" + fontcolor + "}\n"
+    for i, latex_string in enumerate(latex_strings):
+        if i > 0:
+            doc += "\\clearpage\n"
+        doc += "\n{:s}\n\n".format(latex_string)
+    doc += "\\end{document}\n"
+    return doc
+
+
+def make_snippet_preamble(width_of_the_document_in_inches=6.5):
+    """
+    Returns the preamble of the snippet documents. It does not depend on
+    the snippets, so it can be precompiled, see call_pdflatex_with_format().
+    """
+    doc = ""
+    doc += "\\documentclass{{article}}\n"
+    doc += "\\pagestyle{empty}\n"
+    doc += "\\usepackage{amsmath,amssymb,amsfonts,amsthm}\n"
+    doc += "\\usepackage{booktabs}\n"
+    doc += "\\usepackage{xcolor}\n"
+    doc += usepackage_geometry(total=[width_of_the_document_in_inches, 8.75])
+    doc += "\n"
+    return doc
+
+
+def call_pdflatex_with_format(tex_basename, preamble, cwd, format_dir=None):
+    """
+    Calls pdflatex on the document `tex_basename` in `cwd` which starts
+    with the `preamble`. The preamble is loaded from a precompiled format
+    instead of being parsed again, see make_format(). Without a format,
+    e.g. when 'mylatexformat' is not installed, pdflatex runs as usual.
+    """
+    fmt_path = make_format(preamble=preamble, format_dir=format_dir)
+    if fmt_path is None:
+        safe_sub_call(["pdflatex", tex_basename], cwd=cwd)
+        return
+    link_or_copy(src=fmt_path, dst=os.path.join(cwd, "preamble.fmt"))
+    safe_sub_call(["pdflatex", "-fmt=preamble", tex_basename], cwd=cwd)
+
+
+def make_format(preamble, format_dir=None):
+    """
+    Returns the path of the format which 'mylatexformat' dumped after
+    reading the `preamble`, or None when it can not be made. The format is
+    kept in `format_dir`, default is 'latex_formats' in the
+    build_cache.default_dir(), under the hash of the preamble and of the
+    version of pdflatex. So a new preamble, or a new installation of TeX,
+    gets a new format. A format which can not be made is not tried again
+    by this process.
+    """
+    if format_dir is None:
+        format_dir = os.path.join(build_cache.default_dir(), "latex_formats")
+    version = pdflatex_version()
+    if version is None:
+        return None
+    key = hashlib.sha256((version + "\n" + preamble).encode()).hexdigest()
+    fmt_path = os.path.join(format_dir, key + ".fmt")
+    if os.path.exists(fmt_path):
+        os.utime(fmt_path)
+        return fmt_path
+    if key in _FAILED_FORMATS:
+        return None
+
+    os.makedirs(format_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-latex-") as tmp_dir:
+        with open(os.path.join(tmp_dir, "preamble.tex"), "wt") as f:
+            f.write(preamble)
+            f.write("\\begin{document}\n\\end{document}\n")
+        try:
+            safe_sub_call(
+                [
+                    "pdflatex",
+                    "-ini",
+                    "-jobname=preamble",
+                    "&pdflatex",
+                    "mylatexformat.ltx",
+                    "preamble.tex",
+                ],
+                cwd=tmp_dir,
+                verbose=False,
+            )
+        except Exception:
+            _FAILED_FORMATS.add(key)
+            return None
+        tmp_fmt_path = (
+            fmt_path + f".{os.getpid():d}.{threading.get_ident():d}.part"
         )
-        figure.save(os.path.join(tmp_dir, "snip_crop_scale.svg"))
-        shutil.move(os.path.join(tmp_dir, "snip_crop_scale.svg"), out_path)
+        shutil.move(os.path.join(tmp_dir, "preamble.fmt"), tmp_fmt_path)
+        os.replace(tmp_fmt_path, fmt_path)
+    return fmt_path
+
+
+_PDFLATEX_VERSION = {}
+_FAILED_FORMATS = set()
+
+
+def pdflatex_version():
+    """
+    Returns what 'pdflatex --version' tells, or None when it fails.
+    Is asked only once per process.
+    """
+    if "version" not in _PDFLATEX_VERSION:
+        try:
+            _PDFLATEX_VERSION["version"] = subprocess.check_output(
+                ["pdflatex", "--version"], stderr=subprocess.DEVNULL
+            ).decode()
+        except (OSError, subprocess.CalledProcessError):
+            _PDFLATEX_VERSION["version"] = None
+    return _PDFLATEX_VERSION["version"]
+
+
+def link_or_copy(src, dst):
+    """
+    Hardlinks `src` to `dst`, or copies it when it can not be linked, e.g.
+    across file systems. An existing `dst` is replaced atomically.
+    """
+    tmp_path = dst + f".{os.getpid():d}.{threading.get_ident():d}.part"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copy(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def scale_svg(src_path, dst_path, scale):
+    _svg = svgutils.transform.fromfile(src_path)
+    originalSVG = svgutils.compose.SVG(src_path)
+    originalSVG.scale(scale)
+    h_val, h_unit = split_unit_str(_svg.height)
+    w_val, w_unit = split_unit_str(_svg.width)
+    figure = svgutils.compose.Figure(
+        "{:f}{:s}".format(w_val * scale, w_unit),
+        "{:f}{:s}".format(h_val * scale, h_unit),
+        originalSVG,
+    )
+    tmp_path = dst_path + ".part"
+    figure.save(tmp_path)
+    shutil.move(tmp_path, dst_path)
 
 
-def safe_sub_call(command, cwd=None):
+def safe_sub_call(command, cwd=None, verbose=True):
     with tempfile.TemporaryDirectory() as tmp_dir:
         tmp_std_path = os.path.join(tmp_dir, "std")
         with open(tmp_std_path, "wb") as f:
-            rc = subprocess.call(
+            rc = profiling.call(
                 command,
                 cwd=cwd,
                 stdout=f,
                 stderr=subprocess.STDOUT,
             )
         if rc != 0:
-            with open(tmp_std_path, "rb") as f:
-                print(f.read())
+            if verbose:
+                with open(tmp_std_path, "rb") as f:
+                    print(f.read())
             cmd_str = str.join(" ", command)
             raise Exception(f"Failed to call '{cmd_str:s}'.")
 
@@ -1,9 +1,340 @@
+from . import build_manifest
 import os
-import img2pdf
+import json
+import PIL as pil
+import PIL.Image
 
 
-def images_to_pdf(list_of_image_paths, out_path):
+def images_to_pdf(list_of_image_paths, out_path, default_dpi=96.0):
+    """
+    Writes the JPEG images in `list_of_image_paths` as the pages of the pdf
+    in `out_path`. The pages are streamed to disk one after the other and
+    each JPEG is copied in blocks without decoding it, so memory does not
+    grow with the number of pages.
+
+    :arg  list  list_of_image_paths:  paths of the JPEG images, one per page.
+    :arg  str  out_path:  path of the pdf.
+    :arg  float  default_dpi:  dpi of images which do not tell their dpi.
+
+    Returns a dict with the number of pages written and the largest
+    number of bytes of an image the writer held in memory at once.
+    """
+    written = _write_pdf(
+        list_of_image_paths=list_of_image_paths,
+        image_digests=[None for p in list_of_image_paths],
+        out_path=out_path,
+        default_dpi=default_dpi,
+    )
+    return {
+        "num_pages_written": len(written["pages"]),
+        "num_pages_reused": 0,
+        "peak_buffer_bytes": written["peak_buffer_bytes"],
+    }
+
+
+def images_to_pdf_incremental(
+    list_of_image_paths, out_path, image_digests=None, default_dpi=96.0
+):
+    """
+    Writes the JPEG images in `list_of_image_paths` as the pages of the pdf
+    in `out_path`. The pdf made before is kept together with a map of its
+    pages in `out_path` + '.json'. Only the pages of images which are new
+    or which changed are appended to the pdf in an incremental update
+    together with a new page tree. Pages which only moved are reused as
+    they are. The pdf is written again from scratch when the map does not
+    fit the pdf, or when more than half of the pdf is unused by now.
+
+    :arg  list  list_of_image_paths:  paths of the JPEG images, one per page.
+    :arg  str  out_path:  path of the pdf.
+    :arg  list  image_digests:  content hashes of the images. Will be made
+        when None.
+    :arg  float  default_dpi:  dpi of images which do not tell their dpi.
+
+    Returns a dict with the number of pages which were written and which
+    were reused, and the largest number of bytes of an image the writer
+    held in memory at once.
+    """
+    if image_digests is None:
+        image_digests = [
+            build_manifest.hash_file(p) for p in list_of_image_paths
+        ]
+    assert len(image_digests) == len(list_of_image_paths)
+
+    state_path = out_path + ".json"
+    state = _read_state(out_path=out_path, state_path=state_path)
+
+    if state is not None:
+        reusable = _pages_by_digest(state["pages"])
+        num_reused_bytes = 0
+        for digest in image_digests:
+            if len(reusable.get(digest, [])) > 0:
+                num_reused_bytes += reusable[digest].pop(0)["num_bytes"]
+        if 2 * num_reused_bytes < state["pdf_size"]:
+            state = None
+
+    if state is None:
+        written = _write_pdf(
+            list_of_image_paths=list_of_image_paths,
+            image_digests=image_digests,
+            out_path=out_path,
+            default_dpi=default_dpi,
+        )
+        pages = written["pages"]
+        num_written = len(pages)
+        next_obj = written["next_obj"]
+        xref = written["xref"]
+        peak_buffer_bytes = written["peak_buffer_bytes"]
+    else:
+        reusable = _pages_by_digest(state["pages"])
+        with open(out_path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            writer = _PdfWriter(
+                f=f, next_obj=state["next_obj"], prev_xref=state["xref"]
+            )
+            pages, num_written = _write_pages(
+                writer=writer,
+                list_of_image_paths=list_of_image_paths,
+                image_digests=image_digests,
+                reusable=reusable,
+                default_dpi=default_dpi,
+            )
+            writer.finish(pages=pages)
+        next_obj = writer.next_obj
+        xref = writer.xref
+        peak_buffer_bytes = writer.peak_buffer_bytes
+
+    state = {
+        "pdf_size": os.stat(out_path).st_size,
+        "next_obj": next_obj,
+        "xref": xref,
+        "pages": pages,
+    }
+    tmp_state_path = state_path + ".part"
+    with open(tmp_state_path, "wt") as f:
+        f.write(json.dumps(state))
+    os.rename(tmp_state_path, state_path)
+
+    return {
+        "num_pages_written": num_written,
+        "num_pages_reused": len(pages) - num_written,
+        "peak_buffer_bytes": peak_buffer_bytes,
+    }
+
+
+_CATALOG_OBJ = 1
+_PAGES_OBJ = 2
+_FIRST_PAGE_OBJ = 3
+
+
+def _write_pdf(list_of_image_paths, image_digests, out_path, default_dpi):
     tmp_path = out_path + ".part"
     with open(tmp_path, "wb") as f:
-        f.write(img2pdf.convert(list_of_image_paths))
+        writer = _PdfWriter(f=f, next_obj=_FIRST_PAGE_OBJ, prev_xref=None)
+        writer.write_header()
+        pages, _ = _write_pages(
+            writer=writer,
+            list_of_image_paths=list_of_image_paths,
+            image_digests=image_digests,
+            reusable={},
+            default_dpi=default_dpi,
+        )
+        writer.write_catalog()
+        writer.finish(pages=pages)
     os.rename(tmp_path, out_path)
+    return {
+        "pages": pages,
+        "next_obj": writer.next_obj,
+        "xref": writer.xref,
+        "peak_buffer_bytes": writer.peak_buffer_bytes,
+    }
+
+
+def _read_state(out_path, state_path):
+    if not os.path.exists(out_path) or not os.path.exists(state_path):
+        return None
+    try:
+        with open(state_path, "rt") as f:
+            state = json.loads(f.read())
+    except ValueError:
+        return None
+    if state.get("pdf_size", None) != os.stat(out_path).st_size:
+        return None
+    return state
+
+
+def _pages_by_digest(pages):
+    out = {}
+    for page in pages:
+        out.setdefault(page["digest"], []).append(page)
+    return out
+
+
+def _write_pages(
+    writer, list_of_image_paths, image_digests, reusable, default_dpi
+):
+    pages = []
+    num_written = 0
+    for image_path, digest in zip(list_of_image_paths, image_digests):
+        if len(reusable.get(digest, [])) > 0:
+            pages.append(reusable[digest].pop(0))
+        else:
+            pages.append(
+                writer.write_jpeg_page(
+                    image_path=image_path,
+                    digest=digest,
+                    default_dpi=default_dpi,
+                )
+            )
+            num_written += 1
+    return pages, num_written
+
+
+class _PdfWriter:
+    """
+    Writes objects to the end of a pdf file and keeps track of their
+    offsets for the cross reference table. The images are copied in blocks,
+    the largest block is kept in `peak_buffer_bytes`.
+    """
+
+    def __init__(self, f, next_obj, prev_xref):
+        self.f = f
+        self.next_obj = next_obj
+        self.prev_xref = prev_xref
+        self.offsets = {}
+        self.xref = None
+        self.peak_buffer_bytes = 0
+
+    def new_obj(self):
+        num = self.next_obj
+        self.next_obj += 1
+        return num
+
+    def begin_obj(self, num):
+        self.offsets[num] = self.f.tell()
+        self.f.write(f"{num:d} 0 obj\n".encode())
+
+    def write_obj(self, num, body):
+        self.begin_obj(num)
+        self.f.write(body.encode())
+        self.f.write(b"\nendobj\n")
+
+    def write_header(self):
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def write_catalog(self):
+        self.write_obj(
+            _CATALOG_OBJ, f"<< /Type /Catalog /Pages {_PAGES_OBJ:d} 0 R >>"
+        )
+
+    def write_jpeg_page(self, image_path, digest, default_dpi):
+        start = self.f.tell()
+        with pil.Image.open(image_path) as img:
+            assert (
+                img.format == "JPEG"
+            ), f"Expected '{image_path:s}' to be JPEG."
+            width, height = img.size
+            mode = img.mode
+            dpi = img.info.get("dpi", (default_dpi, default_dpi))
+        num_bytes = os.stat(image_path).st_size
+
+        dpi_x = dpi[0] if dpi[0] > 0 else default_dpi
+        dpi_y = dpi[1] if dpi[1] > 0 else default_dpi
+        width_pt = width * 72.0 / dpi_x
+        height_pt = height * 72.0 / dpi_y
+
+        decode = ""
+        if mode == "RGB":
+            color_space = "/DeviceRGB"
+        elif mode == "L":
+            color_space = "/DeviceGray"
+        elif mode == "CMYK":
+            color_space = "/DeviceCMYK"
+            decode = " /Decode [1 0 1 0 1 0 1 0]"
+        else:
+            raise AssertionError(f"Unsupported mode {mode:s} of JPEG.")
+
+        image_obj = self.new_obj()
+        self.begin_obj(image_obj)
+        self.f.write(
+            (
+                "<< /Type /XObject /Subtype /Image "
+                f"/Width {width:d} /Height {height:d} "
+                f"/ColorSpace {color_space:s} /BitsPerComponent 8{decode:s} "
+                f"/Filter /DCTDecode /Length {num_bytes:d} >>\nstream\n"
+            ).encode()
+        )
+        with open(image_path, "rb") as fimg:
+            while True:
+                block = fimg.read(2**20)
+                if not block:
+                    break
+                self.peak_buffer_bytes = max(
+                    self.peak_buffer_bytes, len(block)
+                )
+                self.f.write(block)
+        self.f.write(b"\nendstream\nendobj\n")
+
+        content = f"q {width_pt:f} 0 0 {height_pt:f} 0 0 cm /Im0 Do Q"
+        contents_obj = self.new_obj()
+        self.begin_obj(contents_obj)
+        self.f.write(
+            f"<< /Length {len(content):d} >>\nstream\n{content:s}\n".encode()
+        )
+        self.f.write(b"endstream\nendobj\n")
+
+        page_obj = self.new_obj()
+        self.write_obj(
+            page_obj,
+            (
+                f"<< /Type /Page /Parent {_PAGES_OBJ:d} 0 R "
+                f"/MediaBox [0 0 {width_pt:f} {height_pt:f}] "
+                f"/Resources << /XObject << /Im0 {image_obj:d} 0 R >> >> "
+                f"/Contents {contents_obj:d} 0 R >>"
+            ),
+        )
+        return {
+            "digest": digest,
+            "obj": page_obj,
+            "num_bytes": self.f.tell() - start,
+        }
+
+    def finish(self, pages):
+        """
+        Write the page tree, the cross reference section for the objects
+        written by this writer, and the trailer.
+        """
+        kids = str.join(" ", [f"{page['obj']:d} 0 R" for page in pages])
+        self.write_obj(
+            _PAGES_OBJ,
+            f"<< /Type /Pages /Kids [{kids:s}] /Count {len(pages):d} >>",
+        )
+
+        self.xref = self.f.tell()
+        self.f.write(b"xref\n")
+        nums = sorted(self.offsets)
+        if self.prev_xref is None:
+            nums = [0] + nums
+        for subsection in _contiguous_runs(nums):
+            self.f.write(f"{subsection[0]:d} {len(subsection):d}\n".encode())
+            for num in subsection:
+                if num == 0:
+                    self.f.write(b"0000000000 65535 f \n")
+                else:
+                    offset = self.offsets[num]
+                    self.f.write(f"{offset:010d} 00000 n \n".encode())
+
+        trailer = f"/Size {self.next_obj:d} /Root {_CATALOG_OBJ:d} 0 R"
+        if self.prev_xref is not None:
+            trailer += f" /Prev {self.prev_xref:d}"
+        self.f.write(f"trailer\n<< {trailer:s} >>\n".encode())
+        self.f.write(f"startxref\n{self.xref:d}\n%%EOF\n".encode())
+
+
+def _contiguous_runs(nums):
+    runs = []
+    for num in nums:
+        if len(runs) > 0 and runs[-1][-1] + 1 == num:
+            runs[-1].append(num)
+        else:
+            runs.append([num])
+    return runs
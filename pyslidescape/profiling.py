@@ -0,0 +1,243 @@
+"""
+Records what a build spends its time on as Chrome trace events which can be
+loaded into Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+Each event has the wall time, the cpu time and the peak resident memory of
+a job, a stage, or a call of a program. Nothing is recorded unless a thread
+is recording, see record(). The events of the jobs which run in a pool are
+recorded in the worker and handed back with the result of the job, see
+traced_call().
+"""
+
+from . import utils
+import contextlib
+import json
+import os
+import subprocess
+import threading
+import time
+
+_STATE = threading.local()
+
+
+def is_recording():
+    return getattr(_STATE, "events", None) is not None
+
+
+@contextlib.contextmanager
+def record():
+    """
+    Records the events of this thread into the list which is yielded.
+    A record inside of another one does not add its events to the outer
+    one.
+    """
+    previous = getattr(_STATE, "events", None)
+    _STATE.events = []
+    try:
+        yield _STATE.events
+    finally:
+        _STATE.events = previous
+
+
+def add_events(events):
+    if is_recording():
+        _STATE.events += events
+
+
+@contextlib.contextmanager
+def span(name, cat, **args):
+    """
+    Records the wall time, the cpu time of this thread, and the peak
+    resident memory of this process for the code in the with block.
+    """
+    if not is_recording():
+        yield
+        return
+    start_us = _now_us()
+    start_cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        args["cpu_s"] = time.thread_time() - start_cpu
+        args["peak_rss_bytes"] = utils.peak_rss_bytes()
+        _add_complete_event(name=name, cat=cat, start_us=start_us, args=args)
+
+
+def call(command, **kwargs):
+    """
+    Like subprocess.call(). The peak resident memory of the program counts
+    into the job's, see measure_programs(). When recording, the wall time,
+    the cpu time and the peak resident memory of the program are recorded,
+    too.
+    """
+    start_us = _now_us()
+    proc = subprocess.Popen(command, **kwargs)
+    try:
+        return _wait(proc=proc, command=command, start_us=start_us)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+
+
+def check_output(command, **kwargs):
+    """
+    Like subprocess.check_output(), see call().
+    """
+    start_us = _now_us()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, **kwargs)
+    try:
+        with proc.stdout:
+            out = proc.stdout.read()
+        returncode = _wait(proc=proc, command=command, start_us=start_us)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, output=out)
+    return out
+
+
+def _wait(proc, command, start_us):
+    """
+    Waits for the program in `proc`. Where os.wait4() exists, the cpu time
+    and the peak resident memory of the program are taken from its rusage.
+    """
+    args = {"command": str.join(" ", command)}
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(proc.pid, 0)
+        if os.WIFEXITED(status):
+            proc.returncode = os.WEXITSTATUS(status)
+        else:
+            proc.returncode = -os.WTERMSIG(status)
+        args["cpu_s"] = rusage.ru_utime + rusage.ru_stime
+        args["peak_rss_bytes"] = utils.maxrss_to_bytes(rusage.ru_maxrss)
+        add_program_rss(args["peak_rss_bytes"])
+    else:
+        proc.wait()
+    args["returncode"] = proc.returncode
+    if is_recording():
+        _add_complete_event(
+            name=os.path.basename(command[0]),
+            cat="subprocess",
+            start_us=start_us,
+            args=args,
+        )
+    return proc.returncode
+
+
+@contextlib.contextmanager
+def measure_programs():
+    """
+    Yields a dict with the largest peak resident memory of the programs
+    this thread runs in the with block, see call() and add_program_rss().
+    """
+    previous = getattr(_STATE, "programs", None)
+    _STATE.programs = {"peak_rss_bytes": 0}
+    try:
+        yield _STATE.programs
+    finally:
+        _STATE.programs = previous
+
+
+def add_program_rss(rss_bytes):
+    """
+    Counts the resident memory of a program which was not started by
+    call(), e.g. a long living inkscape, into the measure_programs().
+    """
+    programs = getattr(_STATE, "programs", None)
+    if programs is not None:
+        programs["peak_rss_bytes"] = max(programs["peak_rss_bytes"], rss_bytes)
+
+
+def traced_call(job):
+    """
+    Runs job['func'] on job['job'] and returns the result together with its
+    wall time and the peak resident memory of the programs it ran. When
+    job['trace'], the events in a span named job['name'] are returned, too.
+    Meant to be run in the pool, see scheduler.run().
+    """
+    start = time.perf_counter()
+    with measure_programs() as programs:
+        if job.get("trace", True):
+            with record() as events:
+                with span(name=job["name"], cat=job["cat"]):
+                    result = job["func"](job["job"])
+            events = list(events)
+        else:
+            result = job["func"](job["job"])
+            events = []
+    return {
+        "result": result,
+        "events": events,
+        "wall_s": time.perf_counter() - start,
+        "peak_rss_bytes": programs["peak_rss_bytes"],
+    }
+
+
+def write_chrome_trace(path, events):
+    """
+    Writes the `events` into a json file in the Chrome trace event format.
+    The processes are named after their pid, the process which wrote the
+    trace is named 'main'.
+    """
+    pids = sorted(set(event["pid"] for event in events))
+    meta = []
+    for pid in pids:
+        name = "main" if pid == os.getpid() else f"worker {pid:d}"
+        meta.append(
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": 0,
+                "args": {"name": name},
+            }
+        )
+    tmp_path = path + ".part"
+    with open(tmp_path, "wt") as f:
+        f.write(
+            json.dumps(
+                {"traceEvents": meta + events, "displayTimeUnit": "ms"},
+                indent=None,
+            )
+        )
+    os.rename(tmp_path, path)
+
+
+def summarize(events):
+    """
+    Returns a dict which maps the category of the events to the number of
+    events, their sum of wall time and their sum of cpu time in seconds.
+    """
+    out = {}
+    for event in events:
+        if event.get("ph", None) != "X":
+            continue
+        cat = event["cat"]
+        if cat not in out:
+            out[cat] = {"num": 0, "wall_s": 0.0, "cpu_s": 0.0}
+        out[cat]["num"] += 1
+        out[cat]["wall_s"] += 1e-6 * event["dur"]
+        out[cat]["cpu_s"] += event["args"].get("cpu_s", 0.0)
+    return out
+
+
+def _now_us():
+    return time.time_ns() // 1000
+
+
+def _add_complete_event(name, cat, start_us, args):
+    _STATE.events.append(
+        {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": start_us,
+            "dur": _now_us() - start_us,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+    )
@@ -0,0 +1,101 @@
+"""
+Proxies of the raster images which slides link. A photo from a camera has
+many more pixels than it is drawn at on a slide, and inkscape would decode
+it in full for each render only to scale it down. A proxy is the image
+scaled down to the pixels it is drawn at. Proxies are named by the hash of
+their source and their size, so a proxy is only made once.
+"""
+
+from . import build_manifest
+import math
+import os
+import tempfile
+import PIL.Image
+import PIL.ImageOps
+
+EXTENSIONS = [".jpg", ".jpeg", ".png"]
+
+_EXIF_ORIENTATION = 0x0112
+
+
+def is_raster(path):
+    return str.lower(os.path.splitext(path)[1]) in EXTENSIONS
+
+
+def proxy_size(image_size, drawn_size, preserve_aspect_ratio="xMidYMid meet"):
+    """
+    Returns the width and height in pixels of the proxy of an image with
+    `image_size` which is drawn at `drawn_size` pixels, or None when the
+    image is not larger than that. Like SVG, the image keeps its aspect
+    ratio unless `preserve_aspect_ratio` is 'none'.
+    """
+    num_x, num_y = image_size
+    fx = drawn_size[0] / num_x
+    fy = drawn_size[1] / num_y
+    if str.split(preserve_aspect_ratio + " ")[0] != "none":
+        if "slice" in preserve_aspect_ratio:
+            fx = fy = max(fx, fy)
+        else:
+            fx = fy = min(fx, fy)
+    size = (
+        max(1, min(num_x, math.ceil(num_x * fx))),
+        max(1, min(num_y, math.ceil(num_y * fy))),
+    )
+    if size == (num_x, num_y):
+        return None
+    return size
+
+
+def make(src_path, drawn_size, proxy_dir, preserve_aspect_ratio=None):
+    """
+    Writes the proxy of the image in `src_path` which is drawn at
+    `drawn_size` pixels into `proxy_dir`, unless it is there already.
+    JPEGs are decoded at a reduced scale right away. The orientation in the
+    EXIF of the image is applied to the proxy.
+
+    Returns the path of the proxy, or None when the image is not larger
+    than it is drawn.
+    """
+    if preserve_aspect_ratio is None:
+        preserve_aspect_ratio = "xMidYMid meet"
+    with PIL.Image.open(src_path) as image:
+        transposed = image.getexif().get(_EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+        image_size = image.size[::-1] if transposed else image.size
+        size = proxy_size(
+            image_size=image_size,
+            drawn_size=drawn_size,
+            preserve_aspect_ratio=preserve_aspect_ratio,
+        )
+        if size is None:
+            return None
+
+        ext = str.lower(os.path.splitext(src_path)[1])
+        name = build_manifest.hash_json(
+            [build_manifest.hash_file(src_path), list(size)]
+        )
+        path = os.path.join(proxy_dir, name + ext)
+        if os.path.exists(path):
+            return path
+
+        image.draft(image.mode, size[::-1] if transposed else size)
+        proxy = PIL.ImageOps.exif_transpose(image)
+        proxy = proxy.resize(size, PIL.Image.LANCZOS)
+        image_format = image.format
+        icc_profile = image.info.get("icc_profile", None)
+
+    os.makedirs(proxy_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=proxy_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if image_format == "JPEG":
+                proxy.save(
+                    f, format="JPEG", quality=95, icc_profile=icc_profile
+                )
+            else:
+                proxy.save(f, format=image_format, icc_profile=icc_profile)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
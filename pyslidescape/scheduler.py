@@ -0,0 +1,407 @@
+"""
+Runs a graph of jobs in a pool. A job is dispatched as soon as all the jobs
+it depends on are done, so no job waits for a stage of unrelated jobs to
+finish.
+
+A node in the graph is a dict:
+
+    key : str
+        Unique name of the node.
+    deps : list of str
+        The keys of the nodes which must be done before this node.
+    plan : callable, optional
+        Called in the main process once all deps are done. Returns the job
+        (a dict) to be run by `func` in the pool, or None when there is
+        nothing to do. Defaults to a plan which returns node['job'].
+    func : callable, optional
+        Runs the job in the pool. Must be picklable.
+    done : callable, optional
+        Called in the main process with the result of `func`.
+    cat : str
+        The category of the node in the trace, see profiling.
+    cpu_bound : bool
+        Whether `func` computes in python rather than waiting for a
+        program. An executor.Executor runs these jobs in processes.
+    tool : str, optional
+        What the job runs, e.g. 'inkscape'. The number of running jobs can
+        be limited for each tool, see run(). The jobs of a build run one
+        of the TOOLS.
+    num_bytes : callable, optional
+        Returns the size of the input of the job. The wall time of a job
+        which never ran before is estimated from it, see job_history.
+
+No more jobs are dispatched than the pool has workers for, see
+executor.num_workers(). The jobs which can run wait in the scheduler
+instead of in the queue of the pool. With a job history, they are
+dispatched longest first, so a long job which became ready late does not
+set the end of the build while the other workers idle.
+
+When the main thread is recording, see profiling.record(), the planning,
+the job, and the done of each node are recorded.
+"""
+
+from . import executor
+from . import job_history
+from . import profiling
+import queue
+
+TOOLS = ["inkscape", "pdflatex", "pillow"]
+
+
+def make_node(
+    key,
+    deps=(),
+    plan=None,
+    func=None,
+    job=None,
+    done=None,
+    cat="job",
+    cpu_bound=False,
+    tool=None,
+    num_bytes=None,
+):
+    return {
+        "key": key,
+        "deps": list(deps),
+        "plan": plan,
+        "func": func,
+        "job": job,
+        "done": done,
+        "cat": cat,
+        "cpu_bound": cpu_bound,
+        "tool": tool,
+        "num_bytes": num_bytes,
+    }
+
+
+def run(nodes, pool, limits=None, memory_budget_bytes=None, history=None):
+    """
+    Run all `nodes` in the `pool`. Raises the first exception of a job
+    after all jobs which were already dispatched finished.
+
+    Parameters
+    ----------
+    limits : dict, optional
+        Maps a tool to the max number of its jobs which run at the same
+        time, e.g. {"inkscape": 4}.
+    memory_budget_bytes : int, optional
+        A job is only dispatched while the sum of the estimated peak
+        resident memory of the running jobs stays within this budget.
+        When nothing runs, a job is dispatched even when it alone exceeds
+        the budget.
+    history : dict, optional
+        The job history to estimate the wall time and the peak resident
+        memory of the jobs from, see job_history. The jobs which can run
+        are dispatched longest first. The measured wall times and peaks
+        are recorded into it.
+
+    Returns a dict with the result of each node's func, or None for the
+    nodes which had nothing to do.
+    """
+    nodes = {node["key"]: node for node in nodes}
+    num_missing_deps, dependents = _count_deps(nodes)
+    limits = _init_limits(limits)
+    if history is None and memory_budget_bytes is not None:
+        history = job_history.init()
+    tracing = profiling.is_recording()
+    wrapped = tracing or history is not None
+    ready = [key for key in nodes if num_missing_deps[key] == 0]
+    planned = []
+    finished = queue.Queue()
+    results = {}
+    running = {}
+    num_running_of_tool = {}
+    num_running_of_lane = {}
+    error = None
+
+    num_bytes = {}
+    wall_s = {}
+
+    def finish(key, result):
+        results[key] = result
+        for dependent in dependents[key]:
+            num_missing_deps[dependent] -= 1
+            if num_missing_deps[dependent] == 0:
+                ready.append(dependent)
+
+    def estimate(key):
+        if memory_budget_bytes is None:
+            return 0
+        return job_history.estimate_peak_rss_bytes(
+            history, key=key, tool=nodes[key]["tool"]
+        )
+
+    def lane(key):
+        return _is_cpu_bound_in_pool(nodes[key], pool)
+
+    def admit(key, estimate_bytes):
+        cpu_bound = lane(key)
+        num_lane_workers = executor.num_workers(pool, cpu_bound=cpu_bound)
+        if num_running_of_lane.get(cpu_bound, 0) >= num_lane_workers:
+            return False
+        if not _has_free_slot(nodes[key]["tool"], limits, num_running_of_tool):
+            return False
+        if memory_budget_bytes is not None and len(running) > 0:
+            running_bytes = sum(running.values())
+            if running_bytes + estimate_bytes > memory_budget_bytes:
+                return False
+        return True
+
+    def dispatch(key, job):
+        node = nodes[key]
+        func = node["func"]
+        if wrapped:
+            func = profiling.traced_call
+            job = {
+                "name": key,
+                "cat": node.get("cat", "job"),
+                "func": node["func"],
+                "job": job,
+                "trace": tracing,
+            }
+        kwargs = {}
+        if lane(key):
+            kwargs["cpu_bound"] = True
+        pool.apply_async(
+            func,
+            (job,),
+            callback=_put(finished, key, True),
+            error_callback=_put(finished, key, False),
+            **kwargs,
+        )
+
+    while len(results) < len(nodes):
+        while error is None and len(ready) > 0:
+            key = ready.pop(0)
+            node = nodes[key]
+            try:
+                with profiling.span(name=key, cat="plan"):
+                    job = _plan(node)
+            except Exception as err:
+                error = err
+                break
+            if job is None or node["func"] is None:
+                finish(key, None)
+            else:
+                planned.append((key, job))
+                if history is not None:
+                    num_bytes[key] = _num_bytes(node)
+                    wall_s[key] = job_history.estimate_wall_s(
+                        history,
+                        key=key,
+                        tool=node["tool"],
+                        num_bytes=num_bytes[key],
+                    )
+
+        if history is not None:
+            planned.sort(key=lambda item: -wall_s[item[0]])
+
+        i = 0
+        while error is None and i < len(planned):
+            key, job = planned[i]
+            estimate_bytes = estimate(key)
+            if not admit(key, estimate_bytes):
+                i += 1
+                continue
+            planned.pop(i)
+            tool = nodes[key]["tool"]
+            running[key] = estimate_bytes
+            num_running_of_tool[tool] = num_running_of_tool.get(tool, 0) + 1
+            num_running_of_lane[lane(key)] = (
+                num_running_of_lane.get(lane(key), 0) + 1
+            )
+            dispatch(key, job)
+
+        if len(running) == 0:
+            if error is not None:
+                raise error
+            if len(results) == len(nodes):
+                break
+            assert len(ready) > 0, "The graph of jobs has a cycle."
+            continue
+
+        key, ok, result = finished.get()
+        running.pop(key)
+        num_running_of_tool[nodes[key]["tool"]] -= 1
+        num_running_of_lane[lane(key)] -= 1
+        if not ok:
+            if error is None:
+                error = result
+            continue
+        if error is not None:
+            continue
+        node = nodes[key]
+        if wrapped:
+            profiling.add_events(result["events"])
+            if history is not None:
+                job_history.record(
+                    history,
+                    key=key,
+                    tool=node["tool"],
+                    wall_s=result["wall_s"],
+                    peak_rss_bytes=(
+                        result["peak_rss_bytes"]
+                        if result["peak_rss_bytes"] > 0
+                        else None
+                    ),
+                    num_bytes=num_bytes.get(key, None),
+                )
+            result = result["result"]
+        try:
+            if node["done"] is not None:
+                with profiling.span(name=key, cat="done"):
+                    node["done"](result)
+        except Exception as err:
+            error = err
+            continue
+        finish(key, result)
+
+    return results
+
+
+def predict(nodes, num_workers, history, limits=None):
+    """
+    Predicts which jobs a run() of the `nodes` with `num_workers` would run,
+    and when. Nothing is made. A node is planned when none of the nodes it
+    depends on has a job. The nodes which depend on a node with a job are
+    assumed to have a job, too. Nodes without a func are assumed to have
+    nothing to do. The wall times of the jobs are estimated from the job
+    `history` and the jobs are dispatched longest first like in run().
+
+    Returns a dict with the list of 'jobs', each with its 'key', 'tool',
+    estimated 'wall_s', and 'start_s', and the predicted 'wall_s' of the
+    run.
+    """
+    assert num_workers > 0
+    nodes = {node["key"]: node for node in nodes}
+    num_missing_deps, dependents = _count_deps(nodes)
+    limits = _init_limits(limits)
+
+    dirty = set()
+    jobs = {}
+    ready = [key for key in nodes if num_missing_deps[key] == 0]
+    waiting = []
+    running = []
+    num_running_of_tool = {}
+    now_s = 0.0
+    num_finished = 0
+
+    def finish(key):
+        for dependent in dependents[key]:
+            if key in dirty:
+                dirty.add(dependent)
+            num_missing_deps[dependent] -= 1
+            if num_missing_deps[dependent] == 0:
+                ready.append(dependent)
+
+    while num_finished < len(nodes):
+        while len(ready) > 0:
+            key = ready.pop(0)
+            node = nodes[key]
+            if node["func"] is not None and (
+                key in dirty or _plan(node) is not None
+            ):
+                dirty.add(key)
+                jobs[key] = {
+                    "key": key,
+                    "tool": node["tool"],
+                    "wall_s": job_history.estimate_wall_s(
+                        history,
+                        key=key,
+                        tool=node["tool"],
+                        num_bytes=_num_bytes(node),
+                    ),
+                    "start_s": None,
+                }
+                waiting.append(key)
+            else:
+                num_finished += 1
+                finish(key)
+
+        waiting.sort(key=lambda k: -jobs[k]["wall_s"])
+        i = 0
+        while len(running) < num_workers and i < len(waiting):
+            key = waiting[i]
+            tool = nodes[key]["tool"]
+            if not _has_free_slot(tool, limits, num_running_of_tool):
+                i += 1
+                continue
+            waiting.pop(i)
+            jobs[key]["start_s"] = now_s
+            running.append((now_s + jobs[key]["wall_s"], key))
+            num_running_of_tool[tool] = num_running_of_tool.get(tool, 0) + 1
+
+        if len(running) == 0:
+            if num_finished == len(nodes):
+                break
+            assert len(ready) > 0, "The graph of jobs has a cycle."
+            continue
+
+        running.sort()
+        now_s, key = running.pop(0)
+        num_running_of_tool[nodes[key]["tool"]] -= 1
+        num_finished += 1
+        finish(key)
+
+    return {
+        "jobs": sorted(jobs.values(), key=lambda j: (j["start_s"], j["key"])),
+        "wall_s": now_s,
+    }
+
+
+def _count_deps(nodes):
+    num_missing_deps = {}
+    dependents = {key: [] for key in nodes}
+    for key, node in nodes.items():
+        num_missing_deps[key] = len(node["deps"])
+        for dep in node["deps"]:
+            assert (
+                dep in nodes
+            ), f"Node '{key:s}' depends on unknown '{dep:s}'."
+            dependents[dep].append(key)
+    return num_missing_deps, dependents
+
+
+def _init_limits(limits):
+    if limits is None:
+        limits = {}
+    for tool, limit in limits.items():
+        assert limit > 0, f"Expected limit of '{tool}' > 0."
+    return limits
+
+
+def _has_free_slot(tool, limits, num_running_of_tool):
+    if tool not in limits:
+        return True
+    return num_running_of_tool.get(tool, 0) < limits[tool]
+
+
+def _is_cpu_bound_in_pool(node, pool):
+    """
+    Whether the job of the `node` runs in the processes of an
+    executor.Executor rather than in its threads.
+    """
+    return (
+        node.get("cpu_bound", False)
+        and isinstance(pool, executor.Executor)
+        and pool.num_processes > 0
+    )
+
+
+def _num_bytes(node):
+    if node.get("num_bytes", None) is None:
+        return None
+    return node["num_bytes"]()
+
+
+def _plan(node):
+    if node["plan"] is None:
+        return node["job"]
+    return node["plan"]()
+
+
+def _put(finished, key, ok):
+    def put(result):
+        finished.put((key, ok, result))
+
+    return put
@@ -0,0 +1,74 @@
+import os
+import stat
+import sys
+import pytest
+
+FAKE_INKSCAPE = """#!{python:s}
+# A fake inkscape which renders each SVG into a small gray PNG. Its shell
+# dies on an SVG which contains 'CRASH'. Each start is logged.
+import io
+import os
+import sys
+import PIL.Image
+
+
+def png(svg_path):
+    with open(svg_path, "rb") as f:
+        if b"CRASH" in f.read():
+            sys.exit(1)
+    image = PIL.Image.new("RGBA", (64, 36), (128, 128, 128, 255))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+log_path = os.environ.get("FAKE_INKSCAPE_LOG", None)
+if log_path is not None:
+    with open(log_path, "at") as f:
+        f.write(str(os.getpid()) + "\\n")
+
+args = sys.argv[1:]
+if "--shell" in args:
+    out = sys.stdout.buffer
+    out.write(b"> ")
+    out.flush()
+    for line in sys.stdin:
+        line = line.strip()
+        if line == "quit":
+            break
+        actions = dict(
+            str.partition(action, ":")[0::2] for action in line.split(";")
+        )
+        data = png(actions["file-open"])
+        with open(actions["export-filename"], "wb") as f:
+            f.write(data)
+        out.write(b"> ")
+        out.flush()
+    sys.exit(0)
+
+data = png(args[-1])
+filename = [a for a in args if a.startswith("--export-filename=")][0]
+filename = filename.split("=", 1)[1]
+if filename == "-":
+    sys.stdout.buffer.write(data)
+else:
+    with open(filename, "wb") as f:
+        f.write(data)
+"""
+
+
+@pytest.fixture
+def fake_inkscape(tmp_path, monkeypatch):
+    """
+    Puts a fake inkscape on the PATH. Returns the path of the log of its
+    starts.
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    path = bin_dir / "inkscape"
+    path.write_text(FAKE_INKSCAPE.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    log_path = tmp_path / "inkscape.log"
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("FAKE_INKSCAPE_LOG", str(log_path))
+    return log_path
@@ -0,0 +1,44 @@
+import pyslidescape
+import os
+import tempfile
+
+
+def test_make_deck():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        work_dir = os.path.join(tmp, "deck")
+        slides = pyslidescape.benchmark.make_deck(
+            work_dir=work_dir,
+            num_slides=3,
+            num_layers=4,
+            num_layer_sets=2,
+            image_num_pixel_edge=64,
+            num_snippets=2,
+        )
+        assert len(slides) == 3
+
+        with open(os.path.join(work_dir, "slides.txt"), "rt") as f:
+            assert f.read().split() == slides
+
+        slide_dir = os.path.join(work_dir, "slides", slides[0])
+        with open(os.path.join(slide_dir, "layers.txt"), "rt") as f:
+            layer_sets = pyslidescape.layers_txt.loads(f.read())
+        assert len(layer_sets) == 2
+
+        resources = sorted(os.listdir(os.path.join(slide_dir, "resources")))
+        assert resources == [
+            "formula0.snippet.tex",
+            "formula1.snippet.tex",
+            "image.jpg",
+        ]
+
+        with open(os.path.join(slide_dir, "layers.svg"), "rt") as f:
+            before = f.read()
+        pyslidescape.benchmark.edit_slide(work_dir=work_dir, slide=slides[0])
+        with open(os.path.join(slide_dir, "layers.svg"), "rt") as f:
+            after = f.read()
+        assert "Edited at" in after
+        assert len(after) > len(before)
+        labels = pyslidescape.inkscape.find_inkscape_labels_for_layers_in_inkscape_svg(
+            os.path.join(slide_dir, "layers.svg")
+        )
+        assert labels == ["layer0", "layer1", "layer2", "layer3"]
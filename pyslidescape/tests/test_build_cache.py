@@ -0,0 +1,270 @@
+from pyslidescape import build_cache
+from pyslidescape import build_manifest
+from pyslidescape import cache_server
+import http.server
+import os
+import tempfile
+import threading
+import warnings
+import pytest
+
+
+def write(path, payload):
+    with open(path, "wb") as f:
+        f.write(payload)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def server_url():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        server = cache_server.make_server(store_dir=tmp, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        host, port = server.server_address[0:2]
+        yield f"http://{host:s}:{port:d}"
+        server.shutdown()
+        server.server_close()
+
+
+def test_put_and_get():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        cache = build_cache.init(cache_dir=os.path.join(tmp, "cache"))
+        key = build_cache.make_key(what="render", inputs={"svg": "abc"})
+        dst_path = os.path.join(tmp, "out", "a.jpg")
+        hit, _ = build_cache.get(cache, key=key, paths={"o": dst_path})
+        assert not hit
+
+        src_path = os.path.join(tmp, "a.jpg")
+        write(src_path, b"jpeg")
+        build_cache.put(cache, key=key, paths={"o": src_path}, result=[1])
+
+        hit, result = build_cache.get(cache, key=key, paths={"o": dst_path})
+        assert hit
+        assert result == [1]
+        assert read(dst_path) == b"jpeg"
+
+
+def test_key_depends_on_inputs_and_names():
+    a = build_cache.make_key(what="render", inputs={"svg": "a"})
+    b = build_cache.make_key(what="render", inputs={"svg": "b"})
+    c = build_cache.make_key(what="render", inputs={"svg": "a"}, names=["x"])
+    assert len(set([a, b, c])) == 3
+
+
+def test_evict_least_recently_used():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        cache = build_cache.init(
+            cache_dir=os.path.join(tmp, "cache"), max_num_bytes=250
+        )
+        keys = []
+        for i in range(3):
+            src_path = os.path.join(tmp, f"src{i:d}")
+            write(src_path, bytes([i]) * 100)
+            keys.append(build_manifest.hash_file(src_path))
+            build_cache._store(cache, key=keys[-1], src_path=src_path)
+            t = 1e9 + i
+            os.utime(build_cache.path_of_key(cache, keys[-1]), (t, t))
+
+        # use the oldest, so the second oldest is evicted.
+        assert build_cache._fetch(cache, keys[0]) is not None
+        assert build_cache.evict(cache) == 1
+        exists = [
+            os.path.exists(build_cache.path_of_key(cache, key)) for key in keys
+        ]
+        assert exists == [True, False, True]
+
+
+def test_remote_serves_another_local_cache(server_url):
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        alice = build_cache.init(
+            cache_dir=os.path.join(tmp, "alice"), url=server_url
+        )
+        bob = build_cache.init(
+            cache_dir=os.path.join(tmp, "bob"), url=server_url, push=False
+        )
+        key = build_cache.make_key(what="roll out", inputs={"svg": "abc"})
+
+        src_paths = {}
+        for name in ["a.svg", "b.svg"]:
+            src_paths[name] = os.path.join(tmp, name)
+            write(src_paths[name], name.encode() * 1000)
+        build_cache.put(alice, key=key, paths=src_paths, result={"n": 2})
+
+        dst_paths = {n: os.path.join(tmp, "dst", n) for n in src_paths}
+        hit, result = build_cache.get(bob, key=key, paths=dst_paths)
+        assert hit
+        assert result == {"n": 2}
+        for name in src_paths:
+            assert read(dst_paths[name]) == read(src_paths[name])
+        assert os.path.exists(build_cache.path_of_key(bob, key))
+
+
+def test_remote_miss_and_no_push(server_url):
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        bob = build_cache.init(
+            cache_dir=os.path.join(tmp, "bob"), url=server_url, push=False
+        )
+        carol = build_cache.init(
+            cache_dir=os.path.join(tmp, "carol"), url=server_url
+        )
+        key = build_cache.make_key(what="render", inputs={"svg": "abc"})
+        src_path = os.path.join(tmp, "a.jpg")
+        write(src_path, b"jpeg")
+
+        build_cache.put(bob, key=key, paths={"o": src_path})
+        hit, _ = build_cache.get(carol, key=key, paths={"o": src_path})
+        assert not hit
+
+
+def test_unreachable_remote_is_a_miss():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        cache = build_cache.init(
+            cache_dir=os.path.join(tmp, "cache"),
+            url="http://127.0.0.1:9",
+            timeout=1.0,
+        )
+        key = build_cache.make_key(what="render", inputs={"svg": "abc"})
+        with pytest.warns(UserWarning):
+            hit, _ = build_cache.get(
+                cache, key=key, paths={"o": os.path.join(tmp, "o")}
+            )
+        assert not hit
+
+
+def test_remote_blob_which_does_not_match_its_hash_is_a_miss(server_url):
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        alice = build_cache.init(
+            cache_dir=os.path.join(tmp, "alice"), url=server_url
+        )
+        bob = build_cache.init(
+            cache_dir=os.path.join(tmp, "bob"), url=server_url, push=False
+        )
+        key = build_cache.make_key(what="render", inputs={"svg": "abc"})
+        src_path = os.path.join(tmp, "a.jpg")
+        write(src_path, b"jpeg")
+        build_cache.put(alice, key=key, paths={"o": src_path})
+
+        blob_key = build_manifest.hash_file(src_path)
+        write(src_path, b"evil")
+        build_cache._remote_put(alice, key=blob_key, src_path=src_path)
+
+        dst_path = os.path.join(tmp, "dst", "a.jpg")
+        with pytest.warns(UserWarning):
+            hit, _ = build_cache.get(bob, key=key, paths={"o": dst_path})
+        assert not hit
+        assert not os.path.exists(dst_path)
+        assert not os.path.exists(build_cache.path_of_key(bob, blob_key))
+
+
+def test_objects_which_are_local_are_not_put_again():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        cache = build_cache.init(
+            cache_dir=os.path.join(tmp, "cache"),
+            url="http://127.0.0.1:9",
+            timeout=1.0,
+        )
+        key = build_cache.make_key(what="render", inputs={"svg": "abc"})
+        src_path = os.path.join(tmp, "a.jpg")
+        write(src_path, b"jpeg")
+        with pytest.warns(UserWarning):
+            build_cache.put(cache, key=key, paths={"o": src_path})
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            build_cache.put(cache, key=key, paths={"o": src_path})
+
+
+def test_evict_covers_the_dirs_of_other_caches():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        cache = build_cache.init(
+            cache_dir=os.path.join(tmp, "cache"), max_num_bytes=150
+        )
+        src_path = os.path.join(tmp, "src")
+        write(src_path, b"o" * 100)
+        key = build_manifest.hash_file(src_path)
+        build_cache._store(cache, key=key, src_path=src_path)
+
+        fmt_dir = build_cache.path_of_dir(cache, "latex_formats")
+        os.makedirs(fmt_dir)
+        fmt_path = os.path.join(fmt_dir, "a.fmt")
+        write(fmt_path, b"f" * 100)
+        os.utime(fmt_path, (1e9, 1e9))
+
+        assert build_cache.evict(cache) == 1
+        assert not os.path.exists(fmt_path)
+        assert os.path.exists(build_cache.path_of_key(cache, key))
+
+
+class _LoginPage(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"<html>Please log in.</html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_remote_index_which_is_not_an_index_is_a_miss():
+    server = http.server.HTTPServer(("127.0.0.1", 0), _LoginPage)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[0:2]
+    try:
+        with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+            cache = build_cache.init(
+                cache_dir=os.path.join(tmp, "cache"),
+                url=f"http://{host:s}:{port:d}",
+            )
+            key = build_cache.make_key(what="render", inputs={"svg": "abc"})
+            paths = {"o": os.path.join(tmp, "o")}
+            with pytest.warns(UserWarning):
+                hit, _ = build_cache.get(cache, key=key, paths=paths)
+            assert not hit
+            assert not os.path.exists(build_cache.path_of_key(cache, key))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_corrupt_local_index_is_removed():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        cache = build_cache.init(cache_dir=os.path.join(tmp, "cache"))
+        key = build_cache.make_key(what="render", inputs={"svg": "abc"})
+        index_path = build_cache.path_of_key(cache, key)
+        os.makedirs(os.path.dirname(index_path))
+        write(index_path, b"<html>")
+        paths = {"o": os.path.join(tmp, "o")}
+        with pytest.warns(UserWarning):
+            hit, _ = build_cache.get(cache, key=key, paths=paths)
+        assert not hit
+        assert not os.path.exists(index_path)
+
+
+def test_evict_only_after_new_objects():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        cache = build_cache.init(cache_dir=os.path.join(tmp, "cache"))
+        src_path = os.path.join(tmp, "src")
+        write(src_path, b"o" * 100)
+        key = build_manifest.hash_file(src_path)
+        build_cache._store(cache, key=key, src_path=src_path)
+        assert build_cache.evict(cache) == 0
+
+        cache["max_num_bytes"] = 10
+        assert build_cache.evict(cache) == 0
+        assert build_cache._fetch(cache, key) is not None
+        assert build_cache.evict(cache) == 0
+
+        write(src_path, b"p" * 100)
+        build_cache._store(
+            cache, key=build_manifest.hash_file(src_path), src_path=src_path
+        )
+        assert build_cache.evict(cache) == 2
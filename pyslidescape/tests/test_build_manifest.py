@@ -0,0 +1,86 @@
+import pyslidescape
+from pyslidescape import build_manifest
+import os
+import tempfile
+
+
+def test_touch_does_not_change_digest():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "a.txt")
+        with open(path, "wt") as f:
+            f.write("abc")
+
+        manifest = build_manifest.init()
+        digest = build_manifest.file_digest(manifest, path)
+        os.utime(path, (1, 1))
+        assert digest == build_manifest.file_digest(manifest, path)
+
+        with open(path, "wt") as f:
+            f.write("abd")
+        assert digest != build_manifest.file_digest(manifest, path)
+
+
+def test_reason_to_update():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "out.jpg")
+        manifest = build_manifest.init()
+        inputs = {"svg": "123", "resources": "456"}
+
+        reason = build_manifest.reason_to_update(
+            manifest, key="out.jpg", path=path, inputs=inputs
+        )
+        assert reason == "does not exist yet"
+
+        with open(path, "wt") as f:
+            f.write("")
+        reason = build_manifest.reason_to_update(
+            manifest, key="out.jpg", path=path, inputs=inputs
+        )
+        assert reason == "it is not in the manifest"
+
+        build_manifest.record(manifest, key="out.jpg", inputs=inputs)
+        reason = build_manifest.reason_to_update(
+            manifest, key="out.jpg", path=path, inputs=inputs
+        )
+        assert reason is None
+
+        inputs["resources"] = "789"
+        reason = build_manifest.reason_to_update(
+            manifest, key="out.jpg", path=path, inputs=inputs
+        )
+        assert reason == "'resources' changed"
+
+
+def test_read_write():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = build_manifest.path_of_build_dir(tmp)
+        manifest = build_manifest.read(path)
+        build_manifest.record(manifest, key="a", inputs={"b": "c"})
+        build_manifest.write(path, manifest)
+        back = build_manifest.read(path)
+        assert back["outputs"]["a"] == {"b": "c"}
+
+
+def test_write_drops_the_files_which_were_not_looked_at():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        manifest_path = build_manifest.path_of_build_dir(tmp)
+        paths = [os.path.join(tmp, name) for name in ["a.txt", "b.txt"]]
+        for path in paths:
+            with open(path, "wt") as f:
+                f.write(path)
+
+        manifest = build_manifest.init()
+        for path in paths:
+            build_manifest.file_digest(manifest, path)
+        build_manifest.write(manifest_path, manifest)
+        manifest = build_manifest.read(manifest_path)
+        assert len(manifest["files"]) == 2
+
+        build_manifest.file_digest(manifest, paths[0])
+        build_manifest.write(manifest_path, manifest, prune=False)
+        assert len(build_manifest.read(manifest_path)["files"]) == 2
+
+        build_manifest.file_digest(manifest, paths[0])
+        build_manifest.write(manifest_path, manifest)
+        manifest = build_manifest.read(manifest_path)
+        assert list(manifest["files"]) == [os.path.abspath(paths[0])]
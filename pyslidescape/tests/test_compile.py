@@ -0,0 +1,189 @@
+import pyslidescape
+import os
+import PIL.Image
+
+
+def _stat_of_files(path):
+    out = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            p = os.path.join(root, name)
+            out[p] = os.stat(p).st_mtime_ns
+    return out
+
+
+def test_plan_after_resource_edit(tmp_path, fake_inkscape):
+    work_dir = str(tmp_path / "deck")
+    slides = pyslidescape.benchmark.make_deck(
+        work_dir=work_dir,
+        num_slides=2,
+        num_layers=2,
+        num_layer_sets=2,
+        image_num_pixel_edge=32,
+    )
+    pool = pyslidescape.utils.SerialPool()
+    pyslidescape.compile(work_dir=work_dir, pool=pool, verbose=False)
+
+    prediction = pyslidescape.compile(
+        work_dir=work_dir, pool=pool, verbose=False, dry_run=True
+    )
+    assert prediction["jobs"] == []
+
+    pyslidescape.benchmark.edit_resource(work_dir=work_dir, slide=slides[1])
+    before = _stat_of_files(work_dir)
+    prediction = pyslidescape.compile(
+        work_dir=work_dir, pool=pool, verbose=False, dry_run=True
+    )
+    assert _stat_of_files(work_dir) == before
+
+    keys = sorted(job["key"] for job in prediction["jobs"])
+    slide_dir = os.path.join(".build", "slides", slides[1])
+    assert keys == [
+        os.path.join(".build", "slides.pdf"),
+        os.path.join(slide_dir, "layer0,layer1.jpg"),
+        os.path.join(slide_dir, "layer0.jpg"),
+    ]
+
+
+def _proxies_linked_by(svg_path):
+    with open(svg_path, "rt") as f:
+        svg = f.read()
+    return [h for h in svg.split('"') if h.startswith("../../proxies/")]
+
+
+def test_proxy_follows_its_source(tmp_path, fake_inkscape):
+    work_dir = str(tmp_path / "deck")
+    slides = pyslidescape.benchmark.make_deck(
+        work_dir=work_dir,
+        num_slides=1,
+        num_layers=1,
+        num_layer_sets=1,
+        image_num_pixel_edge=256,
+    )
+    pyslidescape.utils.write_dict_to_json(
+        os.path.join(work_dir, ".config.json"),
+        {"slide_format": {"num_pixel_width": 192, "num_pixel_height": 108}},
+    )
+    pool = pyslidescape.utils.SerialPool()
+    svg_path = os.path.join(work_dir, ".build", "slides", slides[0])
+    svg_path = os.path.join(svg_path, "layer0.svg")
+
+    pyslidescape.compile(
+        work_dir=work_dir, pool=pool, verbose=False, proxy_images=True
+    )
+    (before,) = _proxies_linked_by(svg_path)
+    proxy_path = os.path.join(os.path.dirname(svg_path), before)
+    with PIL.Image.open(proxy_path) as proxy:
+        assert proxy.size == (80, 80)
+
+    pyslidescape.benchmark.edit_resource(work_dir=work_dir, slide=slides[0])
+    pyslidescape.compile(
+        work_dir=work_dir, pool=pool, verbose=False, proxy_images=True
+    )
+    (after,) = _proxies_linked_by(svg_path)
+    assert after != before
+
+
+def test_latex_slide_depends_on_the_files_next_to_it(tmp_path):
+    manifest = pyslidescape.build_manifest.init()
+    (tmp_path / "a.slide.tex").write_text("\\includegraphics{logo.png}")
+    (tmp_path / "logo.png").write_bytes(b"1")
+    before = pyslidescape.build_graph._latex_dir_digest(
+        manifest, str(tmp_path)
+    )
+
+    (tmp_path / "a.slide.png").write_bytes(b"rendered")
+    (tmp_path / "a.slide-2.png").write_bytes(b"rendered")
+    assert before == pyslidescape.build_graph._latex_dir_digest(
+        manifest, str(tmp_path)
+    )
+
+    (tmp_path / "logo.png").write_bytes(b"2")
+    assert before != pyslidescape.build_graph._latex_dir_digest(
+        manifest, str(tmp_path)
+    )
+
+
+def test_snippets_of_all_resource_dirs_are_rendered_together(tmp_path):
+    for d in ["resources", os.path.join("slides", "a", "resources")]:
+        os.makedirs(tmp_path / d)
+        (tmp_path / d / "x.snippet.tex").write_text("$x$")
+    nodes, outputs = pyslidescape.build_graph.make_latex_nodes(
+        work_dir=str(tmp_path),
+        todo=[{"slide": "a"}],
+        manifest=pyslidescape.build_manifest.init(),
+        verbose=False,
+    )
+    assert len(nodes) == 1
+    assert len(outputs[nodes[0]["key"]]) == 2
+
+
+def test_latex_slide_from_cache_has_all_its_pages_and_no_more(
+    tmp_path, monkeypatch
+):
+    num_pages = {"n": 70}
+
+    def render_slide_to_png(latex_path, out_path):
+        paths = pyslidescape.latex.slide_page_paths(out_path, num_pages["n"])
+        for path in paths:
+            with open(path, "wb") as f:
+                f.write(path.encode())
+        pyslidescape.latex.remove_stale_pages(out_path, num_pages["n"])
+        return paths
+
+    monkeypatch.setattr(
+        pyslidescape.latex, "render_slide_to_png", render_slide_to_png
+    )
+    dst_path = str(tmp_path / "a.slide.png")
+    cache = pyslidescape.build_cache.init(cache_dir=str(tmp_path / "cache"))
+
+    def run(key):
+        return pyslidescape.build_graph.run_latex_render_job(
+            {
+                "src_path": str(tmp_path / "a.slide.tex"),
+                "dst_path": dst_path,
+                "latex_type": "slide",
+                "cache": cache,
+                "cache_key": key,
+            }
+        )
+
+    assert run("long") == {"cache_hit": False, "num_pages": 70}
+    num_pages["n"] = 2
+    assert run("short") == {"cache_hit": False, "num_pages": 2}
+
+    assert run("long") == {"cache_hit": True, "num_pages": 70}
+    assert os.path.exists(str(tmp_path / "a.slide-70.png"))
+    assert run("short") == {"cache_hit": True, "num_pages": 2}
+    assert os.path.exists(str(tmp_path / "a.slide-2.png"))
+    assert not os.path.exists(str(tmp_path / "a.slide-3.png"))
+
+
+def test_watch_passes_all_its_options_on_to_compile(tmp_path, monkeypatch):
+    work_dir = str(tmp_path / "deck")
+    pyslidescape.benchmark.make_deck(
+        work_dir=work_dir, num_slides=1, num_layers=1, num_layer_sets=1
+    )
+    calls = []
+    monkeypatch.setattr(
+        pyslidescape, "compile", lambda **kwargs: calls.append(kwargs)
+    )
+    pyslidescape.watch(
+        work_dir=work_dir,
+        pool="the pool",
+        verbose=False,
+        composite_layers=True,
+        proxy_images=True,
+        max_num_builds=1,
+        limits={"inkscape": 1},
+        memory_budget_bytes=123,
+    )
+    assert len(calls) == 1
+    kwargs = calls[0]
+    assert kwargs["pool"] == "the pool"
+    assert kwargs["composite_layers"]
+    assert kwargs["proxy_images"]
+    assert kwargs["limits"] == {"inkscape": 1}
+    assert kwargs["memory_budget_bytes"] == 123
+    assert kwargs["out_path"] == os.path.join(work_dir, "slides.pdf")
+    assert "max_num_builds" not in kwargs
@@ -0,0 +1,53 @@
+import pyslidescape
+import PIL.Image
+import io
+import os
+import tempfile
+
+
+def test_alpha_composite_in_order():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        bottom_path = os.path.join(tmp, "bottom.png")
+        top_path = os.path.join(tmp, "top.png")
+        out_path = os.path.join(tmp, "out.png")
+
+        bottom = PIL.Image.new("RGBA", (4, 2), (255, 0, 0, 255))
+        bottom.save(bottom_path)
+
+        top = PIL.Image.new("RGBA", (4, 2), (0, 0, 0, 0))
+        top.putpixel((0, 0), (0, 0, 255, 255))
+        top.save(top_path)
+
+        pyslidescape.composite.alpha_composite_images(
+            paths=[bottom_path, top_path], out_path=out_path
+        )
+        out = PIL.Image.open(out_path)
+        assert out.mode == "RGB"
+        assert out.getpixel((0, 0)) == (0, 0, 255)
+        assert out.getpixel((1, 0)) == (255, 0, 0)
+
+
+def test_alpha_composite_onto_background():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "layer.png")
+        out_path = os.path.join(tmp, "out.png")
+        PIL.Image.new("RGBA", (2, 2), (0, 0, 0, 0)).save(path)
+
+        pyslidescape.composite.alpha_composite_images(
+            paths=[path], out_path=out_path
+        )
+        out = PIL.Image.open(out_path)
+        assert out.getpixel((1, 1)) == (255, 255, 255)
+
+
+def test_flatten_png_from_memory():
+    png = io.BytesIO()
+    PIL.Image.new("RGBA", (2, 2), (0, 0, 0, 0)).save(png, format="PNG")
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        out_path = os.path.join(tmp, "out.jpg")
+        pyslidescape.composite.alpha_composite_images(
+            paths=[io.BytesIO(png.getvalue())], out_path=out_path
+        )
+        out = PIL.Image.open(out_path)
+        assert out.mode == "RGB"
+        assert out.getpixel((1, 1))[0] > 250
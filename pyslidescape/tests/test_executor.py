@@ -0,0 +1,81 @@
+import pyslidescape
+from pyslidescape import scheduler
+import pytest
+import threading
+
+
+def _square(x):
+    return x * x
+
+
+def _fail(x):
+    raise ValueError(x)
+
+
+def test_scheduler_runs_in_threads():
+    nodes = [scheduler.make_node(key="a", func=_square, job=3)]
+    nodes.append(scheduler.make_node(key="b", deps=["a"], func=_square, job=4))
+    with pyslidescape.executor.Executor(num_threads=2) as pool:
+        results = scheduler.run(nodes=nodes, pool=pool)
+    assert results == {"a": 9, "b": 16}
+
+
+def test_cpu_bound_jobs_run_in_processes():
+    nodes = [
+        scheduler.make_node(key="a", func=len, job="abc", cpu_bound=True),
+        scheduler.make_node(key="b", func=_square, job=2),
+    ]
+    with pyslidescape.executor.Executor(
+        num_threads=1, num_processes=1
+    ) as pool:
+        results = scheduler.run(nodes=nodes, pool=pool)
+        assert pool._processes is not None
+    assert results == {"a": 3, "b": 4}
+    assert pool._processes is None
+
+
+def test_no_processes_by_default():
+    nodes = [scheduler.make_node(key="a", func=len, job="abc", cpu_bound=True)]
+    with pyslidescape.executor.Executor(num_threads=2) as pool:
+        assert pool.num_processes == 0
+        results = scheduler.run(nodes=nodes, pool=pool)
+        assert pool._processes is None
+    assert results == {"a": 3}
+
+
+def test_error_of_job_is_raised():
+    nodes = [scheduler.make_node(key="a", func=_fail, job=1)]
+    with pyslidescape.executor.Executor(num_threads=2) as pool:
+        with pytest.raises(ValueError):
+            scheduler.run(nodes=nodes, pool=pool)
+
+
+def test_use_shuts_down_its_own_executor():
+    num_threads = threading.active_count()
+    with pyslidescape.executor.use(pool=None) as pool:
+        assert isinstance(pool, pyslidescape.executor.Executor)
+        pool.apply_async(_square, (2,)).result()
+    assert threading.active_count() == num_threads
+
+    serial = pyslidescape.utils.SerialPool()
+    with pyslidescape.executor.use(pool=serial) as pool:
+        assert pool is serial
+
+
+def test_terminate_drops_the_jobs_which_did_not_start():
+    started = threading.Event()
+    release = threading.Event()
+    ran = []
+
+    def block(x):
+        started.set()
+        release.wait(timeout=10)
+        ran.append(x)
+
+    pool = pyslidescape.executor.Executor(num_threads=1)
+    pool.apply_async(block, args=(1,))
+    pool.apply_async(block, args=(2,))
+    assert started.wait(timeout=10)
+    threading.Timer(0.05, release.set).start()
+    pool.terminate()
+    assert ran == [1]
@@ -0,0 +1,84 @@
+from pyslidescape import file_watch
+import os
+import tempfile
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wt") as f:
+        f.write(text)
+
+
+def test_snapshot_skips_hidden_part_and_ignored():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        write(os.path.join(tmp, "slides.txt"), "a\n")
+        write(os.path.join(tmp, "slides", "a", "layers.txt"), "x\n")
+        write(os.path.join(tmp, ".build", "manifest.json"), "{}")
+        write(os.path.join(tmp, "slides", "a", ".layers.svg.swp"), "")
+        write(os.path.join(tmp, "slides.pdf.part"), "")
+        write(os.path.join(tmp, "slides.pdf"), "")
+
+        snap = file_watch.snapshot(
+            tmp, ignore_paths=[os.path.join(tmp, "slides.pdf")]
+        )
+        assert sorted(snap) == sorted(
+            [os.path.join("slides", "a", "layers.txt"), "slides.txt"]
+        )
+
+
+def test_changed_paths():
+    before = {"a": (1, 1), "b": (2, 2), "c": (3, 3)}
+    after = {"a": (1, 1), "b": (2, 5), "d": (4, 4)}
+    assert file_watch.changed_paths(before, after) == ["b", "c", "d"]
+    assert file_watch.changed_paths(after, after) == []
+
+
+def test_changes_todo():
+    assert file_watch.changes_todo(["slides.txt"])
+    assert file_watch.changes_todo([os.path.join("slides", "a", "layers.txt")])
+    assert not file_watch.changes_todo(
+        [os.path.join("slides", "a", "layers.svg")]
+    )
+
+
+def test_wait_for_changes_after_debounce():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "slides.txt")
+        write(path, "a\n")
+        before = file_watch.snapshot(tmp)
+        write(path, "a\nb\n")
+
+        after, changed = file_watch.wait_for_changes(
+            work_dir=tmp,
+            before=before,
+            ignore_paths=[],
+            poll_interval=0.01,
+            debounce=0.02,
+        )
+        assert changed == ["slides.txt"]
+        assert after == file_watch.snapshot(tmp)
+
+
+def test_snapshot_watches_the_config():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        write(os.path.join(tmp, ".config.json"), "{}")
+        assert sorted(file_watch.snapshot(tmp)) == [".config.json"]
+        assert (
+            file_watch.snapshot(
+                tmp, ignore_paths=[os.path.join(tmp, ".config.json")]
+            )
+            == {}
+        )
+
+
+def test_without():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        write(os.path.join(tmp, "resources", "a.slide.tex"), "x")
+        write(os.path.join(tmp, "resources", "a.slide.png"), "x")
+        snap = file_watch.snapshot(tmp)
+        out = file_watch.without(
+            snap,
+            work_dir=tmp,
+            ignore_paths=[os.path.join(tmp, "resources", "a.slide.png")],
+        )
+        assert sorted(out) == [os.path.join("resources", "a.slide.tex")]
@@ -0,0 +1,323 @@
+import pyslidescape
+from pyslidescape import template
+from xml.dom import minidom
+import base64
+import os
+import tempfile
+
+
+def make_layers_svg(path):
+    content = template.element_join(
+        template.make_inkscape_layer(
+            label="base",
+            content=template.make_text_element(
+                x=0, y=0, text="base", font_size=12
+            ),
+            uid=1,
+        ),
+        template.make_inkscape_layer(
+            label="wait",
+            content=template.make_rect_element(x=0, y=0, dx=1, dy=1),
+            uid=2,
+        ),
+        template.make_inkscape_layer(
+            label="work",
+            content=template.make_text_element(
+                x=0, y=0, text="work", font_size=12
+            ),
+            uid=3,
+        ),
+    )
+    with open(path, "wt") as f:
+        f.write(
+            template.make_slide(
+                slide_format=template.deafault_slide_format(),
+                content=content,
+            )
+        )
+
+
+def read_layer_styles(path):
+    with open(path, "rt") as f:
+        svg = minidom.parse(f)
+    styles = {}
+    for g in svg.getElementsByTagName("g"):
+        styles[g.getAttribute("inkscape:label")] = g.getAttribute("style")
+    return styles
+
+
+def test_layers_in_order_of_document():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "layers.svg")
+        make_layers_svg(path)
+        layers_svg = pyslidescape.inkscape.read_layers_svg(path)
+        assert layers_svg["layers"] == ["base", "wait", "work"]
+
+
+def test_write_many_selections_from_one_read():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "layers.svg")
+        make_layers_svg(path)
+        layers_svg = pyslidescape.inkscape.read_layers_svg(path)
+
+        selections = {
+            "base": ["base"],
+            "base,wait": ["base", "wait"],
+            "base,work": ["base", "work"],
+        }
+        for name in selections:
+            show = set(selections[name])
+            pyslidescape.inkscape.write_layers_svg(
+                layers_svg=layers_svg,
+                dst=os.path.join(tmp, name + ".svg"),
+                show=show,
+                hide=set(layers_svg["layers"]).difference(show),
+            )
+
+        for name in selections:
+            styles = read_layer_styles(os.path.join(tmp, name + ".svg"))
+            for label in layers_svg["layers"]:
+                if label in selections[name]:
+                    assert styles[label] == "display:inline"
+                else:
+                    assert styles[label] == "display:none"
+
+
+def test_all_other_bytes_are_kept():
+    svg = (
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b"<!-- <g inkscape:label='comment'> -->\n"
+        b'<svg xmlns="http://www.w3.org/2000/svg"\n'
+        b'  xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">\n'
+        b'  <g inkscape:label="a" id="layer1" inkscape:style="x"\n'
+        b'     data-note="1 > 0" style="opacity:0.5">\n'
+        b"    <rect width='3' height='4' />\n"
+        b"  </g>\n"
+        b"  <g inkscape:label='b' id='layer2'><![CDATA[ <g> ]]></g>\n"
+        b'  <g inkscape:label="c" id="layer3"/>\n'
+        b"</svg>\n"
+    )
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "layers.svg")
+        with open(path, "wb") as f:
+            f.write(svg)
+        layers_svg = pyslidescape.inkscape.read_layers_svg(path, chunk_size=7)
+        assert layers_svg["layers"] == ["a", "b", "c"]
+
+        out_path = os.path.join(tmp, "out.svg")
+        pyslidescape.inkscape.write_layers_svg(
+            layers_svg=layers_svg,
+            dst=out_path,
+            show=["a", "c"],
+            hide=["b"],
+            chunk_size=5,
+        )
+        with open(out_path, "rb") as f:
+            out = f.read()
+
+        expected = svg.replace(
+            b'style="opacity:0.5"', b'style="display:inline"'
+        )
+        expected = expected.replace(
+            b"id='layer2'>", b"id='layer2' style=\"display:none\">"
+        )
+        expected = expected.replace(
+            b'id="layer3"/>', b'id="layer3" style="display:inline"/>'
+        )
+        assert out == expected
+
+
+def test_hrefs_of_layers():
+    svg = (
+        b'<svg xmlns="http://www.w3.org/2000/svg"\n'
+        b'  xmlns:xlink="http://www.w3.org/1999/xlink"\n'
+        b'  xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">\n'
+        b'  <image xlink:href="../../resources/logo.jpg"/>\n'
+        b'  <g inkscape:label="a" id="layer1">\n'
+        b'    <image xlink:href="resources/a.png"/>\n'
+        b'    <use xlink:href="#local"/>\n'
+        b"  </g>\n"
+        b'  <g inkscape:label="b" id="layer2">\n'
+        b'    <image href="resources/b%20c.svg"/>\n'
+        b'    <image xlink:href="data:image/png;base64,AAAA"/>\n'
+        b"  </g>\n"
+        b"</svg>\n"
+    )
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "layers.svg")
+        with open(path, "wb") as f:
+            f.write(svg)
+        layers_svg = pyslidescape.inkscape.read_layers_svg(path)
+
+        hrefs = pyslidescape.inkscape.find_hrefs_shown(layers_svg, hide=["b"])
+        assert hrefs == ["../../resources/logo.jpg", "resources/a.png"]
+
+        hrefs = pyslidescape.inkscape.find_hrefs_shown(layers_svg, hide=["a"])
+        assert hrefs == ["../../resources/logo.jpg", "resources/b%20c.svg"]
+
+        base_dir = os.path.join("work", ".build", "slides", "s")
+        assert pyslidescape.inkscape.href_to_path(
+            "resources/b%20c.svg", base_dir
+        ) == os.path.join(base_dir, "resources", "b c.svg")
+        assert pyslidescape.inkscape.href_to_path(
+            "../../resources/logo.jpg", base_dir
+        ) == os.path.join("work", ".build", "resources", "logo.jpg")
+        assert (
+            pyslidescape.inkscape.href_to_path("https://a.b/c.png", base_dir)
+            is None
+        )
+
+
+STRIP_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg"
+    xmlns:xlink="http://www.w3.org/1999/xlink"
+    xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">
+  <defs id="defs1">
+    <linearGradient id="stops"><stop offset="0"/></linearGradient>
+    <linearGradient id="of_photo" xlink:href="#stops"/>
+    <linearGradient id="of_base"/>
+    <clipPath id="unused"><rect width="1" height="1"/></clipPath>
+  </defs>
+  <g inkscape:groupmode="layer" id="layer1" inkscape:label="base">
+    <rect id="r1" style="fill:url(#of_base)" width="1" height="1"/>
+    <use xlink:href="#cloned"/>
+  </g>
+  <g inkscape:groupmode="layer" id="layer2" inkscape:label="photo">
+    <image xlink:href="photo.jpg" fill="url(#of_photo)"/>
+    <g inkscape:label="sub"><rect id="r2" width="1" height="1"/></g>
+  </g>
+  <g inkscape:groupmode="layer" id="layer3" inkscape:label="source">
+    <rect id="cloned" width="1" height="1"/>
+  </g>
+  <g inkscape:groupmode="layer" id="layer4" inkscape:label="empty"/>
+</svg>
+"""
+
+
+def test_strip_hidden_layers():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        src = os.path.join(tmp, "layers.svg")
+        dst = os.path.join(tmp, "base.svg")
+        with open(src, "wt") as f:
+            f.write(STRIP_SVG)
+
+        layers_svg = pyslidescape.inkscape.read_layers_svg(path=src)
+        pyslidescape.inkscape.write_layers_svg(
+            layers_svg=layers_svg,
+            dst=dst,
+            hide={"photo", "source", "empty"},
+            show={"base"},
+            strip_hidden=True,
+        )
+        doc = minidom.parse(dst)
+        layers = {
+            g.getAttribute("inkscape:label"): g.getAttribute("style")
+            for g in doc.getElementsByTagName("g")
+        }
+        # The clone in 'base' needs 'source', so it is only hidden.
+        assert layers == {"base": "display:inline", "source": "display:none"}
+        gradients = [
+            e.getAttribute("id")
+            for e in doc.getElementsByTagName("linearGradient")
+        ]
+        assert gradients == ["of_base"]
+        assert len(doc.getElementsByTagName("clipPath")) == 1
+        assert len(doc.getElementsByTagName("image")) == 0
+
+
+def test_strip_nothing_when_all_shown():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        src = os.path.join(tmp, "layers.svg")
+        dst = os.path.join(tmp, "all.svg")
+        with open(src, "wt") as f:
+            f.write(STRIP_SVG)
+
+        layers_svg = pyslidescape.inkscape.read_layers_svg(path=src)
+        pyslidescape.inkscape.write_layers_svg(
+            layers_svg=layers_svg,
+            dst=dst,
+            hide=set(),
+            show=set(layers_svg["layers"]),
+            strip_hidden=True,
+        )
+        doc = minidom.parse(dst)
+        assert len(doc.getElementsByTagName("linearGradient")) == 3
+        assert len(doc.getElementsByTagName("image")) == 1
+
+
+def test_externalize_embedded_images():
+    png = b"\x89PNG\r\n\x1a\nnot really"
+    uri = "data:image/png;base64," + base64.b64encode(png).decode()
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg"\n'
+        '  xmlns:xlink="http://www.w3.org/1999/xlink"\n'
+        '  xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">\n'
+        '  <g inkscape:label="a" id="layer1">\n'
+        f'    <image width="1" xlink:href="{uri:s}" height="1"/>\n'
+        "  </g>\n"
+        '  <g inkscape:label="b" id="layer2">\n'
+        f"    <image xlink:href='{uri:s}'/>\n"
+        "  </g>\n"
+        "</svg>\n"
+    )
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        src = os.path.join(tmp, "layers.svg")
+        with open(src, "wt") as f:
+            f.write(svg)
+        embedded_dir = os.path.join(tmp, ".build", "embedded")
+        dst_dir = os.path.join(tmp, ".build", "slides", "s")
+        os.makedirs(dst_dir)
+
+        scan = pyslidescape.build_graph.roll_out_slide(
+            src_svg_path=src,
+            dst_dir=dst_dir,
+            show_layer_sets=[["a"], ["a", "b"]],
+            embedded_dir=embedded_dir,
+        )
+        assert os.listdir(embedded_dir) == [
+            pyslidescape.build_manifest.hash_bytes(png) + ".png"
+        ]
+        href = "../../embedded/" + os.listdir(embedded_dir)[0]
+        assert scan["embedded"] == [href]
+        assert [href, ["a"]] in scan["hrefs"]
+
+        doc = minidom.parse(os.path.join(dst_dir, "a,b.svg"))
+        images = doc.getElementsByTagName("image")
+        assert [i.getAttribute("xlink:href") for i in images] == [href] * 2
+        assert images[0].getAttribute("height") == "1"
+        with open(os.path.join(dst_dir, href), "rb") as f:
+            assert f.read() == png
+
+
+def test_drawn_size_of_images():
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg"\n'
+        '  xmlns:xlink="http://www.w3.org/1999/xlink"\n'
+        '  xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"\n'
+        '  width="960px" height="540px" viewBox="0 0 960 540">\n'
+        '  <g inkscape:label="a" id="layer1" transform="translate(5,5)">\n'
+        '    <g transform="scale(2) rotate(90)">\n'
+        '      <image width="100" height="50" xlink:href="a.jpg"/>\n'
+        "    </g>\n"
+        '    <image id="cloned" width="10" height="10" xlink:href="b.jpg"/>\n'
+        '    <use xlink:href="#cloned" transform="scale(10)"/>\n'
+        '    <image xlink:href="c.jpg"/>\n'
+        "  </g>\n"
+        '  <defs><pattern id="p"><image width="1" height="1" '
+        'xlink:href="d.jpg"/></pattern></defs>\n'
+        "</svg>\n"
+    )
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "layers.svg")
+        with open(path, "wt") as f:
+            f.write(svg)
+        layers_svg = pyslidescape.inkscape.read_layers_svg(path)
+
+    assert layers_svg["user_width"] == 960.0
+    assert len(layers_svg["images"]) == 1
+    _, href, labels, width, height, aspect = layers_svg["images"][0]
+    assert href == "a.jpg"
+    assert labels == ["a"]
+    assert abs(width - 200.0) < 1e-9
+    assert abs(height - 100.0) < 1e-9
+    assert aspect == "xMidYMid meet"
@@ -0,0 +1,67 @@
+from pyslidescape import inkscape
+import os
+import pytest
+
+SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="64" height="36">'
+    "{text:s}</svg>"
+)
+
+
+def write_svg(path, text=""):
+    path.write_text(SVG.format(text=text))
+    return str(path)
+
+
+def num_starts(log_path):
+    if not log_path.exists():
+        return 0
+    return len(log_path.read_text().splitlines())
+
+
+def test_shell_is_reused(fake_inkscape, tmp_path):
+    svg_path = write_svg(tmp_path / "a.svg")
+    with inkscape.InkscapeShell() as shell:
+        for i in range(3):
+            png_path = str(tmp_path / f"a{i:d}.png")
+            shell.render_png(svg_path=svg_path, png_path=png_path)
+            assert os.path.exists(png_path)
+    assert num_starts(fake_inkscape) == 1
+
+
+def test_shell_is_recycled_after_max_num_renders(fake_inkscape, tmp_path):
+    svg_path = write_svg(tmp_path / "a.svg")
+    with inkscape.InkscapeShell(max_num_renders=2) as shell:
+        for i in range(5):
+            png_path = str(tmp_path / f"a{i:d}.png")
+            shell.render_png(svg_path=svg_path, png_path=png_path)
+            assert os.path.exists(png_path)
+    assert num_starts(fake_inkscape) == 3
+
+
+def test_shell_is_restarted_after_it_died(fake_inkscape, tmp_path):
+    svg_path = write_svg(tmp_path / "a.svg")
+    with inkscape.InkscapeShell() as shell:
+        shell.render_png(svg_path=svg_path, png_path=str(tmp_path / "a.png"))
+        shell.process.kill()
+        shell.process.wait()
+        shell.render_png(svg_path=svg_path, png_path=str(tmp_path / "b.png"))
+        assert os.path.exists(tmp_path / "b.png")
+    assert num_starts(fake_inkscape) == 2
+
+
+def test_svg_which_crashes_the_shell(fake_inkscape, tmp_path):
+    svg_path = write_svg(tmp_path / "a.svg")
+    crash_path = write_svg(tmp_path / "crash.svg", text="<!-- CRASH -->")
+    with inkscape.InkscapeShell() as shell:
+        with pytest.raises(inkscape.InkscapeShellError):
+            shell.render_png(
+                svg_path=crash_path, png_path=str(tmp_path / "crash.png")
+            )
+        assert not os.path.exists(tmp_path / "crash.png")
+        assert num_starts(fake_inkscape) == 2
+
+        shell.render_png(svg_path=svg_path, png_path=str(tmp_path / "a.png"))
+        assert os.path.exists(tmp_path / "a.png")
+        assert shell.is_alive()
+    assert num_starts(fake_inkscape) == 3
@@ -0,0 +1,96 @@
+from pyslidescape import latex
+
+
+def test_snippet_document_has_one_page_per_snippet():
+    doc = latex.make_snippet_document(
+        latex_strings=["$a$", "$b$", "$c$"], fontcolor="white"
+    )
+    body = doc.split("\\begin{document}")[1]
+    assert body.count("\\clearpage") == 2
+    assert body.index("$a$") < body.index("$b$") < body.index("$c$")
+    assert "\\color{white}" in body
+
+
+def test_snippet_document_without_fontcolor():
+    doc = latex.make_snippet_document(latex_strings=["$a$"])
+    assert "\\color" not in doc
+    assert "\\clearpage" not in doc
+
+
+def test_snippet_document_starts_with_the_preamble():
+    for width in [4.0, 6.5]:
+        preamble = latex.make_snippet_preamble(width)
+        doc = latex.make_snippet_document(
+            latex_strings=["$a$"], width_of_the_document_in_inches=width
+        )
+        assert doc.startswith(preamble)
+        assert doc[len(preamble) :].startswith("\\begin{document}")
+
+
+def test_no_format_without_pdflatex(monkeypatch, tmp_path):
+    monkeypatch.setattr(latex, "pdflatex_version", lambda: None)
+    fmt_path = latex.make_format(
+        preamble=latex.make_snippet_preamble(), format_dir=str(tmp_path)
+    )
+    assert fmt_path is None
+
+
+def test_snippet_key_depends_on_content_not_on_location():
+    kwargs = {
+        "latex_string": "$E=mc^2$",
+        "scale": 8.0,
+        "width_of_the_document_in_inches": 6.5,
+        "fontcolor": "white",
+    }
+    key = latex.snippet_key(**kwargs)
+    assert key == latex.snippet_key(**kwargs)
+    for name, other in [
+        ("latex_string", "$E=mc^3$"),
+        ("scale", 4.0),
+        ("width_of_the_document_in_inches", 4.0),
+        ("fontcolor", None),
+    ]:
+        assert key != latex.snippet_key(**dict(kwargs, **{name: other}))
+
+
+def test_snippets_are_taken_from_the_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    key = latex.snippet_key(
+        latex_string="$a$",
+        scale=8.0,
+        width_of_the_document_in_inches=6.5,
+        fontcolor=None,
+    )
+    cache_path = tmp_path / "cache" / key[0:2] / (key + ".svg")
+    cache_path.parent.mkdir(parents=True)
+    cache_path.write_text("<svg/>")
+
+    out_paths = [str(tmp_path / "a.svg"), str(tmp_path / "b.svg")]
+    latex.render_snippets_to_svgs(
+        latex_strings=["$a$", "$a$"],
+        out_paths=out_paths,
+        snippet_cache_dir=cache_dir,
+    )
+    for out_path in out_paths:
+        with open(out_path, "rt") as f:
+            assert f.read() == "<svg/>"
+
+
+def test_slide_page_paths():
+    assert latex.slide_page_paths("a/b.slide.png", 1) == ["a/b.slide.png"]
+    assert latex.slide_page_paths("a/b.slide.png", 3) == [
+        "a/b.slide.png",
+        "a/b.slide-2.png",
+        "a/b.slide-3.png",
+    ]
+
+
+def test_is_output(tmp_path):
+    for name in ["a.slide.tex", "b.snippet.tex"]:
+        (tmp_path / name).write_text("x")
+    assert latex.is_output(str(tmp_path / "a.slide.png"))
+    assert latex.is_output(str(tmp_path / "a.slide-2.png"))
+    assert latex.is_output(str(tmp_path / "b.snippet.svg"))
+    assert not latex.is_output(str(tmp_path / "a.slide.tex"))
+    assert not latex.is_output(str(tmp_path / "c.slide.png"))
+    assert not latex.is_output(str(tmp_path / "logo.png"))
@@ -0,0 +1,86 @@
+import pyslidescape
+from pyslidescape import portable_document_format as pdf
+import PIL.Image
+import os
+import tempfile
+import pytest
+
+
+def make_jpegs(tmp, colors):
+    paths = []
+    for i, color in enumerate(colors):
+        path = os.path.join(tmp, f"{i:03d}.jpg")
+        PIL.Image.new("RGB", (32, 18), color).save(path)
+        paths.append(path)
+    return paths
+
+
+def read_page_widths(path):
+    pikepdf = pytest.importorskip("pikepdf")
+    with pikepdf.open(path) as doc:
+        widths = []
+        for page in doc.pages:
+            image = page.Resources.XObject["/Im0"]
+            widths.append(int(image.Width))
+        return widths
+
+
+def test_only_changed_pages_are_written():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        out_path = os.path.join(tmp, "slides.pdf")
+        paths = make_jpegs(tmp, [(255, 0, 0), (0, 255, 0), (0, 0, 255)])
+
+        stats = pdf.images_to_pdf_incremental(paths, out_path)
+        assert stats["num_pages_written"] == 3
+        size_before = os.stat(out_path).st_size
+
+        stats = pdf.images_to_pdf_incremental(paths, out_path)
+        assert stats["num_pages_written"] == 0
+        assert stats["num_pages_reused"] == 3
+
+        PIL.Image.new("RGB", (64, 18), (9, 9, 9)).save(paths[1])
+        stats = pdf.images_to_pdf_incremental(paths, out_path)
+        assert stats["num_pages_written"] == 1
+        assert stats["num_pages_reused"] == 2
+        assert os.stat(out_path).st_size > size_before
+
+        assert read_page_widths(out_path) == [32, 64, 32]
+
+
+def test_moved_pages_are_reused():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        out_path = os.path.join(tmp, "slides.pdf")
+        paths = make_jpegs(tmp, [(255, 0, 0), (0, 255, 0), (0, 0, 255)])
+        pdf.images_to_pdf_incremental(paths, out_path)
+
+        moved = [paths[2], paths[0], paths[1], paths[0]]
+        stats = pdf.images_to_pdf_incremental(moved, out_path)
+        assert stats["num_pages_written"] == 1
+        assert stats["num_pages_reused"] == 3
+        assert len(read_page_widths(out_path)) == 4
+
+
+def test_write_again_when_map_does_not_fit():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        out_path = os.path.join(tmp, "slides.pdf")
+        paths = make_jpegs(tmp, [(255, 0, 0), (0, 255, 0)])
+        pdf.images_to_pdf_incremental(paths, out_path)
+
+        with open(out_path, "ab") as f:
+            f.write(b"\n")
+        stats = pdf.images_to_pdf_incremental(paths, out_path)
+        assert stats["num_pages_written"] == 2
+        assert len(read_page_widths(out_path)) == 2
+
+
+def test_images_to_pdf_streams_all_pages():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        out_path = os.path.join(tmp, "slides.pdf")
+        colors = [(8 * i, 0, 255 - 8 * i) for i in range(32)]
+        paths = make_jpegs(tmp, colors)
+
+        stats = pdf.images_to_pdf(paths, out_path)
+        assert stats["num_pages_written"] == len(paths)
+        assert 0 < stats["peak_buffer_bytes"] <= 2**20
+        assert not os.path.exists(out_path + ".part")
+        assert read_page_widths(out_path) == [32] * len(paths)
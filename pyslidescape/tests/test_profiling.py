@@ -0,0 +1,79 @@
+from pyslidescape import profiling
+from pyslidescape import scheduler
+from pyslidescape import utils
+import json
+import os
+import pytest
+import subprocess
+import sys
+import tempfile
+
+
+def test_nothing_is_recorded_by_default():
+    assert not profiling.is_recording()
+    with profiling.span(name="a", cat="b"):
+        pass
+    assert profiling.call([sys.executable, "-c", "pass"]) == 0
+
+
+def test_span_and_call():
+    with profiling.record() as events:
+        with profiling.span(name="outer", cat="stage"):
+            rc = profiling.call([sys.executable, "-c", "exit(3)"])
+    assert rc == 3
+    assert [e["cat"] for e in events] == ["subprocess", "stage"]
+    call, outer = events
+    assert call["args"]["returncode"] == 3
+    assert call["args"]["peak_rss_bytes"] > 0
+    assert outer["ts"] <= call["ts"]
+    assert outer["ts"] + outer["dur"] >= call["ts"] + call["dur"]
+
+
+def test_call_without_wait4(monkeypatch):
+    monkeypatch.delattr(os, "wait4", raising=False)
+    with profiling.record() as events:
+        rc = profiling.call([sys.executable, "-c", "exit(3)"])
+    assert rc == 3
+    assert events[0]["args"]["returncode"] == 3
+    assert "peak_rss_bytes" not in events[0]["args"]
+
+
+def square(job):
+    with profiling.span(name="inner", cat="work"):
+        return job * job
+
+
+def test_jobs_are_traced_once_in_a_serial_pool():
+    nodes = [
+        scheduler.make_node(key="a", job=2, func=square, cat="math"),
+        scheduler.make_node(key="b", deps=["a"], job=3, func=square),
+    ]
+    with profiling.record() as events:
+        results = scheduler.run(nodes=nodes, pool=utils.SerialPool())
+    assert results == {"a": 4, "b": 9}
+
+    names = [(e["cat"], e["name"]) for e in events]
+    assert names.count(("math", "a")) == 1
+    assert names.count(("job", "b")) == 1
+    assert names.count(("work", "inner")) == 2
+
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        path = os.path.join(tmp, "trace.json")
+        profiling.write_chrome_trace(path=path, events=events)
+        with open(path, "rt") as f:
+            trace = json.loads(f.read())
+    assert len(trace["traceEvents"]) == len(events) + 1
+
+    summary = profiling.summarize(events)
+    assert summary["work"]["num"] == 2
+
+
+def test_check_output():
+    out = profiling.check_output(
+        [sys.executable, "-c", "import sys; sys.stdout.write('png')"]
+    )
+    assert out == b"png"
+    with profiling.record() as events:
+        with pytest.raises(subprocess.CalledProcessError):
+            profiling.check_output([sys.executable, "-c", "exit(3)"])
+    assert events[0]["args"]["returncode"] == 3
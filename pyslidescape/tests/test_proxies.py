@@ -0,0 +1,45 @@
+import pyslidescape
+import os
+import tempfile
+import PIL.Image
+
+
+def test_proxy_size():
+    proxy_size = pyslidescape.proxies.proxy_size
+    assert proxy_size((4000, 3000), (400, 400)) == (400, 300)
+    assert proxy_size((4000, 3000), (400, 400), "xMidYMid slice") == (
+        534,
+        400,
+    )
+    assert proxy_size((4000, 3000), (400, 400), "none") == (400, 400)
+    assert proxy_size((4000, 3000), (8000, 6000)) is None
+    assert proxy_size((4000, 3000), (8000, 300), "none") == (4000, 300)
+
+
+def test_make_proxy_once():
+    with tempfile.TemporaryDirectory(prefix="pyslidescape-") as tmp:
+        src = os.path.join(tmp, "photo.jpg")
+        PIL.Image.new("RGB", (1600, 1200), (200, 100, 0)).save(src)
+        proxy_dir = os.path.join(tmp, "proxies")
+
+        path = pyslidescape.proxies.make(
+            src_path=src, drawn_size=(200.0, 200.0), proxy_dir=proxy_dir
+        )
+        with PIL.Image.open(path) as proxy:
+            assert proxy.size == (200, 150)
+            assert proxy.format == "JPEG"
+        assert os.listdir(proxy_dir) == [os.path.basename(path)]
+
+        mtime = os.stat(path).st_mtime_ns
+        again = pyslidescape.proxies.make(
+            src_path=src, drawn_size=(200.0, 200.0), proxy_dir=proxy_dir
+        )
+        assert again == path
+        assert os.stat(path).st_mtime_ns == mtime
+
+        assert (
+            pyslidescape.proxies.make(
+                src_path=src, drawn_size=(2000.0, 2000.0), proxy_dir=proxy_dir
+            )
+            is None
+        )
@@ -0,0 +1,240 @@
+import pyslidescape
+from pyslidescape import scheduler
+import pytest
+import sys
+import threading
+import time
+
+
+def append_job(job):
+    return job["name"]
+
+
+def fail_job(job):
+    raise ValueError("failed on purpose")
+
+
+def test_dependencies_run_first():
+    order = []
+    nodes = [
+        scheduler.make_node(
+            key="pdf",
+            deps=["render:a", "render:b"],
+            func=append_job,
+            job={"name": "pdf"},
+            done=order.append,
+        ),
+        scheduler.make_node(
+            key="render:a",
+            deps=["roll_out"],
+            func=append_job,
+            job={"name": "render:a"},
+            done=order.append,
+        ),
+        scheduler.make_node(
+            key="render:b",
+            deps=["roll_out"],
+            func=append_job,
+            job={"name": "render:b"},
+            done=order.append,
+        ),
+        scheduler.make_node(
+            key="roll_out",
+            func=append_job,
+            job={"name": "roll_out"},
+            done=order.append,
+        ),
+    ]
+    pool = pyslidescape.utils.SerialPool()
+    results = scheduler.run(nodes=nodes, pool=pool)
+    assert order == ["roll_out", "render:a", "render:b", "pdf"]
+    assert results["pdf"] == "pdf"
+
+
+def test_nothing_to_do():
+    nodes = [
+        scheduler.make_node(key="a", plan=lambda: None, func=append_job),
+        scheduler.make_node(key="b", deps=["a"], func=append_job, job=None),
+    ]
+    pool = pyslidescape.utils.SerialPool()
+    results = scheduler.run(nodes=nodes, pool=pool)
+    assert results == {"a": None, "b": None}
+
+
+def test_error_stops_dependents():
+    done = []
+    nodes = [
+        scheduler.make_node(key="a", func=fail_job, job={}),
+        scheduler.make_node(
+            key="b",
+            deps=["a"],
+            func=append_job,
+            job={"name": "b"},
+            done=done.append,
+        ),
+    ]
+    pool = pyslidescape.utils.SerialPool()
+    with pytest.raises(ValueError):
+        scheduler.run(nodes=nodes, pool=pool)
+    assert done == []
+
+
+def test_cycle():
+    nodes = [
+        scheduler.make_node(key="a", deps=["b"]),
+        scheduler.make_node(key="b", deps=["a"]),
+    ]
+    pool = pyslidescape.utils.SerialPool()
+    with pytest.raises(AssertionError):
+        scheduler.run(nodes=nodes, pool=pool)
+
+
+_concurrency = {"running": 0, "max": 0}
+_concurrency_lock = threading.Lock()
+
+
+def count_concurrency_job(job):
+    with _concurrency_lock:
+        _concurrency["running"] += 1
+        _concurrency["max"] = max(_concurrency["max"], _concurrency["running"])
+    time.sleep(0.02)
+    with _concurrency_lock:
+        _concurrency["running"] -= 1
+    return job
+
+
+def _run_concurrent_nodes(tool, **kwargs):
+    _concurrency["max"] = 0
+    nodes = [
+        scheduler.make_node(
+            key=f"render:{i:d}",
+            func=count_concurrency_job,
+            job=i,
+            tool=tool,
+        )
+        for i in range(8)
+    ]
+    with pyslidescape.executor.Executor(num_threads=8) as pool:
+        results = scheduler.run(nodes=nodes, pool=pool, **kwargs)
+    assert results == {f"render:{i:d}": i for i in range(8)}
+    return _concurrency["max"]
+
+
+def test_limit_of_tool():
+    assert _run_concurrent_nodes(tool="inkscape", limits={"inkscape": 2}) <= 2
+    assert _run_concurrent_nodes(tool="pillow", limits={"inkscape": 2}) > 2
+
+
+def test_memory_budget():
+    history = pyslidescape.job_history.init()
+    for i in range(8):
+        pyslidescape.job_history.record(
+            history, key=f"render:{i:d}", tool="inkscape", peak_rss_bytes=100
+        )
+    max_concurrency = _run_concurrent_nodes(
+        tool="inkscape", memory_budget_bytes=250, history=history
+    )
+    assert max_concurrency <= 2
+
+
+def call_program_job(job):
+    return pyslidescape.profiling.call([sys.executable, "-c", "pass"])
+
+
+def test_peak_rss_of_programs_is_recorded():
+    history = pyslidescape.job_history.init()
+    nodes = [
+        scheduler.make_node(
+            key="a", func=call_program_job, job={}, tool="python"
+        )
+    ]
+    scheduler.run(
+        nodes=nodes, pool=pyslidescape.utils.SerialPool(), history=history
+    )
+    assert history["jobs"]["a"]["tool"] == "python"
+    assert history["jobs"]["a"]["peak_rss_bytes"] > 0
+
+
+def _history_of_wall_times(wall_times):
+    history = pyslidescape.job_history.init()
+    for key, wall_s in wall_times.items():
+        pyslidescape.job_history.record(
+            history, key=key, tool="inkscape", wall_s=wall_s
+        )
+    return history
+
+
+def test_longest_job_runs_first():
+    history = _history_of_wall_times({"a": 1.0, "b": 5.0, "c": 2.0})
+    order = []
+    nodes = [
+        scheduler.make_node(
+            key=key, func=append_job, job={"name": key}, done=order.append
+        )
+        for key in ["a", "b", "c"]
+    ]
+    scheduler.run(
+        nodes=nodes, pool=pyslidescape.utils.SerialPool(), history=history
+    )
+    assert order == ["b", "c", "a"]
+    assert history["jobs"]["a"]["wall_s"] < 1.0
+
+
+def test_long_job_which_became_ready_late_runs_next():
+    history = _history_of_wall_times({"first": 2.0, "long": 1.0})
+    for i in range(8):
+        pyslidescape.job_history.record(
+            history, key=f"short:{i:d}", tool="inkscape", wall_s=0.01
+        )
+    order = []
+    nodes = [
+        scheduler.make_node(
+            key="first", func=append_job, job={"name": "first"}
+        ),
+        scheduler.make_node(
+            key="long",
+            deps=["first"],
+            func=append_job,
+            job={"name": "long"},
+            done=order.append,
+        ),
+    ]
+    for i in range(8):
+        nodes.append(
+            scheduler.make_node(
+                key=f"short:{i:d}",
+                func=append_job,
+                job={"name": f"short:{i:d}"},
+                done=order.append,
+            )
+        )
+    with pyslidescape.executor.Executor(
+        num_threads=1, num_processes=0
+    ) as pool:
+        scheduler.run(nodes=nodes, pool=pool, history=history)
+    assert order[0] == "long"
+
+
+def test_predict():
+    history = _history_of_wall_times({"a": 1.0, "b": 5.0, "c": 2.0, "d": 3.0})
+    nodes = [
+        scheduler.make_node(key=key, func=append_job, job={"name": key})
+        for key in ["a", "b", "c"]
+    ]
+    nodes.append(
+        scheduler.make_node(
+            key="d", deps=["a"], func=append_job, job={"name": "d"}
+        )
+    )
+    nodes.append(
+        scheduler.make_node(
+            key="up to date", func=append_job, job=None, tool="inkscape"
+        )
+    )
+    prediction = scheduler.predict(nodes=nodes, num_workers=2, history=history)
+    starts = {job["key"]: job["start_s"] for job in prediction["jobs"]}
+    assert starts == {"b": 0.0, "c": 0.0, "a": 2.0, "d": 3.0}
+    assert prediction["wall_s"] == 6.0
+
+    prediction = scheduler.predict(nodes=nodes, num_workers=4, history=history)
+    assert prediction["wall_s"] == 5.0
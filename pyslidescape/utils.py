@@ -4,16 +4,44 @@ import pathlib
 import multiprocessing
 import shutil
 import json
+import sys
 from . import layers_txt
+from . import build_manifest
 
 
 class SerialPool:
     def __init__(self):
         pass
 
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        pass
+
     def map(self, func, iterable):
         return [func(item) for item in iterable]
 
+    def apply_async(self, func, args=(), callback=None, error_callback=None):
+        try:
+            result = func(*args)
+        except Exception as err:
+            if error_callback is None:
+                raise
+            error_callback(err)
+        else:
+            if callback is not None:
+                callback(result)
+
 
 def init_multiprocessing_pool(num_threads=1):
     """
@@ -32,7 +60,7 @@ def init_multiprocessing_pool_if_None(pool):
     if pool is None:
         total_count = multiprocessing.cpu_count()
         count = max([1, total_count // 4])
-        return multiprocessing_pool(count)
+        return init_multiprocessing_pool(count)
     else:
         return pool
 
@@ -58,7 +86,7 @@ def glob(path, pattern):
     return out
 
 
-def copytree_lazy(src, dst, verbose=False):
+def copytree_lazy(src, dst, verbose=False, manifest=None):
     updates = False
     if os.path.isdir(src):
         os.makedirs(dst, exist_ok=True)
@@ -68,28 +96,43 @@ def copytree_lazy(src, dst, verbose=False):
 
             if os.path.isdir(src_path):
                 _update = copytree_lazy(
-                    src=src_path, dst=dst_path, verbose=verbose
+                    src=src_path,
+                    dst=dst_path,
+                    verbose=verbose,
+                    manifest=manifest,
                 )
             else:
                 _update = copy_lazy(
-                    src=src_path, dst=dst_path, verbose=verbose
+                    src=src_path,
+                    dst=dst_path,
+                    verbose=verbose,
+                    manifest=manifest,
                 )
 
             if _update:
                 updates = True
         return updates
     else:
-        return copy_lazy(src=src, dst=dst, verbose=verbose)
+        return copy_lazy(src=src, dst=dst, verbose=verbose, manifest=manifest)
+
 
+def copy_lazy(src, dst, verbose=False, manifest=None):
+    """
+    Copies `src` to `dst` only when the content of the two differs.
+    When a build `manifest` is given, the content hashes are memorized in it.
+    """
+    if manifest is None:
+        manifest = build_manifest.init()
 
-def copy_lazy(src, dst, verbose=False):
     need_to_copy = False
     if not os.path.exists(dst):
         need_to_copy = True
+    elif os.stat(src).st_size != os.stat(dst).st_size:
+        need_to_copy = True
     else:
-        src_mtime = mtime(src)
-        dst_mtime = mtime(dst)
-        if dst_mtime < src_mtime:
+        src_digest = build_manifest.file_digest(manifest=manifest, path=src)
+        dst_digest = build_manifest.file_digest(manifest=manifest, path=dst)
+        if src_digest != dst_digest:
             need_to_copy = True
 
     if need_to_copy:
@@ -137,10 +180,32 @@ def mtime(path):
     return os.stat(path).st_mtime
 
 
-def write_dict_to_json(path, d):
+def peak_rss_bytes():
+    """
+    Returns the peak resident memory of this process so far, or 0 where
+    the module 'resource' does not exist, e.g. on Windows.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return maxrss_to_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def maxrss_to_bytes(maxrss):
+    """
+    The ru_maxrss of getrusage() and wait4() is in bytes on macOS and in
+    kilo bytes elsewhere.
+    """
+    if sys.platform == "darwin":
+        return maxrss
+    return 1024 * maxrss
+
+
+def write_dict_to_json(path, d, indent=4, sort_keys=False):
     tmp_path = path + ".part"
     with open(tmp_path, "wt") as f:
-        f.write(json.dumps(d, indent=4))
+        f.write(json.dumps(d, indent=indent, sort_keys=sort_keys))
     os.rename(tmp_path, path)
 
 